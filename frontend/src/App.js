@@ -7,6 +7,14 @@ import "./styles.css";
 function App() {
   const mapRef = useRef(null);
   const markerRef = useRef(null);
+  const jobIdRef = useRef(null); // Backend optimization job for this client
+  const cursorRef = useRef(0); // Last route event version received from the backend
+  const streamRef = useRef(null); // EventSource for the job's route events
+  const liveDataRef = useRef({
+    status: "idle",
+    final_route: [],
+    alternative_routes: [],
+  });
   const routeControlRef = useRef(null);
   const [routeData, setRouteData] = useState({
     status: "idle",
@@ -30,7 +38,6 @@ function App() {
 
   const CONFIG = {
     API_BASE_URL: "http://localhost:5000",
-    POLLING_INTERVAL: 500,
     WAIT_TIME_MS: 3000,
     PROXIMITY_THRESHOLD: 0.01,
   };
@@ -88,15 +95,93 @@ function App() {
     setNotification(null); // Reset notification
   };
 
-  useEffect(() => {
-    resetApp();
+  const applyEvents = (data, events) => {
+    return events.reduce((current, event) => {
+      switch (event.type) {
+        case "status":
+          return { ...current, ...event.data };
+        case "final_route":
+          return {
+            ...current,
+            final_route: current.final_route
+              .slice(0, event.data.start_index)
+              .concat(event.data.nodes),
+          };
+        case "alternatives":
+          return {
+            ...current,
+            alternative_routes: [...current.alternative_routes, event.data],
+          };
+        default:
+          return current;
+      }
+    }, data);
+  };
+
+  const closeStream = () => {
+    if (streamRef.current) {
+      streamRef.current.close();
+      streamRef.current = null;
+    }
+  };
+
+  const openStream = (jobId) => {
+    closeStream();
+    // On reconnect the browser sends Last-Event-ID, so the server resumes after it.
+    const stream = new EventSource(
+      `${CONFIG.API_BASE_URL}/stream/${jobId}?since=${cursorRef.current}`
+    );
+    const onEvent = (type) => (message) => {
+      if (streamRef.current !== stream) return;
+      // Apply only the change carried by the event to the local copy.
+      const data = applyEvents(liveDataRef.current, [
+        { type, data: JSON.parse(message.data) },
+      ]);
+      liveDataRef.current = data;
+      cursorRef.current = Number(message.lastEventId) || cursorRef.current;
+      setRouteData(data);
+      setStatus(data.status);
+      // The server ends the stream once the job is done; do not reconnect.
+      if (data.status !== "queued" && data.status !== "running") closeStream();
+    };
+    ["status", "final_route", "alternatives"].forEach((type) =>
+      stream.addEventListener(type, onEvent(type))
+    );
+    stream.onerror = () => {
+      // EventSource reconnects by itself unless the connection was refused.
+      if (
+        streamRef.current === stream &&
+        stream.readyState === EventSource.CLOSED
+      ) {
+        setError("Lost connection to the route event stream");
+      }
+    };
+    streamRef.current = stream;
+  };
+
+  const resetJob = () => {
+    closeStream();
+    const jobId = jobIdRef.current;
+    jobIdRef.current = null;
+    cursorRef.current = 0;
+    liveDataRef.current = {
+      status: "idle",
+      final_route: [],
+      alternative_routes: [],
+    };
+    if (!jobId) return;
     axios
-      .get(`${CONFIG.API_BASE_URL}/reset`)
+      .get(`${CONFIG.API_BASE_URL}/reset/${jobId}`)
       .then((response) =>
         console.log("Backend reset confirmed:", response.data)
       )
       .catch((err) => console.error("Failed to confirm backend reset:", err));
+  };
+
+  useEffect(() => {
+    resetApp();
     return () => {
+      resetJob();
       resetApp();
     };
   }, []);
@@ -133,7 +218,9 @@ function App() {
         destination,
         preferences,
       });
+      jobIdRef.current = response.data.job_id;
       setStatus(response.data.status);
+      openStream(response.data.job_id);
       setCurrentPosition(
         getCoordinatesFromPlace(source) || [16.4543715, 80.5250379]
       );
@@ -145,59 +232,30 @@ function App() {
   };
 
   useEffect(() => {
-    let isMounted = true;
-    const pollStatus = async () => {
-      try {
-        const response = await axios.get(`${CONFIG.API_BASE_URL}/status`);
-        if (!isMounted) return;
-
-        setRouteData(response.data);
-        setStatus(response.data.status);
-
-        if (
-          response.data.status === "running" &&
-          response.data.final_route.length > currentNodeIndex + 1 &&
-          !isAnimating
-        ) {
-          const startNode = response.data.final_route[currentNodeIndex];
-          const nextNode = response.data.final_route[currentNodeIndex + 1];
-          console.log(`Polling detected new node: ${startNode} -> ${nextNode}`);
-          setIsAnimating(true);
-          await updateRoute(
-            startNode,
-            nextNode,
-            response.data.final_route,
-            response.data.alternative_routes
-          );
-          setCurrentNodeIndex((prev) => prev + 1);
-          setIsAnimating(false);
-        }
-
-        if (response.data.status === "completed" && !isAnimating) {
-          console.log("Showing final route");
-          showFinalRoute(
-            response.data.final_route,
-            response.data.alternative_routes
-          );
-        }
-      } catch (error) {
-        if (isMounted) setError(`Error polling status: ${error.message}`);
-      }
-    };
-
-    const intervalId = setInterval(pollStatus, CONFIG.POLLING_INTERVAL);
-    if (routeData.status === "completed" || error) clearInterval(intervalId);
-    return () => {
-      isMounted = false;
-      clearInterval(intervalId);
-    };
-  }, [
-    routeData.status,
-    routeData.final_route.length,
-    error,
-    isAnimating,
-    currentNodeIndex,
-  ]);
+    if (isAnimating) return;
+    const data = routeData;
+    if (
+      data.status === "running" &&
+      data.final_route.length > currentNodeIndex + 1
+    ) {
+      const startNode = data.final_route[currentNodeIndex];
+      const nextNode = data.final_route[currentNodeIndex + 1];
+      console.log(`Stream delivered new node: ${startNode} -> ${nextNode}`);
+      setIsAnimating(true);
+      updateRoute(
+        startNode,
+        nextNode,
+        data.final_route,
+        data.alternative_routes
+      ).then(() => {
+        setCurrentNodeIndex((prev) => prev + 1);
+        setIsAnimating(false);
+      });
+    } else if (data.status === "completed") {
+      console.log("Showing final route");
+      showFinalRoute(data.final_route, data.alternative_routes);
+    }
+  }, [routeData, isAnimating, currentNodeIndex]);
 
   const updateRoute = async (startNode, nextNode, fullRoute, altRoutes) => {
     const startLatLng = getCoordinates(startNode);
@@ -325,8 +383,10 @@ function App() {
             setTimeout(() => setNotification(null), 2000); // Clear after 2 seconds
 
             axios
-              .post(`${CONFIG.API_BASE_URL}/marker-close`, {
+              .post(`${CONFIG.API_BASE_URL}/marker-close/${jobIdRef.current}`, {
                 node: targetLatLng.toString(),
+                // "lat,lng" of the marker, checked by the backend for deviations from the route.
+                position: `${newPosition[0]},${newPosition[1]}`,
               })
               .then((response) => {
                 console.log(
@@ -355,6 +415,7 @@ function App() {
 
   const handleSubmit = (e) => {
     e.preventDefault();
+    resetJob();
     resetApp();
     const sourceCoords = getCoordinatesFromPlace(source) || [
       16.4543715, 80.5250379,
@@ -0,0 +1,204 @@
+# route_optimizer/api_clients/cache.py
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from metrics import CACHE_HITS, CACHE_MISSES
+
+logger = logging.getLogger(__name__)
+
+# Seconds each data type stays valid; None never expires.
+DEFAULT_TTLS = {
+    "elevation": None,
+    "geocode": None,
+    "weather": 600,
+    "aqi": 1800,
+    "traffic": 120,
+}
+
+# Grid cell size in degrees used to bucket coordinates (0.001 deg ~ 110 m).
+DEFAULT_GRID_SIZES = {
+    "elevation": 0.0005,
+    "weather": 0.01,
+    "aqi": 0.01,
+    "traffic": 0.0005,
+}
+DEFAULT_GRID_SIZE = 0.001
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with a per-namespace TTL, shared by the api_clients.
+    Keys are (namespace, key) pairs; coordinates should go through spatial_key
+    so that points a few metres apart share one entry.
+    """
+
+    def __init__(self, max_size: int = 10000, ttls: Dict[str, Optional[float]] = None,
+                 grid_sizes: Dict[str, float] = None):
+        self.max_size = max_size
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.grid_sizes = dict(DEFAULT_GRID_SIZES, **(grid_sizes or {}))
+        self._entries: "OrderedDict[Tuple[str, Hashable], Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+
+    def get(self, namespace: str, key: Hashable) -> Any:
+        """
+        Returns the cached value, or None on a miss or an expired entry.
+        """
+        full_key = (namespace, key)
+        with self._lock:
+            entry = self._entries.get(full_key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(full_key)
+                    self.hits[namespace] = self.hits.get(namespace, 0) + 1
+                    CACHE_HITS.inc(namespace=namespace)
+                    return value
+                del self._entries[full_key]
+            self.misses[namespace] = self.misses.get(namespace, 0) + 1
+            CACHE_MISSES.inc(namespace=namespace)
+            return None
+
+    def set(self, namespace: str, key: Hashable, value: Any) -> None:
+        if value is None or self.max_size <= 0:
+            return
+        ttl = self.ttls.get(namespace)
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        full_key = (namespace, key)
+        with self._lock:
+            self._entries[full_key] = (value, expires_at)
+            self._entries.move_to_end(full_key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def spatial_key(self, namespace: str, lat: float, lon: float) -> Tuple[int, int]:
+        """
+        Quantizes a coordinate to the namespace's grid cell.
+        """
+        grid = self.grid_sizes.get(namespace, DEFAULT_GRID_SIZE)
+        return (round(lat / grid), round(lon / grid))
+
+    def location_key(self, namespace: str, location: str) -> Hashable:
+        """
+        Key for a "lat,lng" string or a place name as accepted by the Maps APIs.
+        """
+        parts = location.split(",")
+        if len(parts) == 2:
+            try:
+                return self.spatial_key(namespace, float(parts[0]), float(parts[1]))
+            except ValueError:
+                pass
+        return location.strip().lower()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits.clear()
+            self.misses.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the current size and hit/miss counters per namespace.
+        """
+        with self._lock:
+            return {"size": len(self._entries), "hits": dict(self.hits), "misses": dict(self.misses)}
+
+
+class NullCache(TTLCache):
+    """Cache that stores nothing; pass it to a client to disable caching."""
+
+    def __init__(self):
+        super().__init__(max_size=0)
+
+
+class PersistentCache:
+    """
+    Bounded LRU map of string keys to JSON values that never expire, written
+    through to a JSON file so lookups survive restarts. Used for geocodes,
+    which are few, stable and slow to fetch. path=None keeps it in memory.
+    """
+
+    def __init__(self, path: Optional[str] = None, namespace: str = "geocode", max_size: int = 5000):
+        self.path = path
+        self.namespace = namespace
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.load()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                CACHE_HITS.inc(namespace=self.namespace)
+                return self._entries[key]
+        CACHE_MISSES.inc(namespace=self.namespace)
+        return None
+
+    def set(self, key: str, value: Any) -> None:
+        if value is None or self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._save()
+
+    def load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable {self.namespace} cache {self.path}: {e}")
+            return
+        with self._lock:
+            self._entries = OrderedDict(list(entries.items())[-self.max_size:])
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump(self._entries, f)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write {self.namespace} cache {self.path}: {e}")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class BoundedDict(OrderedDict):
+    """
+    Dict that drops its oldest entries once it holds more than max_size.
+    For memo tables (e.g. parsed node coordinates) whose entries are cheap
+    to recompute; reads do not refresh an entry and there is no locking.
+    """
+
+    def __init__(self, max_size: int):
+        super().__init__()
+        self.max_size = max_size
+
+    def __setitem__(self, key, value) -> None:
+        super().__setitem__(key, value)
+        while len(self) > self.max_size:
+            self.popitem(last=False)
+
+
+# Shared by every client unless one is given a cache explicitly.
+default_cache = TTLCache()
+default_geocode_cache = PersistentCache(os.getenv(
+    "GEOCODE_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "geocode.json")))
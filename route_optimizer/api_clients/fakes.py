@@ -0,0 +1,312 @@
+# route_optimizer/api_clients/fakes.py
+"""
+Offline stand-ins for the provider APIs.
+
+FakeTransport replaces the network layer of HttpTransport, so the real
+clients (caching, parsing, retries, rate limiting) run unchanged against
+either recorded fixtures or a deterministic SyntheticWorld. Latency and
+errors can be injected per request. RecordingTransport captures live
+responses into a fixture file for later offline runs.
+"""
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+import requests
+
+from api_clients.cache import PersistentCache, TTLCache
+from api_clients.polyline import encode_polyline
+from api_clients.singleflight import SingleFlight
+from api_clients.transport import DEFAULT_RATE_LIMITS, HttpTransport
+
+WEATHER_CONDITIONS = ["Sunny", "Clear", "Partly cloudy", "Cloudy", "Light rain", "Rain", "Mist"]
+
+
+class FakeResponse:
+    """Minimal requests.Response look-alike returned by FakeTransport."""
+
+    def __init__(self, status_code: int, data: Optional[dict], headers: Dict[str, str] = None):
+        self.status_code = status_code
+        self._data = data
+        self.headers = headers or {}
+
+    def json(self) -> dict:
+        if self._data is None:
+            raise ValueError("No JSON body")
+        return self._data
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error", response=self)
+
+
+def fixture_key(provider: str, params: dict = None, payload: dict = None) -> str:
+    """Stable key for a request, ignoring the API key."""
+    params = {k: v for k, v in (params or {}).items() if k != "key"}
+    return json.dumps([provider, params, payload or {}], sort_keys=True)
+
+
+def _unit(*parts) -> float:
+    """Deterministic pseudo-random value in [0, 1) derived from parts."""
+    digest = hashlib.sha256(repr(parts).encode()).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64
+
+
+def _haversine(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (*a, *b))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(h))
+
+
+class SyntheticWorld:
+    """
+    Deterministic, smoothly varying provider data for any coordinates.
+    Args:
+        alternatives: Routes returned when alternatives are requested (at most len(ROAD_POLICIES)).
+        steps: Directions steps per route.
+        seed: Changes every generated value.
+    """
+
+    GRID = 0.005  # Roads run through the points of this lattice (in degrees)
+    # How each alternative moves to the next lattice point: "diagonal" first
+    # (until level with the destination in one axis), "lat" first, "lng" first,
+    # or "straight" along the longer axis first. The next point depends only on
+    # the current one and the destination, so a reroute from a point on a route
+    # follows the rest of that route, as a real road network would.
+    ROAD_POLICIES = ("diagonal", "lat", "lng", "straight")
+
+    def __init__(self, alternatives: int = 3, steps: int = 12, seed: int = 0):
+        self.alternatives = alternatives
+        self.steps = steps
+        self.seed = seed
+
+    def respond(self, provider: str, params: dict, payload: dict = None) -> dict:
+        if provider == "directions":
+            return self.directions(params)
+        if provider == "geocode":
+            return self.geocode(params["address"])
+        if provider == "elevation":
+            points = [tuple(map(float, p.split(","))) for p in params["locations"].split("|")]
+            return {"status": "OK", "results": [{"elevation": self.elevation(p)} for p in points]}
+        if provider == "weather":
+            lat, lon = map(float, params["q"].split(","))
+            return self.weather(lat, lon)
+        if provider == "aqi":
+            location = payload["location"]
+            return {"indexes": [{"aqi": self.aqi(location["latitude"], location["longitude"])}]}
+        raise ValueError(f"Unknown provider: {provider}")
+
+    def location(self, value: str) -> Tuple[float, float]:
+        parts = value.split(",")
+        if len(parts) == 2:
+            try:
+                return float(parts[0]), float(parts[1])
+            except ValueError:
+                pass
+        return self.place(value)
+
+    def place(self, name: str) -> Tuple[float, float]:
+        # Places land in a 2 x 2 degree box so that any two are drivable.
+        key = name.strip().lower()
+        return 10.0 + 2 * _unit(self.seed, "lat", key), 77.0 + 2 * _unit(self.seed, "lng", key)
+
+    def geocode(self, address: str) -> dict:
+        lat, lng = self.place(address)
+        return {"status": "OK", "results": [{"geometry": {"location": {"lat": lat, "lng": lng}}}]}
+
+    def elevation(self, point: Tuple[float, float]) -> float:
+        lat, lng = point
+        return 300 + 150 * math.sin(lat * 40 + self.seed) * math.cos(lng * 35)
+
+    def weather(self, lat: float, lon: float) -> dict:
+        tile = (round(lat, 1), round(lon, 1))
+        condition = WEATHER_CONDITIONS[int(_unit(self.seed, "weather", tile) * len(WEATHER_CONDITIONS))]
+        wind_kph = 40 * _unit(self.seed, "wind", tile)
+        return {"current": {"condition": {"text": condition}, "wind_kph": wind_kph}}
+
+    def aqi(self, lat: float, lon: float) -> int:
+        return int(20 + 180 * _unit(self.seed, "aqi", (round(lat, 1), round(lon, 1))))
+
+    def congestion(self, start: Tuple[float, float], end: Tuple[float, float]) -> float:
+        return 1 + 0.8 * _unit(self.seed, "traffic", round(start[0], 3), round(start[1], 3),
+                               round(end[0], 3), round(end[1], 3))
+
+    def directions(self, params: dict) -> dict:
+        origin = self.location(params["origin"])
+        destination = self.location(params["destination"])
+        count = min(self.alternatives, len(self.ROAD_POLICIES)) if params.get("alternatives") == "true" else 1
+        routes = [self.route(origin, destination, i, params.get("departure_time") == "now") for i in range(count)]
+        return {"status": "OK", "routes": routes}
+
+    def road(self, origin: Tuple[float, float], destination: Tuple[float, float], policy: str) -> list:
+        """Lattice points of the road from origin to destination, both included."""
+        cell = (round(origin[0] / self.GRID), round(origin[1] / self.GRID))
+        goal = (round(destination[0] / self.GRID), round(destination[1] / self.GRID))
+        points = [origin]
+        while cell != goal:
+            dlat, dlng = goal[0] - cell[0], goal[1] - cell[1]
+            step_lat, step_lng = (dlat > 0) - (dlat < 0), (dlng > 0) - (dlng < 0)
+            if policy == "lat" and step_lat:
+                step_lng = 0
+            elif policy == "lng" and step_lng:
+                step_lat = 0
+            elif policy == "straight" and abs(dlat) != abs(dlng):
+                if abs(dlat) > abs(dlng):
+                    step_lng = 0
+                else:
+                    step_lat = 0
+            cell = (cell[0] + step_lat, cell[1] + step_lng)
+            points.append((round(cell[0] * self.GRID, 6), round(cell[1] * self.GRID, 6)))
+        if points[-1] != destination:
+            points.append(destination)
+        return points
+
+    def route(self, origin: Tuple[float, float], destination: Tuple[float, float],
+              variant: int, with_traffic: bool) -> dict:
+        road = self.road(origin, destination, self.ROAD_POLICIES[variant])
+        # Consecutive runs of the road's points make the steps; each shares its first point with the previous step.
+        bounds = sorted({round(k * (len(road) - 1) / self.steps) for k in range(self.steps + 1)})
+        steps = []
+        distance_total = duration_total = traffic_total = 0
+        for first, last in zip(bounds, bounds[1:]):
+            points = road[first:last + 1]
+            previous, point = points[0], points[-1]
+            distance = int(sum(_haversine(a, b) for a, b in zip(points, points[1:])) * 1.1 * 1000)
+            speed = 40 + 50 * _unit(self.seed, "speed", round(point[0], 3), round(point[1], 3))
+            duration = int(distance / 1000 / speed * 3600)
+            steps.append({
+                "start_location": {"lat": previous[0], "lng": previous[1]},
+                "end_location": {"lat": point[0], "lng": point[1]},
+                "distance": {"value": distance},
+                "duration": {"value": duration},
+                "polyline": {"points": encode_polyline(points)},
+            })
+            distance_total += distance
+            duration_total += duration
+            traffic_total += int(duration * self.congestion(previous, point))
+        leg = {"steps": steps, "distance": {"value": distance_total}, "duration": {"value": duration_total}}
+        if with_traffic:
+            leg["duration_in_traffic"] = {"value": traffic_total}
+        overview = [origin] + [(step["end_location"]["lat"], step["end_location"]["lng"]) for step in steps]
+        return {"legs": [leg], "overview_polyline": {"points": encode_polyline(overview)}}
+
+
+class FakeTransport(HttpTransport):
+    """
+    HttpTransport that answers from fixtures or a SyntheticWorld instead of
+    the network, counting calls per provider.
+    Args:
+        world: Synthetic data source for requests not found in fixtures.
+        fixtures: Path to a JSON fixture file written by RecordingTransport.
+        latency: Seconds added to every request (a (min, max) tuple draws uniformly).
+        error_rate: Fraction of requests answered with HTTP 503.
+        seed: Seed for latency and error draws.
+    """
+
+    def __init__(self, world: SyntheticWorld = None, fixtures: str = None, latency=0.0,
+                 error_rate: float = 0.0, seed: int = 0, **kwargs):
+        kwargs.setdefault("backoff", 0.01)
+        kwargs.setdefault("rate_limits", {provider: None for provider in DEFAULT_RATE_LIMITS})
+        super().__init__(**kwargs)
+        self.world = world or SyntheticWorld()
+        self.fixtures = {}
+        if fixtures:
+            with open(fixtures) as f:
+                self.fixtures = json.load(f)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.errors = Counter()
+        self._lock = threading.Lock()
+
+    def _send(self, provider: str, method: str, url: str, **kwargs) -> FakeResponse:
+        delay, status, data = self._respond(provider, kwargs.get("params"), kwargs.get("json"))
+        time.sleep(delay)
+        return FakeResponse(status, data)
+
+    async def _send_async(self, session, provider: str, method: str, url: str, **kwargs):
+        delay, status, data = self._respond(provider, kwargs.get("params"), kwargs.get("json"))
+        await asyncio.sleep(delay)
+        return status, None, data
+
+    def _respond(self, provider: str, params: dict, payload: dict):
+        with self._lock:
+            self.calls[provider] += 1
+            latency = self.latency
+            delay = self.random.uniform(*latency) if isinstance(latency, tuple) else latency
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.errors[provider] += 1
+        if failed:
+            return delay, 503, {"error": "injected failure"}
+        key = fixture_key(provider, params, payload)
+        if key in self.fixtures:
+            return delay, self.fixtures[key]["status"], self.fixtures[key]["data"]
+        return delay, 200, self.world.respond(provider, params or {}, payload)
+
+
+class RecordingTransport(HttpTransport):
+    """
+    Live HttpTransport that remembers every response so it can be saved as
+    a fixture file for FakeTransport.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.recorded = {}
+        self._lock = threading.Lock()
+
+    def _send(self, provider: str, method: str, url: str, **kwargs):
+        response = super()._send(provider, method, url, **kwargs)
+        try:
+            data = response.json()
+        except ValueError:
+            data = None
+        with self._lock:
+            self.recorded[fixture_key(provider, kwargs.get("params"), kwargs.get("json"))] = {
+                "status": response.status_code, "data": data}
+        return response
+
+    async def _send_async(self, session, provider: str, method: str, url: str, **kwargs):
+        status, retry_after, data = await super()._send_async(session, provider, method, url, **kwargs)
+        with self._lock:
+            self.recorded[fixture_key(provider, kwargs.get("params"), kwargs.get("json"))] = {
+                "status": status, "data": data}
+        return status, retry_after, data
+
+    def save(self, path: str) -> None:
+        with self._lock:
+            with open(path, "w") as f:
+                json.dump(self.recorded, f, indent=1, sort_keys=True)
+
+
+def fake_clients(transport: HttpTransport, cache: TTLCache = None) -> dict:
+    """
+    Builds the four api_clients on the given transport, a private in-memory
+    cache (geocodes are not written to disk) and private request coalescing,
+    ready to pass to RouteGraph(**fake_clients(...)).
+    """
+    # Import here so the key check in GoogleElevationClient sees the placeholder.
+    os.environ.setdefault("GOOGLE_API_KEY", "offline")
+    from api_clients.google_airquality import GoogleAirQualityClient
+    from api_clients.google_elevation import GoogleElevationClient
+    from api_clients.google_maps import GoogleMapsClient
+    from api_clients.weatherapi import WeatherAPIClient
+
+    cache = cache if cache is not None else TTLCache()
+    flights = SingleFlight()
+    return {
+        "gmaps": GoogleMapsClient(cache=cache, transport=transport, geocode_cache=PersistentCache(None),
+                                  flights=flights),
+        "air_quality": GoogleAirQualityClient(cache=cache, transport=transport, flights=flights),
+        "weather": WeatherAPIClient(cache=cache, transport=transport, flights=flights),
+        "elevation": GoogleElevationClient(cache=cache, transport=transport, flights=flights),
+    }
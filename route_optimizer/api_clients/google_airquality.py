@@ -1,15 +1,21 @@
 # route_optimizer/api_clients/google_airquality.py
-import requests
 from dotenv import load_dotenv
 import os
+from api_clients.cache import TTLCache, default_cache
+from api_clients.singleflight import SingleFlight, default_flights
+from api_clients.transport import HttpTransport, default_transport
 
 load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
 class GoogleAirQualityClient:
-    def __init__(self):
+    def __init__(self, cache: TTLCache = None, transport: HttpTransport = None, flights: SingleFlight = None):
         self.api_key = GOOGLE_API_KEY
+        self.cache = cache if cache is not None else default_cache
+        self.transport = transport if transport is not None else default_transport
+        self.flights = flights if flights is not None else default_flights
         self.base_url = "https://airquality.googleapis.com/v1/currentConditions:lookup"
+        self.headers = {"Content-Type": "application/json"}
 
     def get_aqi(self, lat: float, lon: float) -> float:
         """
@@ -20,12 +26,42 @@ class GoogleAirQualityClient:
         Returns:
             AQI value (float) or 0 if the request fails.
         """
-        headers = {"Content-Type": "application/json"}
-        payload = {
+        cache_key = self.cache.spatial_key("aqi", lat, lon)
+        cached = self.cache.get("aqi", cache_key)
+        if cached is not None:
+            return cached
+        return self.flights.do(("aqi", cache_key), lambda: self._fetch(cache_key, lat, lon))
+
+    async def get_aqi_async(self, session, lat: float, lon: float) -> float:
+        """
+        Same as get_aqi, using a shared aiohttp session.
+        """
+        cache_key = self.cache.spatial_key("aqi", lat, lon)
+        cached = self.cache.get("aqi", cache_key)
+        if cached is not None:
+            return cached
+        return await self.flights.do_async(
+            ("aqi", cache_key), lambda: self._fetch_async(session, cache_key, lat, lon))
+
+    def _fetch(self, cache_key, lat: float, lon: float) -> float:
+        response = self.transport.post("aqi", self.base_url, json=self._payload(lat, lon), headers=self.headers,
+                                       params={"key": self.api_key})
+        return self._parse(cache_key, response.json())
+
+    async def _fetch_async(self, session, cache_key, lat: float, lon: float) -> float:
+        _, data = await self.transport.request_json_async(
+            session, "aqi", "POST", self.base_url, json=self._payload(lat, lon), headers=self.headers,
+            params={"key": self.api_key})
+        return self._parse(cache_key, data or {})
+
+    def _payload(self, lat: float, lon: float) -> dict:
+        return {
             "location": {"latitude": lat, "longitude": lon}
         }
-        response = requests.post(self.base_url, json=payload, headers=headers, params={"key": self.api_key})
-        data = response.json()
+
+    def _parse(self, cache_key, data: dict) -> float:
         if "indexes" in data and data["indexes"]:
-            return float(data["indexes"][0]["aqi"])
-        return 0.0
\ No newline at end of file
+            aqi = float(data["indexes"][0]["aqi"])
+            self.cache.set("aqi", cache_key, aqi)
+            return aqi
+        return 0.0
@@ -2,15 +2,24 @@ import requests
 from dotenv import load_dotenv
 import os
 import logging
+from typing import List, Optional, Tuple
+from api_clients.cache import TTLCache, default_cache
+from api_clients.singleflight import SingleFlight, default_flights
+from api_clients.transport import HttpTransport, default_transport
 
 load_dotenv()
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class GoogleElevationClient:
-    def __init__(self):
+    MAX_LOCATIONS_PER_REQUEST = 512  # Provider limit per request
+
+    def __init__(self, cache: TTLCache = None, transport: HttpTransport = None, flights: SingleFlight = None):
         self.api_key = os.getenv("GOOGLE_API_KEY")
+        self.cache = cache if cache is not None else default_cache
+        self.transport = transport if transport is not None else default_transport
+        # Requests are coalesced per chunk, so identical concurrent batches share one request.
+        self.flights = flights if flights is not None else default_flights
         if not self.api_key:
             raise ValueError("GOOGLE_API_KEY not found in environment variables.")
         self.base_url = "https://maps.googleapis.com/maps/api/elevation/json"
@@ -19,29 +28,124 @@ class GoogleElevationClient:
         """
         Fetches elevation data for start and end points.
         """
-        locations = f"{start[0]},{start[1]}|{end[0]},{end[1]}"
-        params = {
-            "locations": locations,
+        return self.get_segment_elevation_changes([(start, end)])[0]
+
+    def get_route_elevation_changes(self, points: List[Tuple[float, float]]) -> List[dict]:
+        """
+        Fetches elevation for a whole route in as few requests as possible.
+        Args:
+            points: Ordered list of (lat, lng) route points.
+        Returns:
+            One {"elevation_change": meters} dict per consecutive segment,
+            in the format Penalties.calculate expects.
+        """
+        return self.get_segment_elevation_changes(list(zip(points, points[1:])))
+
+    def get_segment_elevation_changes(self, segments: List[Tuple[tuple, tuple]]) -> List[dict]:
+        """
+        Fetches elevation change for arbitrary (start, end) segments, sharing
+        lookups between segments with common endpoints.
+        """
+        points = [point for segment in segments for point in segment]
+        return self._segment_changes(segments, self.get_elevations(points))
+
+    async def get_segment_elevation_changes_async(self, session, segments: List[Tuple[tuple, tuple]]) -> List[dict]:
+        """
+        Same as get_segment_elevation_changes, using a shared aiohttp session.
+        """
+        points = [point for segment in segments for point in segment]
+        keys, elevations, chunks = self._plan_requests(points)
+        for chunk in chunks:
+            points = [point for _, point in chunk]
+            results = await self.flights.do_async(
+                ("elevation", tuple(key for key, _ in chunk)), lambda: self._fetch_elevations_async(session, points))
+            self._store(chunk, results, elevations)
+        return self._segment_changes(segments, [elevations.get(key) for key in keys])
+
+    async def _fetch_elevations_async(self, session, points: List[Tuple[float, float]]) -> List[Optional[float]]:
+        try:
+            status, data = await self.transport.request_json_async(
+                session, "elevation", "GET", self.base_url, params=self._params(points))
+            return self._parse(data or {}, len(points)) if status == 200 else [None] * len(points)
+        except Exception as e:
+            logger.error(f"Request error: {e}")
+            return [None] * len(points)
+
+    def get_elevations(self, points: List[Tuple[float, float]]) -> List[Optional[float]]:
+        """
+        Fetches elevation for many points, deduplicating them and splitting the
+        uncached ones into MAX_LOCATIONS_PER_REQUEST sized requests.
+        Args:
+            points: List of (lat, lng) tuples.
+        Returns:
+            Elevation in meters per input point, or None where the lookup failed.
+        """
+        keys, elevations, chunks = self._plan_requests(points)
+        for chunk in chunks:
+            points = [point for _, point in chunk]
+            results = self.flights.do(("elevation", tuple(key for key, _ in chunk)),
+                                      lambda: self._fetch_elevations(points))
+            self._store(chunk, results, elevations)
+        return [elevations.get(key) for key in keys]
+
+    def _plan_requests(self, points: List[Tuple[float, float]]):
+        """
+        Splits points into cached elevations and chunks of (key, point) still to fetch.
+        """
+        keys = [self.cache.spatial_key("elevation", *point) for point in points]
+        elevations = {}
+        missing = {}
+        for point, key in zip(points, keys):
+            if key in elevations or key in missing:
+                continue
+            cached = self.cache.get("elevation", key)
+            if cached is not None:
+                elevations[key] = cached
+            else:
+                missing[key] = point
+
+        missing_items = list(missing.items())
+        chunks = [missing_items[i:i + self.MAX_LOCATIONS_PER_REQUEST]
+                  for i in range(0, len(missing_items), self.MAX_LOCATIONS_PER_REQUEST)]
+        return keys, elevations, chunks
+
+    def _store(self, chunk, results: List[Optional[float]], elevations: dict) -> None:
+        for (key, _), elevation in zip(chunk, results):
+            if elevation is not None:
+                self.cache.set("elevation", key, elevation)
+            elevations[key] = elevation
+
+    def _segment_changes(self, segments, point_elevations: List[Optional[float]]) -> List[dict]:
+        changes = []
+        for i in range(len(segments)):
+            start, end = point_elevations[2 * i], point_elevations[2 * i + 1]
+            if start is None or end is None:
+                changes.append({"elevation_change": 0})
+            else:
+                changes.append({"elevation_change": abs(end - start)})
+        return changes
+
+    def _params(self, points: List[Tuple[float, float]]) -> dict:
+        return {
+            "locations": "|".join(f"{lat:.6f},{lng:.6f}" for lat, lng in points),
             "key": self.api_key
         }
-        logger.info(f"Fetching elevation for locations: {locations}")
+
+    def _parse(self, data: dict, count: int) -> List[Optional[float]]:
+        if data.get("status") == "OK" and len(data.get("results", [])) == count:
+            return [result["elevation"] for result in data["results"]]
+        logger.error(f"Elevation API failed: {data.get('status', 'Unknown error')}")
+        return [None] * count
+
+    def _fetch_elevations(self, points: List[Tuple[float, float]]) -> List[Optional[float]]:
+        logger.debug(f"Fetching elevation for {len(points)} locations")
         try:
-            response = requests.get(self.base_url, params=params)
+            response = self.transport.get("elevation", self.base_url, params=self._params(points))
             response.raise_for_status() # Raises HTTPError for bad responses (4xx or 5xx)
-            data = response.json()
-            logger.info(f"Elevation API response: {data}")
-
-            if data.get("status") == "OK" and "results" in data and len(data["results"]) == 2:
-                elevation_change = abs(data["results"][1]["elevation"] - data["results"][0]["elevation"])
-                logger.info(f"Elevation change calculated: {elevation_change} meters")
-                return {"elevation_change": elevation_change}
-            else:
-                logger.error(f"Elevation API failed: {data.get('status', 'Unknown error')}")
-                return {"elevation_change": 0}
+            return self._parse(response.json(), len(points))
 
         except requests.exceptions.RequestException as e:
             logger.error(f"Request error: {e}")
-            return {"elevation_change": 0}
         except ValueError as e:
             logger.error(f"Json decode error: {e}")
-            return {"elevation_change": 0}
\ No newline at end of file
+        return [None] * len(points)
@@ -3,23 +3,35 @@ import requests
 from dotenv import load_dotenv
 import os
 from typing import List, Dict, Tuple  # Updated import
+from api_clients.cache import PersistentCache, TTLCache, default_cache, default_geocode_cache
+from api_clients.singleflight import SingleFlight, default_flights
+from api_clients.transport import HttpTransport, default_transport
 
 load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
 class GoogleMapsClient:
-    def __init__(self):
+    def __init__(self, cache: TTLCache = None, transport: HttpTransport = None,
+                 geocode_cache: PersistentCache = None, flights: SingleFlight = None):
         self.api_key = GOOGLE_API_KEY
+        self.cache = cache if cache is not None else default_cache
+        # Place names rarely move, so geocodes are kept on disk across restarts.
+        self.geocode_cache = geocode_cache if geocode_cache is not None else default_geocode_cache
+        self.transport = transport if transport is not None else default_transport
+        # Identical concurrent lookups (e.g. many vehicles leaving one depot) share one request.
+        self.flights = flights if flights is not None else default_flights
         self.directions_url = "https://maps.googleapis.com/maps/api/directions/json"
         self.geocode_url = "https://maps.googleapis.com/maps/api/geocode/json"
 
-    def get_directions(self, origin: str, destination: str, alternatives: bool = False) -> List[Dict]:
+    def get_directions(self, origin: str, destination: str, alternatives: bool = False,
+                       departure_time: str = None) -> List[Dict]:
         """
         Fetches detailed route data with alternatives between origin and destination.
         Args:
             origin: String with lat,lon or place name (e.g., "15.9899142,74.50661989999999").
             destination: String with lat,lon or place name (e.g., "Mumbai").
             alternatives: Boolean to request alternative routes (default: False).
+            departure_time: "now" or a Unix timestamp; legs then carry duration_in_traffic.
         Returns:
             List of route dictionaries from the Google Maps Directions API response.
         """
@@ -30,8 +42,12 @@ class GoogleMapsClient:
         }
         if alternatives:
             params["alternatives"] = "true"
+        if departure_time is not None:
+            params["departure_time"] = departure_time
+        flight_key = ("directions", origin, destination, alternatives, departure_time)
         try:
-            response = requests.get(self.directions_url, params=params, timeout=10)
+            response = self.flights.do(flight_key, lambda: self.transport.get(
+                "directions", self.directions_url, params=params, timeout=10))
             response.raise_for_status()
             data = response.json()
             if data.get("status") == "OK":
@@ -54,22 +70,67 @@ class GoogleMapsClient:
         Returns:
             Dict with distance (km), duration (hours), and speed (km/h).
         """
-        params = {
+        cache_key = (self.cache.location_key("traffic", origin), self.cache.location_key("traffic", destination))
+        cached = self.cache.get("traffic", cache_key)
+        if cached is not None:
+            return cached
+        return self.flights.do(("traffic", cache_key), lambda: self._fetch_traffic(cache_key, origin, destination))
+
+    async def get_traffic_data_async(self, session, origin: str, destination: str) -> dict:
+        """
+        Same as get_traffic_data, using a shared aiohttp session.
+        """
+        cache_key = (self.cache.location_key("traffic", origin), self.cache.location_key("traffic", destination))
+        cached = self.cache.get("traffic", cache_key)
+        if cached is not None:
+            return cached
+        return await self.flights.do_async(
+            ("traffic", cache_key), lambda: self._fetch_traffic_async(session, cache_key, origin, destination))
+
+    def _fetch_traffic(self, cache_key, origin: str, destination: str) -> dict:
+        response = self.transport.get("directions", self.directions_url, params=self._traffic_params(origin, destination))
+        return self._parse_traffic(cache_key, response.json())
+
+    async def _fetch_traffic_async(self, session, cache_key, origin: str, destination: str) -> dict:
+        _, data = await self.transport.request_json_async(
+            session, "directions", "GET", self.directions_url, params=self._traffic_params(origin, destination))
+        return self._parse_traffic(cache_key, data or {})
+
+    def _traffic_params(self, origin: str, destination: str) -> dict:
+        return {
             "origin": origin,
             "destination": destination,
             "departure_time": "now",
             "key": self.api_key
         }
-        response = requests.get(self.directions_url, params=params)
-        data = response.json()
+
+    def _parse_traffic(self, cache_key, data: dict) -> dict:
         if "routes" in data and data["routes"]:
             leg = data["routes"][0]["legs"][0]
-            distance = leg["distance"]["value"] / 1000
-            duration = leg["duration_in_traffic"]["value"] / 3600
-            speed = distance / duration if duration > 0 else 0
-            return {"distance": distance, "duration": duration, "speed": speed}
+            return self._store_traffic(cache_key, leg["distance"]["value"] / 1000,
+                                       leg["duration_in_traffic"]["value"] / 3600)
         return {"distance": 0, "duration": 0, "speed": 0}
 
+    def cache_traffic_data(self, origin: str, destination: str, distance: float, duration: float) -> dict:
+        """
+        Stores traffic for origin -> destination that is already known (e.g. from
+        the steps of a Directions response), so get_traffic_data answers it from
+        the cache until the traffic TTL expires.
+        Args:
+            distance: Road distance in km.
+            duration: Duration in traffic in hours.
+        Returns:
+            The cached traffic dict.
+        """
+        cache_key = (self.cache.location_key("traffic", origin), self.cache.location_key("traffic", destination))
+        return self._store_traffic(cache_key, distance, duration)
+
+    def _store_traffic(self, cache_key, distance: float, duration: float) -> dict:
+        speed = distance / duration if duration > 0 else 0
+        traffic = {"distance": distance, "duration": duration, "speed": speed}
+        self.cache.set("traffic", cache_key, traffic)
+        return traffic
+
     def geocode(self, address: str) -> List[Tuple[float, float]]:
         """
         Converts a place name or address to geographic coordinates.
@@ -78,13 +139,22 @@ class GoogleMapsClient:
         Returns:
             List of (latitude, longitude) tuples; typically returns the first result.
         """
+        cache_key = address.strip().lower()
+        cached = self.geocode_cache.get(cache_key)
+        if cached is not None:
+            return [tuple(coords) for coords in cached]
+        return list(self.flights.do(("geocode", cache_key), lambda: self._fetch_geocode(cache_key, address)))
+
+    def _fetch_geocode(self, cache_key: str, address: str) -> List[Tuple[float, float]]:
         params = {
             "address": address,
             "key": self.api_key
         }
-        response = requests.get(self.geocode_url, params=params)
+        response = self.transport.get("geocode", self.geocode_url, params=params)
         data = response.json()
         if data.get("status") == "OK" and data.get("results"):
             results = data["results"]
-            return [(result["geometry"]["location"]["lat"], result["geometry"]["location"]["lng"]) for result in results]
+            coords = [(result["geometry"]["location"]["lat"], result["geometry"]["location"]["lng"]) for result in results]
+            self.geocode_cache.set(cache_key, coords)
+            return coords
         return []
\ No newline at end of file
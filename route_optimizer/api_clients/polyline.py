@@ -0,0 +1,54 @@
+# route_optimizer/api_clients/polyline.py
+"""
+Google encoded polyline format (used by Directions step and overview polylines).
+"""
+from typing import List, Sequence, Tuple
+
+
+def decode_polyline(encoded: str, precision: int = 5) -> List[Tuple[float, float]]:
+    """
+    Decodes an encoded polyline.
+    Args:
+        encoded: Polyline string, e.g. step["polyline"]["points"].
+        precision: Decimal places of the encoding (5 for Google Maps).
+    Returns:
+        List of (lat, lng) points.
+    """
+    factor = 10 ** precision
+    points = []
+    index = lat = lng = 0
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1F) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        points.append((lat / factor, lng / factor))
+    return points
+
+
+def encode_polyline(points: Sequence[Tuple[float, float]], precision: int = 5) -> str:
+    """
+    Encodes (lat, lng) points as a polyline string; the inverse of decode_polyline.
+    """
+    factor = 10 ** precision
+    chunks = []
+    previous = (0, 0)
+    for lat, lng in points:
+        current = (int(round(lat * factor)), int(round(lng * factor)))
+        for value in (current[0] - previous[0], current[1] - previous[1]):
+            value = ~(value << 1) if value < 0 else value << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1F)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        previous = current
+    return "".join(chunks)
@@ -0,0 +1,89 @@
+# route_optimizer/api_clients/singleflight.py
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from metrics import COALESCED_REQUESTS
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Request coalescing for the api_clients: concurrent callers asking for the
+    same key share one in-flight lookup and its result (or exception). Keys
+    are (namespace, normalized key) tuples, usually the client's cache key, so
+    a lookup that finishes is then served by the cache as usual.
+
+    do() coalesces threads; do_async() coalesces coroutines on the same event
+    loop. Nothing is kept once a lookup completes.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._tasks: Dict[Tuple[int, Hashable], asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.coalesced: Dict[str, int] = {}
+
+    def do(self, key: Tuple, fn: Callable[[], Any]) -> Any:
+        """
+        Runs fn() unless a call with the same key is already in flight, in
+        which case this waits for that call and returns its result.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self._count(key)
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    async def do_async(self, key: Tuple, factory: Callable[[], Awaitable]) -> Any:
+        """
+        Async counterpart of do: factory() is awaited once per key and loop.
+        The shared lookup runs as its own task, so a caller that is cancelled
+        (e.g. by a timeout) does not cancel it for the others.
+        """
+        task_key = (id(asyncio.get_running_loop()), key)
+        with self._lock:
+            task = self._tasks.get(task_key)
+            if task is None:
+                task = self._tasks[task_key] = asyncio.ensure_future(factory())
+                task.add_done_callback(lambda _: self._forget(task_key))
+            else:
+                self._count(key)
+        return await asyncio.shield(task)
+
+    def _forget(self, task_key: Tuple[int, Hashable]) -> None:
+        with self._lock:
+            self._tasks.pop(task_key, None)
+
+    def _count(self, key: Tuple) -> None:
+        # Called with self._lock held.
+        namespace = key[0]
+        self.coalesced[namespace] = self.coalesced.get(namespace, 0) + 1
+        COALESCED_REQUESTS.inc(namespace=namespace)
+
+
+# Shared by every client unless one is given its own explicitly.
+default_flights = SingleFlight()
@@ -0,0 +1,212 @@
+# route_optimizer/api_clients/transport.py
+import asyncio
+import email.utils
+import logging
+import math
+import random
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import PROVIDER_ERRORS, PROVIDER_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 10.0  # Seconds, applied when a call does not pass its own timeout
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRY_DELAY = 10.0  # Seconds; a longer Retry-After gives up instead of stalling the caller
+
+# Sustained requests per second allowed per provider; None disables the limit.
+DEFAULT_RATE_LIMITS = {
+    "directions": 50.0,
+    "geocode": 50.0,
+    "elevation": 50.0,
+    "aqi": 50.0,
+    "weather": 20.0,
+}
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter. reserve() takes a token and returns how long
+    the caller must wait for it, so it works for threads and coroutines alike.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self) -> None:
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self) -> None:
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class HttpTransport:
+    """
+    Shared HTTP layer for the api_clients: one pooled keep-alive session,
+    per-provider rate limiting, default timeouts, and retries with jittered
+    backoff (honouring Retry-After up to max_retry_delay) on 429/5xx and
+    connection errors.
+    """
+
+    def __init__(self, pool_size: int = 32, max_retries: int = 3, backoff: float = 0.5,
+                 rate_limits: Dict[str, float] = None, timeout: float = DEFAULT_TIMEOUT,
+                 max_retry_delay: float = MAX_RETRY_DELAY):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_retry_delay = max_retry_delay
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(DEFAULT_RATE_LIMITS), pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        limits = dict(DEFAULT_RATE_LIMITS, **(rate_limits or {}))
+        self.buckets = {provider: TokenBucket(rate) for provider, rate in limits.items() if rate}
+
+    def get(self, provider: str, url: str, **kwargs) -> requests.Response:
+        return self.request(provider, "GET", url, **kwargs)
+
+    def post(self, provider: str, url: str, **kwargs) -> requests.Response:
+        return self.request(provider, "POST", url, **kwargs)
+
+    def request(self, provider: str, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Sends a request through the pooled session.
+        Args:
+            provider: Rate-limit bucket name (e.g. "directions", "weather").
+            method: HTTP method.
+            url: Request URL; remaining kwargs go to requests.Session.request.
+        Returns:
+            The final response; after the last retry, or when Retry-After asks for
+            more than max_retry_delay, a 429/5xx response is returned as is.
+        Raises:
+            requests.exceptions.RequestException if every attempt failed to connect.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(self.max_retries + 1):
+            self._acquire(provider)
+            PROVIDER_REQUESTS.inc(provider=provider)
+            try:
+                response = self._send(provider, method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                PROVIDER_ERRORS.inc(provider=provider)
+                if attempt == self.max_retries:
+                    raise
+                delay = self.retry_delay(attempt)
+                logger.warning(f"{provider} request failed ({e}), retrying in {delay:.2f}s")
+            else:
+                if response.status_code >= 400:
+                    PROVIDER_ERRORS.inc(provider=provider)
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    return response
+                delay = self.retry_delay(attempt, response.headers.get("Retry-After"))
+                if delay is None:
+                    logger.warning(f"{provider} returned {response.status_code} with a Retry-After over "
+                                   f"{self.max_retry_delay}s, giving up")
+                    return response
+                logger.warning(f"{provider} returned {response.status_code}, retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+    async def request_json_async(self, session, provider: str, method: str, url: str,
+                                 **kwargs) -> Tuple[int, Optional[dict]]:
+        """
+        Async counterpart of request for an aiohttp session, with the same rate
+        limiting and retry policy. Timeouts come from the session.
+        Returns:
+            (status, decoded JSON body or None if the body was not JSON).
+        """
+        for attempt in range(self.max_retries + 1):
+            await self._acquire_async(provider)
+            PROVIDER_REQUESTS.inc(provider=provider)
+            try:
+                status, retry_after, data = await self._send_async(session, provider, method, url, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                PROVIDER_ERRORS.inc(provider=provider)
+                if attempt == self.max_retries:
+                    raise
+                delay = self.retry_delay(attempt)
+                logger.warning(f"{provider} request failed ({e!r}), retrying in {delay:.2f}s")
+            else:
+                if status >= 400:
+                    PROVIDER_ERRORS.inc(provider=provider)
+                if status not in RETRY_STATUSES or attempt == self.max_retries:
+                    return status, data
+                delay = self.retry_delay(attempt, retry_after)
+                if delay is None:
+                    logger.warning(f"{provider} returned {status} with a Retry-After over "
+                                   f"{self.max_retry_delay}s, giving up")
+                    return status, data
+                logger.warning(f"{provider} returned {status}, retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    def _send(self, provider: str, method: str, url: str, **kwargs) -> requests.Response:
+        return self.session.request(method, url, **kwargs)
+
+    async def _send_async(self, session, provider: str, method: str, url: str,
+                          **kwargs) -> Tuple[int, Optional[str], Optional[dict]]:
+        """
+        Sends one request on an aiohttp session.
+        Returns:
+            (status, Retry-After header, decoded JSON body or None).
+        """
+        async with session.request(method, url, **kwargs) as response:
+            try:
+                data = await response.json(content_type=None)
+            except ValueError:
+                data = None
+            return response.status, response.headers.get("Retry-After"), data
+
+    def retry_delay(self, attempt: int, retry_after: str = None) -> Optional[float]:
+        """
+        Seconds to wait before the next attempt: the server's Retry-After if
+        given, otherwise exponential backoff with full jitter, capped at
+        max_retry_delay.
+        Returns:
+            The delay, or None if Retry-After asks for more than max_retry_delay.
+        """
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    delay = email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time()
+                except (TypeError, ValueError):
+                    delay = None
+            if delay is not None and not math.isnan(delay):
+                return max(0.0, delay) if delay <= self.max_retry_delay else None
+        return random.uniform(0, min(self.max_retry_delay, self.backoff * (2 ** attempt)))
+
+    def _acquire(self, provider: str) -> None:
+        bucket = self.buckets.get(provider)
+        if bucket:
+            bucket.acquire()
+
+    async def _acquire_async(self, provider: str) -> None:
+        bucket = self.buckets.get(provider)
+        if bucket:
+            await bucket.acquire_async()
+
+
+# Shared by every client unless one is given a transport explicitly.
+default_transport = HttpTransport()
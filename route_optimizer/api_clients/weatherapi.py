@@ -1,14 +1,19 @@
 # route_optimizer/api_clients/weatherapi.py
-import requests
 from dotenv import load_dotenv
 import os
+from api_clients.cache import TTLCache, default_cache
+from api_clients.singleflight import SingleFlight, default_flights
+from api_clients.transport import HttpTransport, default_transport
 
 load_dotenv()
 WEATHER_API_KEY = os.getenv("WEATHER_API_KEY")  # Add this to your .env
 
 class WeatherAPIClient:
-    def __init__(self):
+    def __init__(self, cache: TTLCache = None, transport: HttpTransport = None, flights: SingleFlight = None):
         self.api_key = WEATHER_API_KEY
+        self.cache = cache if cache is not None else default_cache
+        self.transport = transport if transport is not None else default_transport
+        self.flights = flights if flights is not None else default_flights
         self.base_url = "http://api.weatherapi.com/v1/current.json"
 
     def get_weather(self, lat: float, lon: float) -> dict:
@@ -20,17 +25,50 @@ class WeatherAPIClient:
         Returns:
             Dict with weather condition and wind speed, compatible with penalties.py.
         """
-        params = {
+        cache_key = self.cache.spatial_key("weather", lat, lon)
+        cached = self.cache.get("weather", cache_key)
+        if cached is not None:
+            return cached
+        return self.flights.do(("weather", cache_key), lambda: self._fetch(cache_key, lat, lon))
+
+    async def get_weather_async(self, session, lat: float, lon: float) -> dict:
+        """
+        Same as get_weather, using a shared aiohttp session.
+        """
+        cache_key = self.cache.spatial_key("weather", lat, lon)
+        cached = self.cache.get("weather", cache_key)
+        if cached is not None:
+            return cached
+        return await self.flights.do_async(
+            ("weather", cache_key), lambda: self._fetch_async(session, cache_key, lat, lon))
+
+    def _fetch(self, cache_key, lat: float, lon: float) -> dict:
+        response = self.transport.get("weather", self.base_url, params=self._params(lat, lon))
+        if response.status_code == 200:
+            return self._parse(cache_key, response.json())
+        return {}
+
+    async def _fetch_async(self, session, cache_key, lat: float, lon: float) -> dict:
+        status, data = await self.transport.request_json_async(
+            session, "weather", "GET", self.base_url, params=self._params(lat, lon))
+        if status != 200:
+            return {}
+        return self._parse(cache_key, data or {})
+
+    def _params(self, lat: float, lon: float) -> dict:
+        return {
             "key": self.api_key,
             "q": f"{lat},{lon}"  # WeatherAPI uses "lat,lon" format for queries
         }
-        response = requests.get(self.base_url, params=params)
-        if response.status_code == 200:
-            data = response.json()
-            condition = data["current"]["condition"]["text"]  # e.g., "Sunny", "Light rain"
-            wind_speed = data["current"]["wind_kph"] / 3.6  # Convert km/h to m/s
-            return {
-                "weather": [{"main": condition}],  # Mimics OpenWeatherMap structure
-                "wind": {"speed": wind_speed}
-            }
-        return {}
\ No newline at end of file
+
+    def _parse(self, cache_key, data: dict) -> dict:
+        if "current" not in data:
+            return {}
+        condition = data["current"]["condition"]["text"]  # e.g., "Sunny", "Light rain"
+        wind_speed = data["current"]["wind_kph"] / 3.6  # Convert km/h to m/s
+        weather = {
+            "weather": [{"main": condition}],  # Mimics OpenWeatherMap structure
+            "wind": {"speed": wind_speed}
+        }
+        self.cache.set("weather", cache_key, weather)
+        return weather
@@ -1,149 +1,413 @@
-from flask import Flask, request, jsonify, send_from_directory  # Importing flask module in the project is mandatory    
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context  # Importing flask module in the project is mandatory
 from flask_cors import CORS
 from graph import RouteGraph
+from segment_store import SegmentStore
+from fleet import optimize_fleet
+from planning import PlanWorkers
+from spatial_index import parse_lat_lon
+from metrics import registry
+from concurrent.futures import ThreadPoolExecutor
 import threading
 import time
+import uuid
+import json
+import logging
 from threading import Lock
 import os
 
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(),
+                    format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__, static_folder='static')
 CORS(app)
 
-class RouteState:
-    def __init__(self):
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", "8"))  # Plans and re-plans computed at once
+MAX_JOBS = int(os.getenv("MAX_JOBS", "100"))  # Live (queued + running) trips; finished ones are dropped first
+JOB_IDLE_TIMEOUT = float(os.getenv("JOB_IDLE_TIMEOUT", "1800"))  # Seconds without a client request
+LONG_POLL_TIMEOUT = 25.0  # Max seconds an /events or /stream request waits for a new event
+SEGMENT_STORE_PATH = os.getenv("SEGMENT_STORE_PATH")  # SQLite file written by precompute.py
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", str(os.cpu_count() or 1)))  # Processes for batch searches
+# "thread" plans jobs on their worker thread; "process" sends the search of large trip
+# graphs to the SEARCH_WORKERS pool so they do not hold this process's GIL. Each trip is
+# pinned to one worker, which keeps its graph and receives only new segments per re-plan.
+PLANNING_MODE = os.getenv("PLANNING_MODE", "thread")
+MAX_BATCH_TRIPS = int(os.getenv("MAX_BATCH_TRIPS", "200"))
+REROUTE_MODE = os.getenv("REROUTE_MODE", "triggered")  # "triggered" or "interval" (re-plan at every node)
+# "a_star" or "bidirectional", for one-shot and fleet searches and PLANNING_MODE="process"
+# trips. With PLANNING_MODE="thread", trips re-plan by D* Lite repair (planner.IncrementalPlanner).
+SEARCH_METHOD = os.getenv("SEARCH_METHOD", "a_star")
+
+class RouteJob:
+    def __init__(self, job_id: str, source: str, destination: str, preferences: dict):
+        self.job_id = job_id
+        self.source = source
+        self.destination = destination
+        self.preferences = preferences
         self.lock = Lock()
-        self.route_graph = None
-        self.update_thread = None
+        self.future = None
         self.route_data = {
-            "status": "idle",
-            "final_route": [],
+            "job_id": job_id,
+            "status": "queued",
+            "final_route": [source],
             "gps_position": None,
             "alternative_routes": []
         }
         self.marker_close_event = threading.Event()
+        self.last_seen = time.monotonic()
+        # Ordered change log; event i has version i + 1, clients resume from a version cursor.
+        self.events = []
+        self.version = 0
+        self.changed = threading.Condition(self.lock)
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+
+    def is_active(self) -> bool:
+        return self.route_data["status"] in ("queued", "running")
+
+    def publish(self, event_type: str, data: dict):
+        with self.changed:
+            self.version += 1
+            self.events.append({"version": self.version, "type": event_type, "data": data})
+            self.changed.notify_all()
+
+    def set_status(self, status: str, **extra):
+        with self.lock:
+            self.route_data["status"] = status
+            self.route_data.update(extra)
+        self.publish("status", dict(status=status, **extra))
+
+    def events_since(self, version: int, timeout: float):
+        """
+        Waits up to timeout seconds for events newer than version.
+        Returns:
+            (events after version, latest version)
+        """
+        with self.changed:
+            self.changed.wait_for(lambda: self.version > version or not self.is_active(), timeout)
+            return self.events[max(version, 0):], self.version
+
+    def cancel(self):
+        if self.is_active():
+            logger.info(f"Stopping optimization job {self.job_id}...")
+            self.set_status("cancelled")
+        if self.future:
+            self.future.cancel()
+        self.marker_close_event.set()
+
+class JobManager:
+    """
+    Runs optimization jobs, one RouteJob per client, and evicts jobs no client
+    has asked about for idle_timeout seconds.
+
+    Every live trip has its own thread, which spends most of the trip waiting
+    for the driver; only the planning work (the initial plan and re-plans)
+    is bounded, by max_workers planning slots.
+    """
+
+    def __init__(self, max_workers: int = MAX_CONCURRENT_JOBS, max_jobs: int = MAX_JOBS,
+                 idle_timeout: float = JOB_IDLE_TIMEOUT):
+        self.executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="route-job")
+        self.planning_slots = threading.BoundedSemaphore(max_workers)
+        self.max_jobs = max_jobs
+        self.idle_timeout = idle_timeout
+        self.jobs = {}
+        self.lock = Lock()
+        self.collector = None  # Shared by every job's RouteGraph
+        self.segment_store = SegmentStore(SEGMENT_STORE_PATH) if SEGMENT_STORE_PATH else None
+        self.search_pool = None  # PlanWorkers for CPU-bound searches, created on first use
+        self.shared_graph = None  # Long-lived RouteGraph whose feature graphs and Pareto fronts are reused across requests
+
+    def submit(self, source: str, destination: str, preferences: dict):
+        """
+        Queues a new job. Finished jobs are kept for their clients to read, but
+        the least recently seen ones are dropped to make room for a new one.
+        Returns:
+            The RouteJob, or None if max_jobs trips are already live.
+        """
+        self.evict_idle()
+        with self.lock:
+            finished = sorted((job for job in self.jobs.values() if not job.is_active()),
+                              key=lambda job: job.last_seen)
+            if len(self.jobs) - len(finished) >= self.max_jobs:
+                return None
+            for old in finished[:max(0, len(self.jobs) - self.max_jobs + 1)]:
+                del self.jobs[old.job_id]
+            job = RouteJob(uuid.uuid4().hex, source, destination, preferences)
+            self.jobs[job.job_id] = job
+        job.future = self.executor.submit(self.run, job)
+        return job
+
+    def get(self, job_id: str):
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job:
+            job.touch()
+        return job
+
+    def remove(self, job_id: str):
+        with self.lock:
+            job = self.jobs.pop(job_id, None)
+        if job:
+            job.cancel()
+        return job
+
+    def evict_idle(self):
+        now = time.monotonic()
+        with self.lock:
+            idle = [job_id for job_id, job in self.jobs.items() if now - job.last_seen > self.idle_timeout]
+        for job_id in idle:
+            logger.info(f"Evicting idle job {job_id}")
+            self.remove(job_id)
+
+    def run(self, job: RouteJob):
+        with job.lock:
+            if job.route_data["status"] != "queued":
+                return
+        job.set_status("running")
+        try:
+            route_graph = self.route_graph()
+            route_graph.dynamic_route_optimization(
+                job.source,
+                job.destination,
+                update_interval=1.0,
+                preferences=job.preferences,
+                route_data=job.route_data,
+                marker_close_event=job.marker_close_event,
+                on_update=job.publish,
+                reroute_mode=REROUTE_MODE,
+                planning_slots=self.planning_slots,
+                route_lock=job.lock
+            )
+            if job.is_active():
+                job.set_status("completed")
+            logger.info(f"Optimization {job.job_id} {job.route_data['status']}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Optimization {job.job_id} route data: {job.route_data}")
+        except Exception as e:
+            job.set_status("error", error=str(e))
+            logger.exception(f"Optimization {job.job_id} failed: {str(e)}")
+
+    def route_graph(self) -> RouteGraph:
+        """A RouteGraph sharing this manager's collector, segment store and planning pool."""
+        executor = self.get_search_pool() if PLANNING_MODE == "process" else None
+        with self.lock:
+            route_graph = RouteGraph(collector=self.collector, segment_store=self.segment_store,
+                                     executor=executor)
+            route_graph.search_method = SEARCH_METHOD
+            self.collector = route_graph.collector
+        return route_graph
+
+    def get_search_pool(self):
+        with self.lock:
+            if self.search_pool is None and SEARCH_WORKERS > 1:
+                self.search_pool = PlanWorkers(SEARCH_WORKERS)
+            return self.search_pool
+
+    def get_shared_graph(self) -> RouteGraph:
+        """
+        The long-lived RouteGraph. Its caches are bounded and it builds each
+        source/destination pair once however many requests ask for it, so
+        requests use it concurrently.
+        """
+        with self.lock:
+            shared_graph = self.shared_graph
+        if shared_graph is None:
+            shared_graph = self.route_graph()
+            with self.lock:
+                if self.shared_graph is None:
+                    self.shared_graph = shared_graph
+                shared_graph = self.shared_graph
+        return shared_graph
 
-    def reset(self):
+    def count_by_status(self) -> dict:
         with self.lock:
-            if self.update_thread and self.update_thread.is_alive():
-                print("Stopping existing optimization thread...")
-                self.route_data["status"] = "idle"
-                self.marker_close_event.set()
-                self.update_thread.join(timeout=2)
-            self.route_graph = None
-            self.update_thread = None
-            self.route_data = {
-                "status": "idle",
-                "final_route": [],
-                "gps_position": None,
-                "alternative_routes": []
-            }
-            self.marker_close_event.clear()
-            print("Backend state reset.")
-
-state = RouteState()
+            statuses = [job.route_data["status"] for job in self.jobs.values()]
+        return {status: statuses.count(status) for status in set(statuses)}
+
+# Spawned planning workers (planning.process_pool) re-import this module as
+# "__mp_main__" when it runs as a script; they must not build a JobManager.
+jobs = JobManager() if __name__ != "__mp_main__" else None
+JOBS_GAUGE = registry.gauge("route_jobs", "Optimization jobs held in memory by status", ["status"])
 
 @app.route('/')
 def home():
-    state.reset()
     return app.send_static_file('home.html')
 
 @app.route('/optimize', methods=['POST'])
 def optimize_route():
-    with state.lock:
-        # Check if completed, but ensure final_route has data
-        if state.route_data["status"] == "completed":
-            if not state.route_data["final_route"]:
-                return jsonify({"status": "completed", "message": "No route data available yet"}), 200
-            return jsonify({
-                "status": "already completed",
-                "source": state.route_data["final_route"][0],
-                "destination": state.route_data["final_route"][-1]
-            }), 200
-
-        # Check if running, but ensure final_route has data
-        if state.update_thread and state.update_thread.is_alive():
-            if not state.route_data["final_route"]:
-                return jsonify({"status": "running", "message": "Optimization in progress, no route yet"}), 200
-            return jsonify({
-                "status": "already running",
-                "source": state.route_data["final_route"][0],
-                "destination": "Mangalagiri"
-            }), 200
-
-        data = request.get_json()
-        if not data or 'source' not in data or 'destination' not in data:
-            return jsonify({"error": "Missing required fields: source and destination"}), 400
-
-        source = data['source']
-        destination = data['destination']
-        preferences = data.get('preferences', {
-            'traffic': 50,
-            'weather': 70,
-            'elevation': 30,
-            'air_quality': 80
-        })
+    data = request.get_json()
+    if not data or 'source' not in data or 'destination' not in data:
+        return jsonify({"error": "Missing required fields: source and destination"}), 400
 
-        try:
-            if not state.route_graph:
-                state.route_graph = RouteGraph()
+    source = data['source']
+    destination = data['destination']
+    preferences = data.get('preferences', {
+        'traffic': 50,
+        'weather': 70,
+        'elevation': 30,
+        'air_quality': 80
+    })
 
-            state.route_data["status"] = "running"
-            state.route_data["final_route"] = [source]  # Ensure source is set here
-            state.marker_close_event.clear()
+    try:
+        job = jobs.submit(source, destination, preferences)
+        if job is None:
+            return jsonify({"error": "Too many optimization jobs, try again later"}), 503
+        return jsonify({
+            "status": "started",
+            "job_id": job.job_id,
+            "source": source,
+            "destination": destination
+        })
+    except Exception as e:
+        return jsonify({"error": f"Optimization failed: {str(e)}"}), 500
 
-            state.update_thread = threading.Thread(
-                target=run_optimization,
-                args=(source, destination, preferences)
-            )
-            state.update_thread.start()
+@app.route('/optimize/batch', methods=['POST'])
+def optimize_batch():
+    """
+    Optimizes many trips in one request and returns all routes together.
+    Body: {"trips": [{"stops": [...]} or {"source": ..., "destination": ...}], "preferences": {...}}
+    """
+    data = request.get_json()
+    if not data or not isinstance(data.get('trips'), list) or not data['trips']:
+        return jsonify({"error": "Missing required field: trips"}), 400
+    if len(data['trips']) > MAX_BATCH_TRIPS:
+        return jsonify({"error": f"At most {MAX_BATCH_TRIPS} trips per batch"}), 400
+    trips = []
+    for trip in data['trips']:
+        stops = trip.get('stops') or [trip.get('source'), trip.get('destination')]
+        if len(stops) < 2 or not all(stops):
+            return jsonify({"error": "Each trip needs stops or source and destination"}), 400
+        trips.append(stops)
 
-            return jsonify({
-                "status": "started",
-                "source": source,
-                "destination": destination
-            })
-        except Exception as e:
-            return jsonify({"error": f"Optimization failed: {str(e)}"}), 500
+    try:
+        results = optimize_fleet(jobs.route_graph(), trips, data.get('preferences'), jobs.get_search_pool())
+        return jsonify({"status": "completed", "trips": results})
+    except Exception as e:
+        logger.exception("Batch optimization failed")
+        return jsonify({"error": f"Batch optimization failed: {str(e)}"}), 500
 
-def run_optimization(source, destination, preferences):
+@app.route('/pareto', methods=['POST'])
+def pareto_routes():
+    """
+    Pareto front of routes for source/destination plus the best route for the
+    given preferences. Fronts are cached, so moving a preference slider and
+    asking again costs no API calls or searches.
+    """
+    data = request.get_json()
+    if not data or 'source' not in data or 'destination' not in data:
+        return jsonify({"error": "Missing required fields: source and destination"}), 400
+    try:
+        front = jobs.get_shared_graph().pareto_routes(data['source'], data['destination'])
+        return jsonify({
+            "route": front.best(data.get('preferences')),
+            "front": front.to_list()
+        })
+    except Exception as e:
+        logger.exception("Pareto search failed")
+        return jsonify({"error": f"Pareto search failed: {str(e)}"}), 500
+
+@app.route('/reweight', methods=['POST'])
+def reweight_route():
+    """
+    Best route for source/destination under new preferences. Raw edge data is
+    cached per pair, so a slider change only re-weights the edges and searches again.
+    """
+    data = request.get_json()
+    if not data or 'source' not in data or 'destination' not in data:
+        return jsonify({"error": "Missing required fields: source and destination"}), 400
     try:
-        result = state.route_graph.dynamic_route_optimization(
-            source,
-            destination,
-            update_interval=1.0,
-            preferences=preferences,
-            route_data=state.route_data,
-            marker_close_event=state.marker_close_event
-        )
-        with state.lock:
-            state.route_data["status"] = "completed"
-        print("Optimization completed:", state.route_data)
+        route = jobs.get_shared_graph().reweight_route(data['source'], data['destination'],
+                                                       data.get('preferences'))
+        return jsonify({"route": route})
     except Exception as e:
-        with state.lock:
-            state.route_data["status"] = "error"
-            state.route_data["error"] = str(e)
-        print(f"Optimization failed: {str(e)}")
-
-@app.route('/status', methods=['GET'])
-def get_status():
-    with state.lock:
-        print("Serving route_data:", state.route_data)
-        return jsonify(state.route_data)
-
-@app.route('/marker-close', methods=['POST'])
-def marker_close():
+        logger.exception("Re-weighting failed")
+        return jsonify({"error": f"Re-weighting failed: {str(e)}"}), 500
+
+@app.route('/status/<job_id>', methods=['GET'])
+def get_status(job_id):
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Unknown job"}), 404
+    with job.lock:
+        return jsonify(job.route_data)
+
+@app.route('/events/<job_id>', methods=['GET'])
+def get_events(job_id):
+    """
+    Long-poll for route changes after the ?since=<version> cursor. Waits up to
+    ?timeout= seconds (0 returns immediately) and only sends the deltas.
+    """
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Unknown job"}), 404
+    since = request.args.get('since', default=0, type=int)
+    timeout = min(request.args.get('timeout', default=LONG_POLL_TIMEOUT, type=float), LONG_POLL_TIMEOUT)
+    events, version = job.events_since(since, timeout)
+    return jsonify({"version": version, "status": job.route_data["status"], "events": events})
+
+@app.route('/stream/<job_id>', methods=['GET'])
+def stream_events(job_id):
+    """
+    Server-sent events stream of route changes; resumes after Last-Event-ID.
+    """
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Unknown job"}), 404
+    since = request.headers.get('Last-Event-ID', type=int) or request.args.get('since', default=0, type=int)
+
+    def generate(version):
+        while True:
+            events, version = job.events_since(version, LONG_POLL_TIMEOUT)
+            job.touch()
+            if not events:
+                yield ": keep-alive\n\n"
+            for event in events:
+                yield f"id: {event['version']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+            if not job.is_active() and version == job.version:
+                break
+
+    return Response(stream_with_context(generate(since)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/marker-close/<job_id>', methods=['POST'])
+def marker_close(job_id):
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Unknown job"}), 404
     data = request.get_json()
     if not data or "node" not in data:
         return jsonify({"error": "Missing node parameter"}), 400
 
-    print(f"Marker close to {data['node']}")
-    state.marker_close_event.set()
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Job {job_id}: marker close to {data['node']}")
+    # An optional "position" ("lat,lng") off the route triggers a re-plan from there.
+    position = data.get("position")
+    if position is not None and not (isinstance(position, str) and parse_lat_lon(position)):
+        logger.warning(f"Job {job_id}: ignoring position {position!r}, expected \"lat,lng\"")
+        position = None
+    with job.lock:
+        job.route_data["gps_position"] = position
+    job.marker_close_event.set()
     return jsonify({"status": "received"}), 200
 
-@app.route('/reset', methods=['GET'])
-def reset_state():
-    state.reset()
-    return jsonify({"status": "backend reset"}), 200
+@app.route('/reset/<job_id>', methods=['GET'])
+def reset_job(job_id):
+    if not jobs.remove(job_id):
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify({"status": "job reset"}), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Stage timings, provider call/error counts and cache hit rates in the
+    Prometheus text format.
+    """
+    counts = jobs.count_by_status()
+    for status in ("queued", "running", "completed", "cancelled", "error"):
+        JOBS_GAUGE.set(counts.get(status, 0), status=status)
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000, host='0.0.0.0')
\ No newline at end of file
+    app.run(debug=True, port=5000, host='0.0.0.0')
@@ -0,0 +1,148 @@
+"""
+Offline end-to-end benchmark for RouteGraph.
+
+Runs find_optimal_route and dynamic_route_optimization against FakeTransport
+(synthetic data or recorded fixtures) for scenarios of increasing size and
+reports wall time, provider calls, A* expansions and peak memory.
+
+    python benchmark.py
+    python benchmark.py --scenarios small,large --latency 0.02 --json bench.json
+    python benchmark.py --baseline bench.json --max-regression 0.2
+"""
+import argparse
+import contextlib
+import io
+import json
+import sys
+import time
+import tracemalloc
+from typing import Dict, List
+
+from api_clients.cache import TTLCache
+from api_clients.fakes import FakeTransport, SyntheticWorld, fake_clients
+from collector import SegmentDataCollector
+from compact_graph import SEARCH_METHODS
+from conditions import ConditionField
+from graph import RouteGraph
+
+# name -> (alternatives per Directions call, steps per route, straight-line trip in degrees)
+SCENARIOS = {
+    "small": (2, 8, 0.3),
+    "medium": (3, 16, 0.6),
+    "large": (3, 32, 1.2),
+    "xlarge": (4, 64, 2.0),
+}
+SOURCE = "10.5,77.5"
+
+# Metrics compared against a baseline; all are "lower is better".
+COMPARED_METRICS = ["find_wall_s", "dynamic_wall_s", "api_calls", "expansions", "peak_memory_kb"]
+
+
+def run_scenario(name: str, latency: float, error_rate: float, fixtures: str = None, seed: int = 0,
+                 reroute_mode: str = "interval", search_method: str = "a_star") -> Dict:
+    alternatives, steps, span = SCENARIOS[name]
+    destination = f"{10.5 + span},{77.5 + span / 2}"
+    transport = FakeTransport(SyntheticWorld(alternatives=alternatives, steps=steps, seed=seed),
+                              fixtures=fixtures, latency=latency, error_rate=error_rate, seed=seed)
+    clients = fake_clients(transport, TTLCache())
+    collector = SegmentDataCollector(**{k: clients[k] for k in ("gmaps", "weather", "elevation", "air_quality")},
+                                     field=ConditionField(clients["weather"], clients["air_quality"]))
+    route_graph = RouteGraph(collector=collector, **clients)
+    route_graph.search_method = search_method
+
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            route = route_graph.find_optimal_route(SOURCE, destination)
+            find_wall = time.perf_counter() - started
+            find_calls = sum(transport.calls.values())
+
+            started = time.perf_counter()
+            route_data = route_graph.dynamic_route_optimization(SOURCE, destination, update_interval=0,
+                                                                reroute_mode=reroute_mode)
+            dynamic_wall = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        collector.close()
+
+    return {
+        "scenario": name,
+        "alternatives": alternatives,
+        "steps": steps,
+        "route_nodes": len(route),
+        "trip_nodes": len(route_data["final_route"]),
+        "find_wall_s": round(find_wall, 4),
+        "find_api_calls": find_calls,
+        "dynamic_wall_s": round(dynamic_wall, 4),
+        "api_calls": sum(transport.calls.values()),
+        "api_calls_by_provider": dict(transport.calls),
+        "injected_errors": sum(transport.errors.values()),
+        "expansions": route_graph.search_expansions,
+        "peak_memory_kb": round(peak / 1024),
+    }
+
+
+def compare(results: List[Dict], baseline: List[Dict], max_regression: float) -> List[str]:
+    """Returns a message for every metric that got worse than baseline by more than max_regression."""
+    previous = {result["scenario"]: result for result in baseline}
+    regressions = []
+    for result in results:
+        base = previous.get(result["scenario"])
+        if not base:
+            continue
+        for metric in COMPARED_METRICS:
+            if base.get(metric) and result[metric] > base[metric] * (1 + max_regression):
+                regressions.append(f"{result['scenario']}.{metric}: {base[metric]} -> {result[metric]}")
+    return regressions
+
+
+def print_table(results: List[Dict]) -> None:
+    columns = ["scenario", "route_nodes", "find_wall_s", "find_api_calls", "dynamic_wall_s",
+               "api_calls", "expansions", "peak_memory_kb"]
+    widths = [max(len(c), *(len(str(r[c])) for r in results)) for c in columns]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for result in results:
+        print("  ".join(str(result[c]).ljust(w) for c, w in zip(columns, widths)))
+    for result in results:
+        print(f"{result['scenario']} calls by provider: {result['api_calls_by_provider']}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="small,medium,large",
+                        help=f"Comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of fake latency per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that return 503")
+    parser.add_argument("--fixtures", help="Recorded fixture file used before synthetic data")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--reroute-mode", default="interval", choices=["interval", "triggered"],
+                        help="Re-plan at every node or only when a trigger fires")
+    parser.add_argument("--search", default="a_star", choices=list(SEARCH_METHODS),
+                        help="Search used by find_optimal_route")
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--baseline", help="Results file from an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Allowed relative increase per metric before failing (default 0.2)")
+    args = parser.parse_args(argv)
+
+    results = [run_scenario(name, args.latency, args.error_rate, args.fixtures, args.seed, args.reroute_mode,
+                            args.search)
+               for name in args.scenarios.split(",")]
+    print_table(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import threading
+from typing import Dict, List, Tuple
+
+import aiohttp
+
+from conditions import ConditionField
+
+logger = logging.getLogger(__name__)
+
+# Max in-flight requests per provider.
+PROVIDER_LIMITS = {"traffic": 10, "weather": 10, "elevation": 2, "aqi": 10}
+DEFAULT_TIMEOUT = 10.0  # Seconds per request
+
+FALLBACKS = {
+    "traffic": {"distance": 0, "duration": 0, "speed": 0},
+    "weather": {},
+    "elevation": None,
+    "aqi": 0.0,
+}
+
+
+class SegmentDataCollector:
+    """
+    Collects traffic, weather, elevation and AQI for many segments at once.
+
+    All lookups run concurrently on one background asyncio loop that owns a
+    shared aiohttp session, so connections are pooled across calls and
+    wall-clock time is bounded by the slowest provider rather than by the
+    number of segments.
+    """
+
+    def __init__(self, gmaps, weather, elevation, air_quality,
+                 limits: Dict[str, int] = None, timeout: float = DEFAULT_TIMEOUT,
+                 field: ConditionField = None):
+        self.gmaps = gmaps
+        self.weather = weather
+        self.elevation = elevation
+        self.air_quality = air_quality
+        # With a field, weather and AQI come from its tile grid instead of one lookup per grid cell.
+        self.field = field
+        self.limits = dict(PROVIDER_LIMITS, **(limits or {}))
+        self.timeout = timeout
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._semaphores = None
+        self._lock = threading.Lock()
+
+    def collect(self, segments: List[Tuple[str, str]],
+                coords: Dict[str, Tuple[float, float]],
+                elevation_changes: Dict[Tuple[str, str], float] = None) -> Dict[Tuple[str, str], tuple]:
+        """
+        Blocking wrapper around collect_async for synchronous callers such as RouteGraph.
+        Args:
+            segments: List of (start, end) node strings.
+            coords: Mapping of every node string to its (lat, lng).
+            elevation_changes: Known elevation change per segment (e.g. from a
+                SegmentStore); only the other segments are looked up.
+        Returns:
+            Dict mapping each segment to (traffic_data, weather_data, elevation_data, aqi).
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self.collect_async(segments, coords, elevation_changes), self._ensure_loop())
+        return future.result()
+
+    async def collect_async(self, segments: List[Tuple[str, str]],
+                            coords: Dict[str, Tuple[float, float]],
+                            elevation_changes: Dict[Tuple[str, str], float] = None) -> Dict[Tuple[str, str], tuple]:
+        session = self._get_session()
+        elevation_changes = elevation_changes or {}
+
+        traffic_tasks = [
+            self._limited("traffic", self.gmaps.get_traffic_data_async(session, start, end))
+            for start, end in segments
+        ]
+
+        weather_tasks, aqi_tasks = {}, {}
+        weather_keys, aqi_keys = [], []
+        field_task = None
+        if self.field is not None:
+            # The field fetches the tile corners around the segment starts and answers them all.
+            field_task = self.field.ensure_async(session, [coords[start] for start, _ in segments], self._limited)
+        else:
+            # Weather and AQI are looked up once per grid cell of the segment start.
+            for start, _ in segments:
+                lat, lon = coords[start]
+                weather_key = self.weather.cache.spatial_key("weather", lat, lon)
+                if weather_key not in weather_tasks:
+                    weather_tasks[weather_key] = self._limited(
+                        "weather", self.weather.get_weather_async(session, lat, lon))
+                weather_keys.append(weather_key)
+                aqi_key = self.air_quality.cache.spatial_key("aqi", lat, lon)
+                if aqi_key not in aqi_tasks:
+                    aqi_tasks[aqi_key] = self._limited("aqi", self.air_quality.get_aqi_async(session, lat, lon))
+                aqi_keys.append(aqi_key)
+
+        unknown = [segment for segment in segments if segment not in elevation_changes]
+        segment_coords = [(coords[start], coords[end]) for start, end in unknown]
+        elevation_task = self._limited(
+            "elevation", self.elevation.get_segment_elevation_changes_async(session, segment_coords))
+
+        results = await asyncio.gather(
+            asyncio.gather(*traffic_tasks),
+            asyncio.gather(*weather_tasks.values()),
+            asyncio.gather(*aqi_tasks.values()),
+            elevation_task,
+            field_task if field_task is not None else asyncio.sleep(0),
+        )
+        traffic_results, weather_results, aqi_results, elevation_results, _ = results
+        weather_by_key = dict(zip(weather_tasks.keys(), weather_results))
+        aqi_by_key = dict(zip(aqi_tasks.keys(), aqi_results))
+        if field_task is not None:
+            weather_keys = aqi_keys = [coords[start] for start, _ in segments]
+            weather_by_key = {point: self.field.weather_at(*point) for point in weather_keys}
+            aqi_by_key = {point: self.field.aqi_at(*point) for point in aqi_keys}
+        if elevation_results is None:
+            elevation_results = [{"elevation_change": 0}] * len(unknown)
+        elevation_by_segment = dict(zip(unknown, elevation_results))
+        for segment, change in elevation_changes.items():
+            elevation_by_segment[segment] = {"elevation_change": change}
+
+        return {
+            segment: (traffic_results[i], weather_by_key[weather_keys[i]], elevation_by_segment[segment],
+                      aqi_by_key[aqi_keys[i]])
+            for i, segment in enumerate(segments)
+        }
+
+    async def _limited(self, provider: str, coro):
+        async with self._semaphores[provider]:
+            # Only provider outages fall back; clients turn bad payloads into their failure values.
+            try:
+                return await asyncio.wait_for(coro, self.timeout)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.error(f"{provider} lookup failed: {e!r}")
+                return FALLBACKS[provider]
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=sum(self.limits.values()), ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self._semaphores = {provider: asyncio.Semaphore(limit) for provider, limit in self.limits.items()}
+        return self._session
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, daemon=True,
+                                                name="segment-data-collector")
+                self._thread.start()
+            return self._loop
+
+    def close(self) -> None:
+        """Closes the shared session and stops the background loop."""
+        with self._lock:
+            if self._loop is None:
+                return
+            if self._session is not None:
+                asyncio.run_coroutine_threadsafe(self._session.close(), self._loop).result()
+                self._session = None
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = None
+            self._thread = None
@@ -0,0 +1,271 @@
+from typing import Callable, Dict, List, Optional, Tuple
+import copy
+import heapq
+
+import numpy as np
+
+SEARCH_METHODS = ("a_star", "bidirectional")
+
+
+class CompactGraph:
+    """
+    Integer-indexed route graph in CSR form.
+
+    Node strings are interned once into ``nodes``/``index``; the edges of node
+    ``i`` are ``indices[indptr[i]:indptr[i + 1]]`` with matching ``weights``.
+    Searches keep a predecessor array instead of copying a path per push.
+    """
+
+    def __init__(self, nodes: List[str], indptr: np.ndarray, indices: np.ndarray, weights: np.ndarray):
+        self.nodes = nodes
+        self.index = {node: i for i, node in enumerate(nodes)}
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.components: Optional[np.ndarray] = None  # Raw per-edge cost terms, see from_segments
+        self.max_speed: Optional[float] = None  # Fastest edge in km/h, if the builder knows it
+        self.expansions = 0
+        self._reverse: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None  # See reverse_edges
+
+    @classmethod
+    def from_dict(cls, graph: Dict[str, Dict[str, float]]) -> "CompactGraph":
+        """
+        Builds a CompactGraph from the nested dict format used by RouteGraph.
+        """
+        nodes: List[str] = []
+        index: Dict[str, int] = {}
+
+        def intern(node: str) -> int:
+            if node not in index:
+                index[node] = len(nodes)
+                nodes.append(node)
+            return index[node]
+
+        edges = []
+        for start, neighbors in graph.items():
+            u = intern(start)
+            for end, weight in neighbors.items():
+                edges.append((u, intern(end), weight))
+
+        counts = np.zeros(len(nodes) + 1, dtype=np.int64)
+        for u, _, _ in edges:
+            counts[u + 1] += 1
+        indptr = np.cumsum(counts)
+        indices = np.empty(len(edges), dtype=np.int32)
+        weights = np.empty(len(edges), dtype=np.float64)
+        cursor = indptr[:-1].copy()
+        for u, v, weight in edges:
+            indices[cursor[u]] = v
+            weights[cursor[u]] = weight
+            cursor[u] += 1
+        return cls(nodes, indptr, indices, weights)
+
+    @classmethod
+    def from_segments(cls, segments: List[Tuple[str, str]], components: np.ndarray) -> "CompactGraph":
+        """
+        Builds a graph of distinct (start, end) segments that keeps each
+        segment's row of raw cost components (heuristic.COMPONENTS) aligned
+        with the CSR edges. Weights start at zero; see with_weights.
+        """
+        graph: Dict[str, Dict[str, float]] = {}
+        for i, (start, end) in enumerate(segments):
+            graph.setdefault(start, {})[end] = i
+        compact = cls.from_dict(graph)
+        # from_dict stored each segment's row number as its weight.
+        compact.components = np.asarray(components, dtype=float)[compact.weights.astype(np.int64)]
+        compact.weights = np.zeros(len(compact.indices))
+        return compact
+
+    def with_weights(self, weights: np.ndarray) -> "CompactGraph":
+        """
+        A copy sharing nodes, CSR arrays and components but with new edge weights.
+        """
+        self.reverse_edges()  # Built on self first so that every copy shares it
+        graph = copy.copy(self)
+        graph.weights = np.asarray(weights, dtype=float)
+        graph.expansions = 0
+        return graph
+
+    def to_dict(self) -> Dict[str, Dict[str, float]]:
+        """Converts back to the nested dict format."""
+        graph = {}
+        for u, node in enumerate(self.nodes):
+            start, end = self.indptr[u], self.indptr[u + 1]
+            if start == end:
+                continue
+            graph[node] = {self.nodes[v]: float(w) for v, w in
+                           zip(self.indices[start:end].tolist(), self.weights[start:end].tolist())}
+        return graph
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def __getstate__(self) -> dict:
+        # The node index is rebuilt on unpickling, so only the arrays cross process boundaries.
+        return {"nodes": self.nodes, "indptr": self.indptr, "indices": self.indices, "weights": self.weights,
+                "components": self.components, "max_speed": self.max_speed}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state["nodes"], state["indptr"], state["indices"], state["weights"])
+        self.components = state.get("components")
+        self.max_speed = state.get("max_speed")
+
+    def reverse_edges(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Incoming edges in CSR form: (indptr, sources, edge positions), where
+        the incoming edges of node i are sources[indptr[i]:indptr[i + 1]] and
+        the weight of each is weights[position]. Built once and shared with
+        with_weights copies, whose structure is the same.
+        """
+        if self._reverse is None:
+            sources = np.repeat(np.arange(len(self.nodes), dtype=np.int32), np.diff(self.indptr))
+            positions = np.argsort(self.indices, kind="stable")
+            counts = np.bincount(self.indices, minlength=len(self.nodes))
+            indptr = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+            self._reverse = (indptr, sources[positions], positions)
+        return self._reverse
+
+    def search(self, start: str, goal: str, heuristic: Optional[Callable[[str], float]] = None,
+               source_heuristic: Optional[Callable[[str], float]] = None, method: str = "a_star") -> List[str]:
+        """
+        Runs the search selected by method (one of SEARCH_METHODS); see a_star and bidirectional.
+        """
+        if method == "a_star":
+            return self.a_star(start, goal, heuristic)
+        if method == "bidirectional":
+            return self.bidirectional(start, goal, heuristic, source_heuristic)
+        raise ValueError(f"Unknown search method: {method}")
+
+    def a_star(self, start: str, goal: str, heuristic: Optional[Callable[[str], float]] = None) -> List[str]:
+        """
+        A* over the CSR arrays. Like the dict-based search RouteGraph.apply_a_star
+        used before CompactGraph, it expands each node at most once and never
+        reopens a closed node, so the two return the same path for any heuristic.
+        With an inconsistent heuristic (Heuristic.heuristic_estimate is one) that
+        path need not be the cheapest.
+        Args:
+            start: Start node string.
+            goal: Goal node string.
+            heuristic: Optional estimate of the remaining cost from a node string to the goal.
+        Returns:
+            List of node strings from start to goal, or [] if unreachable.
+        """
+        self.expansions = 0
+        if start not in self.index or goal not in self.index:
+            return [start] if start == goal else []
+        n = len(self.nodes)
+        source, target = self.index[start], self.index[goal]
+        # Flat per-node arrays; Python lists are faster than numpy for scalar access.
+        g_score = [float("inf")] * n
+        predecessor = [-1] * n
+        closed = bytearray(n)
+        g_score[source] = 0.0
+        indptr, indices, weights = self.indptr.tolist(), self.indices.tolist(), self.weights.tolist()
+        estimate = (lambda v: heuristic(self.nodes[v])) if heuristic else (lambda v: 0.0)
+        open_set = [(estimate(source), source)]
+
+        while open_set:
+            _, current = heapq.heappop(open_set)
+            if current == target:
+                return self._path(predecessor, source, target)
+            if closed[current]:
+                continue
+            closed[current] = True
+            self.expansions += 1
+            g_current = g_score[current]
+            for k in range(indptr[current], indptr[current + 1]):
+                neighbor = indices[k]
+                if closed[neighbor]:
+                    continue
+                tentative_g_score = g_current + weights[k]
+                if tentative_g_score < g_score[neighbor]:
+                    g_score[neighbor] = tentative_g_score
+                    predecessor[neighbor] = current
+                    heapq.heappush(open_set, (tentative_g_score + estimate(neighbor), neighbor))
+        return []
+
+    def bidirectional(self, start: str, goal: str, heuristic: Optional[Callable[[str], float]] = None,
+                      source_heuristic: Optional[Callable[[str], float]] = None) -> List[str]:
+        """
+        Bidirectional A*: a forward search from start and a backward search
+        from goal over the incoming edges, always advancing the smaller
+        frontier, until the best meeting point can no longer improve.
+
+        Both searches use the average potential (heuristic - source_heuristic) / 2,
+        which keeps them consistent with each other. The stopping rule only
+        guarantees the cheapest path when both estimates are consistent lower
+        bounds; Heuristic.heuristic_estimate is not, so with it the path can
+        cost more than the cheapest one and differ from a_star's.
+        Args:
+            start: Start node string.
+            goal: Goal node string.
+            heuristic: Optional estimate of the remaining cost from a node string to the goal.
+            source_heuristic: Optional estimate of the cost from the start to a node string.
+        Returns:
+            List of node strings from start to goal, or [] if unreachable.
+        """
+        self.expansions = 0
+        if start not in self.index or goal not in self.index or start == goal:
+            return [start] if start == goal else []
+        n = len(self.nodes)
+        source, target = self.index[start], self.index[goal]
+        forward_edges = (self.indptr.tolist(), self.indices.tolist(), self.weights.tolist())
+        reverse_indptr, reverse_sources, positions = self.reverse_edges()
+        backward_edges = (reverse_indptr.tolist(), reverse_sources.tolist(), self.weights[positions].tolist())
+        potentials: List[Optional[float]] = [None] * n
+
+        def potential(v: int) -> float:
+            if potentials[v] is None:
+                to_goal = heuristic(self.nodes[v]) if heuristic else 0.0
+                from_source = source_heuristic(self.nodes[v]) if source_heuristic else 0.0
+                potentials[v] = (to_goal - from_source) / 2
+            return potentials[v]
+
+        # Index 0 is the forward search, 1 the backward one, whose potential is negated.
+        g_score = ([float("inf")] * n, [float("inf")] * n)
+        links = ([-1] * n, [-1] * n)  # Predecessor (forward) or successor (backward) on the best path
+        closed = (bytearray(n), bytearray(n))
+        g_score[0][source] = g_score[1][target] = 0.0
+        open_sets = ([(potential(source), source)], [(-potential(target), target)])
+        best, meeting = float("inf"), -1
+
+        while open_sets[0] and open_sets[1]:
+            # Keys of the two sides sum to a path length, so nothing left can beat best.
+            if open_sets[0][0][0] + open_sets[1][0][0] >= best:
+                break
+            side = 0 if len(open_sets[0]) <= len(open_sets[1]) else 1
+            _, current = heapq.heappop(open_sets[side])
+            if closed[side][current]:
+                continue
+            closed[side][current] = True
+            self.expansions += 1
+            indptr, indices, weights = forward_edges if side == 0 else backward_edges
+            sign = 1.0 if side == 0 else -1.0
+            g_side, g_other = g_score[side], g_score[1 - side]
+            g_current = g_side[current]
+            for k in range(indptr[current], indptr[current + 1]):
+                neighbor = indices[k]
+                if closed[side][neighbor]:
+                    continue
+                tentative_g_score = g_current + weights[k]
+                if tentative_g_score < g_side[neighbor]:
+                    g_side[neighbor] = tentative_g_score
+                    links[side][neighbor] = current
+                    heapq.heappush(open_sets[side], (tentative_g_score + sign * potential(neighbor), neighbor))
+                    if tentative_g_score + g_other[neighbor] < best:
+                        best, meeting = tentative_g_score + g_other[neighbor], neighbor
+
+        if meeting == -1:
+            return []
+        path = self._path(links[0], source, meeting)
+        node = meeting
+        while node != target:
+            node = links[1][node]
+            path.append(self.nodes[node])
+        return path
+
+    def _path(self, predecessor: List[int], source: int, target: int) -> List[str]:
+        path = [target]
+        while path[-1] != source:
+            path.append(predecessor[path[-1]])
+        return [self.nodes[i] for i in reversed(path)]
@@ -0,0 +1,142 @@
+"""
+Weather and AQI as fields over a coarse grid.
+
+Conditions change over kilometres, so instead of one lookup per segment the
+providers are queried at the corners of the grid tiles a corridor passes
+through and every point is answered from those corners. Values carry the
+version (time bucket of the provider's cache TTL) they were fetched in and
+are refetched once it has passed. One field is shared by every job using the
+same SegmentDataCollector, so routes in the same region share their tiles.
+"""
+import asyncio
+import logging
+import math
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TILE_SIZE = 0.2  # Degrees (~22 km)
+DEFAULT_TTLS = {"weather": 600, "aqi": 1800}  # Used when the client caches have none
+
+Vertex = Tuple[int, int]  # (row, col) of a grid corner at (row * tile_size, col * tile_size)
+
+
+class ConditionField:
+    """
+    Time-versioned grid of weather and AQI values at tile corners.
+
+    Lookups interpolate bilinearly between the four corners of the point's
+    tile (wind speed, AQI); the categorical weather condition comes from the
+    nearest corner. Corners whose fetch failed are left out of the weights.
+    Fetching runs on the SegmentDataCollector loop, and so do the lookups.
+    """
+
+    def __init__(self, weather, air_quality, tile_size: float = DEFAULT_TILE_SIZE,
+                 ttls: Dict[str, Optional[float]] = None):
+        self.weather = weather
+        self.air_quality = air_quality
+        self.tile_size = tile_size
+        self.ttls = dict(DEFAULT_TTLS)
+        for provider, client in (("weather", weather), ("aqi", air_quality)):
+            if provider in client.cache.ttls:
+                self.ttls[provider] = client.cache.ttls[provider]
+        self.ttls.update(ttls or {})
+        self._values: Dict[Tuple[str, int, int], Tuple[int, Any]] = {}  # (provider, row, col) -> (version, value)
+        self._pending: Dict[Tuple[str, int, int, int], asyncio.Future] = {}
+        self.fetches = {"weather": 0, "aqi": 0}
+
+    def version(self, provider: str, now: float = None) -> int:
+        """Current version of a provider's values; it advances once per TTL."""
+        ttl = self.ttls.get(provider)
+        if ttl is None:
+            return 0
+        return int((time.time() if now is None else now) // ttl)
+
+    def corners(self, points: Iterable[Tuple[float, float]]) -> Set[Vertex]:
+        """Corners of every tile containing one of the points."""
+        vertices = set()
+        for lat, lon in points:
+            row, col = math.floor(lat / self.tile_size), math.floor(lon / self.tile_size)
+            vertices.update(((row, col), (row + 1, col), (row, col + 1), (row + 1, col + 1)))
+        return vertices
+
+    async def ensure_async(self, session, points: Iterable[Tuple[float, float]],
+                           limited: Callable[[str, Awaitable], Awaitable] = None) -> int:
+        """
+        Fetches the corners around points that have no value in the current version.
+        Args:
+            session: Shared aiohttp session.
+            points: (lat, lng) points that will be looked up.
+            limited: Optional wrapper applied to each provider call, e.g.
+                SegmentDataCollector._limited for its semaphores and fallbacks.
+        Returns:
+            Number of provider calls started by this call.
+        """
+        limited = limited or (lambda provider, coro: coro)
+        vertices = self.corners(points)
+        waits, started = [], 0
+        for provider in ("weather", "aqi"):
+            version = self.version(provider)
+            for row, col in vertices:
+                value = self._values.get((provider, row, col))
+                if value is not None and value[0] == version:
+                    continue
+                key = (provider, row, col, version)
+                if key not in self._pending:
+                    self._pending[key] = asyncio.ensure_future(
+                        self._fetch(session, provider, row, col, version, limited))
+                    started += 1
+                waits.append(self._pending[key])
+        if started:
+            logger.debug(f"Fetching {started} condition tile corners for {len(vertices)} corners")
+        if waits:
+            await asyncio.gather(*waits)
+        return started
+
+    async def _fetch(self, session, provider: str, row: int, col: int, version: int, limited) -> None:
+        lat, lon = row * self.tile_size, col * self.tile_size
+        try:
+            if provider == "weather":
+                value = await limited("weather", self.weather.get_weather_async(session, lat, lon))
+            else:
+                value = await limited("aqi", self.air_quality.get_aqi_async(session, lat, lon))
+            self.fetches[provider] += 1
+            # Empty weather and zero AQI are the clients' failure values.
+            if value:
+                self._values[(provider, row, col)] = (version, value)
+        finally:
+            del self._pending[(provider, row, col, version)]
+
+    def _corner_weights(self, provider: str, lat: float, lon: float) -> List[Tuple[float, Any]]:
+        """(bilinear weight, value) of the known corners of the point's tile, weights summing to 1."""
+        y, x = lat / self.tile_size, lon / self.tile_size
+        row, col = math.floor(y), math.floor(x)
+        dy, dx = y - row, x - col
+        weighted = []
+        for r, c, weight in ((row, col, (1 - dy) * (1 - dx)), (row + 1, col, dy * (1 - dx)),
+                             (row, col + 1, (1 - dy) * dx), (row + 1, col + 1, dy * dx)):
+            entry = self._values.get((provider, r, c))
+            if entry is not None:
+                weighted.append((weight, entry[1]))
+        total = sum(weight for weight, _ in weighted)
+        if weighted and total <= 0:  # Only corners the point does not lean on are known
+            return [(1 / len(weighted), value) for _, value in weighted]
+        return [(weight / total, value) for weight, value in weighted]
+
+    def weather_at(self, lat: float, lon: float) -> dict:
+        """
+        Weather at a point in the WeatherAPIClient format, or {} if no corner is known.
+        """
+        weighted = self._corner_weights("weather", lat, lon)
+        if not weighted:
+            return {}
+        wind = sum(weight * value.get("wind", {}).get("speed", 0) for weight, value in weighted)
+        _, nearest = max(weighted, key=lambda item: item[0])
+        return {"weather": nearest.get("weather", []), "wind": {"speed": wind}}
+
+    def aqi_at(self, lat: float, lon: float) -> float:
+        """
+        AQI at a point, or 0.0 (the client's failure value) if no corner is known.
+        """
+        return float(sum(weight * value for weight, value in self._corner_weights("aqi", lat, lon)))
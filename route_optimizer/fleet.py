@@ -0,0 +1,81 @@
+"""
+Batch optimization for many vehicles at once.
+
+Each trip is an ordered list of stops (an OD pair is a two-stop trip). All
+legs of the batch are fetched and scored together, so corridors shared by
+several vehicles cost one set of API calls, and the per-leg searches run in
+parallel on a process pool.
+"""
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Dict, List
+import logging
+
+from compact_graph import CompactGraph
+from graph import RouteGraph
+from metrics import timed
+from planning import SearchTask, run_searches
+
+logger = logging.getLogger(__name__)
+
+IO_WORKERS = 16  # Concurrent geocode and Directions requests
+
+
+def optimize_fleet(route_graph: RouteGraph, trips: List[List[str]], preferences: dict = None,
+                   executor: Executor = None) -> List[Dict]:
+    """
+    Optimizes every trip in one batch.
+    Args:
+        route_graph: RouteGraph whose clients, caches and collector the batch shares.
+        trips: One list of stops (place names or "lat,lng") per vehicle, at least two each.
+        preferences: Preference dict used for scoring every trip.
+        executor: Pool for the searches, e.g. planning.PlanWorkers(); None searches in this process.
+    Returns:
+        One dict per trip, in order: "stops" (as "lat,lng"), "route" (nodes from
+        the first to the last stop, [] if a leg is unreachable) and "legs" (the
+        route of each leg).
+    """
+    for trip in trips:
+        if len(trip) < 2:
+            raise ValueError(f"A trip needs at least two stops: {trip}")
+
+    with ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="fleet-io") as io:
+        names = list(dict.fromkeys(stop for trip in trips for stop in trip))
+        normalized = dict(zip(names, io.map(route_graph.get_coordinates_str, names)))
+        stops = [[normalized[stop] for stop in trip] for trip in trips]
+
+        legs = list(dict.fromkeys((a, b) for trip in stops for a, b in zip(trip, trip[1:]) if a != b))
+        with timed("directions"):
+            directions = list(io.map(
+                lambda leg: route_graph.gmaps.get_directions(leg[0], leg[1], alternatives=True,
+                                                     departure_time="now"), legs))
+
+    # Snapping shares one node index, so routes are built one leg at a time.
+    leg_routes = {leg: route_graph.build_routes(leg[0], leg[1], routes_data)
+                  for leg, routes_data in zip(legs, directions)}
+    segments = list(dict.fromkeys((route[j], route[j + 1]) for routes in leg_routes.values()
+                                  for route in routes for j in range(len(route) - 1)))
+    logger.info(f"Fleet batch: {len(trips)} trips, {len(legs)} distinct legs, {len(segments)} distinct segments")
+    heuristic_values = route_graph.score_segments(segments, preferences)
+
+    tasks = []
+    with timed("merge"):
+        for start, goal in legs:
+            merged = route_graph.merge_graphs(
+                [route_graph.construct_graph(route, heuristic_values) for route in leg_routes[(start, goal)]])
+            compact = CompactGraph.from_dict(merged)
+            coords = [route_graph.get_coordinates(node) for node in compact.nodes]
+            tasks.append(SearchTask(compact, coords, start, goal, route_graph.heuristic, route_graph.search_method))
+    with timed("a_star"):
+        searched = run_searches(tasks, executor)
+    route_graph.search_expansions += sum(expansions for _, expansions in searched)
+    leg_paths = {leg: path for leg, (path, _) in zip(legs, searched)}
+
+    results = []
+    for trip in stops:
+        paths = [leg_paths[(a, b)] if a != b else [a] for a, b in zip(trip, trip[1:])]
+        route: List[str] = []
+        if all(paths):
+            for path in paths:
+                route.extend(path[1:] if route else path)
+        results.append({"stops": trip, "route": route, "legs": paths})
+    return results
@@ -1,28 +1,98 @@
-from typing import List, Dict, Tuple, Set
-import heapq
+from concurrent.futures import Executor
+from typing import Callable, List, Dict, Tuple
+import numpy as np
 from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor
 from api_clients.google_maps import GoogleMapsClient
 from api_clients.google_airquality import GoogleAirQualityClient
 from api_clients.weatherapi import WeatherAPIClient
 from api_clients.google_elevation import GoogleElevationClient
+from api_clients.polyline import decode_polyline
+from api_clients.cache import BoundedDict, TTLCache
+from api_clients.singleflight import SingleFlight
 from models.penalties import Penalties
 from heuristic import Heuristic
+from planner import IncrementalPlanner
+from triggers import RerouteTriggers
+from collector import SegmentDataCollector
+from conditions import ConditionField
+from compact_graph import CompactGraph
+from segment_store import SegmentStore
+from spatial_index import NodeIndex, haversine_distance, parse_lat_lon, path_length, sample_path
+from planning import FEATURE_COLUMNS, PooledPlanner, preference_weight_sum, score_features
+from metrics import timed
+from pareto import ParetoFront, pareto_search
+import contextlib
+import logging
 import time
 import threading
-import math  # Added for Haversine formula
+
+logger = logging.getLogger(__name__)
 
 class RouteGraph:
-    def __init__(self):
-        self.gmaps = GoogleMapsClient()
-        self.air_quality = GoogleAirQualityClient()
-        self.weather = WeatherAPIClient()
-        self.elevation = GoogleElevationClient()
+    def __init__(self, heuristic_mode: str = "haversine", collector: SegmentDataCollector = None,
+                 gmaps: GoogleMapsClient = None, air_quality: GoogleAirQualityClient = None,
+                 weather: WeatherAPIClient = None, elevation: GoogleElevationClient = None,
+                 segment_store: SegmentStore = None, executor: Executor = None):
+        self.gmaps = gmaps or GoogleMapsClient()
+        self.air_quality = air_quality or GoogleAirQualityClient()
+        self.weather = weather or WeatherAPIClient()
+        self.elevation = elevation or GoogleElevationClient()
         self.heuristic = Heuristic()
+        # Pass a shared collector to reuse one connection pool (and condition field) across RouteGraph instances.
+        self.collector = collector or SegmentDataCollector(
+            self.gmaps, self.weather, self.elevation, self.air_quality,
+            field=ConditionField(self.weather, self.air_quality))
+        # Precomputed distances and elevation changes (see precompute.py), read before the APIs.
+        self.segment_store = segment_store
         self.api_key = "********************"  # Move to config/env in production
         self.current_route = None
         self.step_index = 0
         self.MIN_DISTANCE_THRESHOLD = 0.25  # 500 meters in kilometers
+        # Nodes are placed along each route's polyline every SAMPLE_SPACING_KM, doubled
+        # on long routes until no route has more than SEGMENT_BUDGET segments (each
+        # costs a traffic, weather, elevation and AQI lookup).
+        self.SAMPLE_SPACING_KM = 1.0
+        self.SEGMENT_BUDGET = 40
+        # Sampled points closer than this to a known node are merged into it, so
+        # alternatives through the same junction share nodes. Keep it well below
+        # MIN_DISTANCE_THRESHOLD so consecutive nodes of a route never merge.
+        self.SNAP_TOLERANCE = 0.05
+        # Bounds the node index and coordinate memos of a long-lived instance (see app.py);
+        # the oldest entries are dropped first.
+        self.MAX_NODES = 50000
+        self.node_index = NodeIndex(self.SNAP_TOLERANCE, self.haversine_distance, self.MAX_NODES)
+        self.node_lock = threading.Lock()  # Held while snapping, so concurrent builds agree on nodes
+        self.snapped_nodes = 0
+        self.last_search_expansions = 0
+        # Node string -> (lat, lng), filled as nodes are created, parsed or geocoded,
+        # so each node string is parsed at most once.
+        self.coordinates: Dict[str, Tuple[float, float]] = BoundedDict(self.MAX_NODES)
+        self.coordinate_strings: Dict[str, str] = BoundedDict(self.MAX_NODES)
+        self.destination_spacing: Dict[str, float] = BoundedDict(self.MAX_NODES)  # See build_routes
+        self.search_expansions = 0  # Total nodes expanded by all searches of this instance
+        # "haversine" uses straight-line distance for the A* heuristic (no API calls),
+        # "api" uses the Directions road distance as before.
+        if heuristic_mode not in ("haversine", "api"):
+            raise ValueError(f"Unknown heuristic mode: {heuristic_mode}")
+        self.heuristic_mode = heuristic_mode
+        # Search for one-shot plans (find_optimal_route, fleet batches) and for trips planned
+        # through a PooledPlanner; one of compact_graph.SEARCH_METHODS. Trips planned in this
+        # process use IncrementalPlanner, whose D* Lite repair does not take a method.
+        self.search_method = "a_star"
+        # With an executor (ideally planning.PlanWorkers), dynamic_route_optimization plans
+        # through a PooledPlanner: scoring and search of large trip graphs run there,
+        # fetching stays in this process.
+        if executor is not None and heuristic_mode != "haversine":
+            raise ValueError("A planning executor requires the haversine heuristic mode")
+        self.executor = executor
+        self.FEATURE_GRAPH_MAX_AGE = 120.0  # Seconds raw edge data is reused; matches the traffic cache TTL
+        self.PARETO_MAX_AGE = 120.0  # Seconds a front is reused; matches the traffic cache TTL
+        # (source, destination) -> CompactGraph with components ("feature_graph") or
+        # ParetoFront ("pareto"), least recently used dropped first.
+        self.route_cache = TTLCache(max_size=256, ttls={"feature_graph": self.FEATURE_GRAPH_MAX_AGE,
+                                                        "pareto": self.PARETO_MAX_AGE})
+        # Concurrent requests for the same pair share one build instead of each fetching it.
+        self.flights = SingleFlight()
 
     def haversine_distance(self, coord1: Tuple[float, float], coord2: Tuple[float, float]) -> float:
         """
@@ -33,70 +103,196 @@ class RouteGraph:
         Returns:
             Distance in kilometers.
         """
-        lat1, lon1 = coord1
-        lat2, lon2 = coord2
-
-        # Radius of the Earth in kilometers
-        R = 6371.0
-
-        # Convert latitude and longitude from degrees to radians
-        lat1_rad = math.radians(lat1)
-        lon1_rad = math.radians(lon1)
-        lat2_rad = math.radians(lat2)
-        lon2_rad = math.radians(lon2)
-
-        # Differences in coordinates
-        dlat = lat2_rad - lat1_rad
-        dlon = lon2_rad - lon1_rad
-
-        # Haversine formula
-        a = math.sin(dlat / 2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2)**2
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-        distance = R * c
+        return haversine_distance(coord1, coord2)
 
-        return distance
-
-    def find_optimal_route(self, source: str, destination: str, preferences: dict = None) -> List[str]:
-        """Calculate initial optimal route with coordinates."""
+    def find_optimal_route(self, source: str, destination: str, preferences: dict = None,
+                           search_method: str = None) -> List[str]:
+        """
+        Calculate initial optimal route with coordinates.
+        Args:
+            search_method: One of compact_graph.SEARCH_METHODS (default self.search_method).
+        """
+        search_method = search_method or self.search_method
         routes = self.generate_all_routes(source, destination)
-        print(f"Total Routes Found: {len(routes)}")
-        
-        graphs = []
-        for i, route in enumerate(routes):
-            heuristic_values = self.calculate_heuristic_values(route, preferences)
-            graph = self.construct_graph(route, heuristic_values)
-            graphs.append(graph)
-            print(f"Route {i+1}: {len(route)-2} Intermediate Nodes")
-            print(f"Graph {i+1}: {graph}\n")
+        logger.info(f"Total Routes Found: {len(routes)}")
         
-        merged_graph = self.merge_graphs(graphs)
-        print("Merged Graph:")
-        for start, edges in merged_graph.items():
-            for end, weight in edges.items():
-                print(f"{start} -> {end}: {weight}")
+        # Segments of all alternatives are fetched and scored in one batch.
+        # At most alternatives x SEGMENT_BUDGET segments, which plan faster here
+        # than they ship to a worker, so this never uses self.executor.
+        segments = list(dict.fromkeys((route[j], route[j + 1]) for route in routes for j in range(len(route) - 1)))
+        heuristic_values = self.score_segments(segments, preferences)
+
+        debug = logger.isEnabledFor(logging.DEBUG)
+        with timed("merge"):
+            graphs = []
+            for i, route in enumerate(routes):
+                graph = self.construct_graph(route, heuristic_values)
+                graphs.append(graph)
+                if debug:
+                    logger.debug(f"Route {i+1}: {len(route)-2} Intermediate Nodes")
+                    logger.debug(f"Graph {i+1}: {graph}")
+            merged_graph = self.merge_graphs(graphs)
+        if debug:
+            for start, edges in merged_graph.items():
+                for end, weight in edges.items():
+                    logger.debug(f"Merged edge {start} -> {end}: {weight}")
         
-        optimal_route = self.apply_a_star(merged_graph, source, destination)
+        optimal_route = self.apply_a_star(merged_graph, source, destination, method=search_method)
         optimal_route_coords = [self.get_coordinates_str(node) for node in optimal_route]
-        print("\nOptimal Route (coords):", optimal_route_coords)
+        logger.info(f"Optimal Route (coords): {optimal_route_coords}")
         
         return optimal_route_coords
 
+    def feature_graph(self, source: str, destination: str) -> CompactGraph:
+        """
+        Merged graph of all alternatives between two "lat,lng" nodes whose
+        edges keep their raw cost components (heuristic.COMPONENTS) rather than
+        one score. Cached for FEATURE_GRAPH_MAX_AGE seconds, so re-weighting it
+        for other preferences needs no API calls.
+        Returns:
+            CompactGraph with components and max_speed set and zero weights.
+        """
+        key = (source, destination)
+        compact = self.route_cache.get("feature_graph", key)
+        if compact is None:
+            compact = self.flights.do(("feature_graph", key), lambda: self._build_feature_graph(source, destination))
+        return compact
+
+    def _build_feature_graph(self, source: str, destination: str) -> CompactGraph:
+        routes = self.generate_all_routes(source, destination)
+        segments = list(dict.fromkeys((route[j], route[j + 1]) for route in routes for j in range(len(route) - 1)))
+        features = self.segment_features(segments) if segments else np.empty((0, len(FEATURE_COLUMNS)))
+        with timed("scoring"):
+            columns = {name: features[:, i] for i, name in enumerate(FEATURE_COLUMNS)}
+            columns["weather_code"] = columns["weather_code"].astype(int)
+            components = self.heuristic.calculate_components(**columns)
+        with timed("merge"):
+            compact = CompactGraph.from_segments(segments, components)
+            speeds = columns["speed"][np.isfinite(columns["speed"])]
+            compact.max_speed = float(speeds.max()) if len(speeds) else None
+        logger.info(f"Feature graph {source} -> {destination}: {len(compact.nodes)} nodes, {len(segments)} edges")
+        self.route_cache.set("feature_graph", (source, destination), compact)
+        return compact
+
+    def reweight_route(self, source: str, destination: str, preferences: dict = None) -> List[str]:
+        """
+        Optimal route for a preference setting over the cached feature graph.
+        All edge weights are recomputed in one vectorized pass and searched
+        again; only the first call for a source/destination pair (or one after
+        FEATURE_GRAPH_MAX_AGE) fetches data.
+        Returns:
+            List of "lat,lng" node strings, or [] if unreachable.
+        """
+        key = (self.get_coordinates_str(source), self.get_coordinates_str(destination))
+        compact = self.feature_graph(*key)
+        with timed("scoring"):
+            weighted = compact.with_weights(self.heuristic.edge_weights(compact.components, preferences))
+        return self.apply_a_star(weighted, key[0], key[1],
+                                 lambda distance: self.heuristic.preference_estimate(distance, preferences,
+                                                                                     compact.max_speed))
+
+    def pareto_routes(self, source: str, destination: str, max_labels_per_node: int = None) -> ParetoFront:
+        """
+        All Pareto-optimal routes over the traffic, weather, elevation and air
+        quality objectives. The front is cached for PARETO_MAX_AGE seconds, so
+        answering another preference setting with ParetoFront.best costs no
+        API calls and no search.
+        Returns:
+            ParetoFront whose routes are lists of "lat,lng" node strings.
+        """
+        key = (self.get_coordinates_str(source), self.get_coordinates_str(destination))
+        front = self.route_cache.get("pareto", key)
+        if front is None:
+            front = self.flights.do(("pareto", key), lambda: self._build_pareto_front(key, max_labels_per_node))
+        return front
+
+    def _build_pareto_front(self, key: Tuple[str, str], max_labels_per_node: int = None) -> ParetoFront:
+        compact = self.feature_graph(*key)
+        objectives = self.heuristic.calculate_objectives(compact.components).tolist()
+        graph: Dict[str, Dict[str, tuple]] = defaultdict(dict)
+        indptr, indices = compact.indptr.tolist(), compact.indices.tolist()
+        for u, start in enumerate(compact.nodes):
+            for k in range(indptr[u], indptr[u + 1]):
+                graph[start][compact.nodes[indices[k]]] = tuple(objectives[k])
+        with timed("pareto"):
+            front = pareto_search(graph, key[0], key[1], max_labels_per_node)
+        logger.info(f"Pareto front {key[0]} -> {key[1]}: {len(front)} routes")
+        self.route_cache.set("pareto", key, front)
+        return front
+
     def dynamic_route_optimization(self, source: str, destination: str, 
                                  update_interval: float = 1.0,
                                  preferences: dict = None,
                                  route_data: dict = None,
-                                 marker_close_event=None) -> Dict:
+                                 marker_close_event=None,
+                                 on_update: Callable[[str, dict], None] = None,
+                                 reroute_mode: str = "interval",
+                                 triggers: RerouteTriggers = None,
+                                 planning_slots: threading.Semaphore = None,
+                                 route_lock: threading.Lock = None) -> Dict:
+        """
+        Drives the route node by node, rerouting as conditions change.
+        on_update, if given, is called with (event_type, data) for every change
+        made to route_data: "status", "final_route" (nodes written from
+        start_index onwards) and "alternatives".
+
+        reroute_mode "interval" re-plans at every node and sleeps update_interval
+        between nodes. "triggered" re-plans only when a RerouteTriggers check
+        fires (traffic change, expired weather/AQI, or a reported
+        route_data["gps_position"] off the route) and does not sleep.
+
+        planning_slots, if given, is held while planning (the initial plan and
+        each re-plan) so a server can bound concurrent planning without
+        tying a worker to each trip while it waits for marker_close_event.
+        route_lock, if given, is held for every change to route_data, so a
+        reader holding it (e.g. a status request) never sees a half-updated
+        route. It is released before on_update is called.
+
+        Without an executor, plans are repaired in place by an
+        IncrementalPlanner (D* Lite) and search_method does not apply; with
+        one, a PooledPlanner re-runs search_method on each plan.
+        """
+        if reroute_mode not in ("interval", "triggered"):
+            raise ValueError(f"Unknown reroute mode: {reroute_mode}")
         if route_data is None:
             route_data = {"status": "idle", "final_route": [], "alternative_routes": []}
-        print(f"Starting from: {source} to: {destination} with preferences: {preferences}")
+        emit = on_update or (lambda event_type, data: None)
+        planning = planning_slots or contextlib.nullcontext()
+        lock = route_lock or contextlib.nullcontext()
+        logger.info(f"Starting from: {source} to: {destination} with preferences: {preferences}")
         
         source_coords = self.get_coordinates_str(source)
         dest_coords = self.get_coordinates_str(destination)
         
-        self.current_route = self.find_optimal_route(source_coords, dest_coords, preferences)
-        route_data["status"] = "running"
-        route_data["final_route"] = [source_coords]
-        route_data["alternative_routes"] = []  # Initialize as a list of dictionaries
+        # One merged graph is kept for the whole trip; each reroute step only
+        # scores new or expired segments and repairs the previous search.
+        if self.executor is not None:
+            planner = PooledPlanner(self, dest_coords, preferences, executor=self.executor,
+                                    method=self.search_method)
+        else:
+            planner = IncrementalPlanner(self, dest_coords, preferences)
+        with planning:
+            routes = self.generate_all_routes(source_coords, dest_coords)
+            logger.info(f"Total Routes Found: {len(routes)}")
+            planner.update_routes(routes)
+            planner.move_start(source_coords)
+            with timed("replan"):
+                self.current_route = [self.get_coordinates_str(node) for node in planner.plan()]
+        logger.info(f"Optimal Route (coords): {self.current_route}")
+        if route_data["status"] == "cancelled":
+            return route_data
+        if reroute_mode == "triggered":
+            triggers = triggers or RerouteTriggers(self, dest_coords)
+            triggers.planned(source_coords)
+        with lock:
+            # A job runner may already have published "running" (e.g. RouteJob.set_status).
+            started = route_data["status"] != "running"
+            route_data["status"] = "running"
+            route_data["final_route"] = [source_coords]
+            route_data["alternative_routes"] = []  # Initialize as a list of dictionaries
+        if started:
+            emit("status", {"status": "running"})
+        emit("final_route", {"start_index": 0, "nodes": [source_coords]})
         self.step_index = 0
 
         while self.step_index < len(self.current_route) - 1:
@@ -104,140 +300,309 @@ class RouteGraph:
             next_node = self.current_route[self.step_index + 1]
             
             if next_node not in route_data["final_route"]:
-                route_data["final_route"].append(next_node)
-                print(f"DEBUG: Updated final_route: {route_data['final_route']}")
+                with lock:
+                    route_data["final_route"].append(next_node)
+                    start_index = len(route_data["final_route"]) - 1
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"Updated final_route: {route_data['final_route']}")
+                emit("final_route", {"start_index": start_index, "nodes": [next_node]})
                 
                 # Wait for marker to get close to next_node
                 if marker_close_event:
-                    print(f"Waiting for marker to reach {next_node}")
+                    logger.debug(f"Waiting for marker to reach {next_node}")
                     marker_close_event.wait()
                     marker_close_event.clear()
+
+            if route_data["status"] == "cancelled":
+                logger.info("Optimization cancelled.")
+                break
             
-            # Check for alternatives, log them, and store them
-            alternative_routes = self.generate_all_routes(next_node, dest_coords)
-            num_alternatives = len(alternative_routes)
-            print(f"\nAt subnode {next_node}: {num_alternatives} alternative routes available")
-            
-            # Log each alternative route
-            for i, alt_route in enumerate(alternative_routes, 1):
-                print(f"Alternative Route {i}: {alt_route}")
-            
-            # Store alternatives in route_data as a dictionary
-            route_data["alternative_routes"].append({
-                "node": next_node,
-                "alternatives": alternative_routes
-            })
-            
-            if num_alternatives > 1:
-                print(f"Multiple routes detected from {next_node}, recalculating...")
-                graphs = []
-                for i, route in enumerate(alternative_routes):
-                    heuristic_values = self.calculate_heuristic_values(route, preferences)
-                    graph = self.construct_graph(route, heuristic_values)
-                    graphs.append(graph)
-                
-                merged_graph = self.merge_graphs(graphs)
-                new_optimal_route = self.apply_a_star(merged_graph, next_node, dest_coords)
-                new_optimal_route_coords = [self.get_coordinates_str(node) for node in new_optimal_route]
-                print(f"New Optimal Route from {next_node}: {new_optimal_route_coords}")
-                self.current_route = route_data["final_route"][:-1] + new_optimal_route_coords
-                self.step_index = len(route_data["final_route"]) - 2
+            with timed("reroute_step"):
+                reason, replan_from = "interval", next_node
+                if reroute_mode == "triggered":
+                    with lock:
+                        position = route_data.get("gps_position")
+                        route_data["gps_position"] = None  # A reported position is checked once
+                    reason = triggers.check(next_node, self.current_route[self.step_index + 1:],
+                                            planner.scored_at, position, previous=current_node)
+                    if reason == "deviation":
+                        replan_from = self.get_coordinates_str(position)
+
+                if reason:
+                    with planning:
+                        # Check for alternatives, log them, and store them
+                        alternative_routes = self.generate_all_routes(replan_from, dest_coords)
+                        num_alternatives = len(alternative_routes)
+                        logger.info(f"At subnode {replan_from}: {num_alternatives} alternative routes available")
+                        if logger.isEnabledFor(logging.DEBUG):
+                            for i, alt_route in enumerate(alternative_routes, 1):
+                                logger.debug(f"Alternative Route {i}: {alt_route}")
+
+                        # Store alternatives in route_data as a dictionary
+                        alternatives = {
+                            "node": replan_from,
+                            "alternatives": alternative_routes
+                        }
+                        with lock:
+                            route_data["alternative_routes"].append(alternatives)
+                        emit("alternatives", alternatives)
+
+                        # Off the route the current plan no longer applies, even with a single alternative.
+                        if num_alternatives > 1 or reason == "deviation":
+                            logger.debug(f"Multiple routes detected from {replan_from}, recalculating...")
+                            planner.update_routes(alternative_routes)
+                            planner.move_start(replan_from)
+                            with timed("replan"):
+                                new_optimal_route = planner.plan()
+                            new_optimal_route_coords = [self.get_coordinates_str(node) for node in new_optimal_route]
+                            logger.info(f"New Optimal Route from {replan_from}: {new_optimal_route_coords}")
+                            if new_optimal_route_coords:
+                                # After a deviation the driver continues from the reported position.
+                                driven = route_data["final_route"] if reason == "deviation" else route_data["final_route"][:-1]
+                                self.current_route = driven + new_optimal_route_coords
+                                self.step_index = len(route_data["final_route"]) - 2
+                        if reroute_mode == "triggered":
+                            triggers.planned(replan_from)
             
             if next_node == dest_coords:
-                print("Destination reached!")
-                route_data["status"] = "completed"
+                logger.info("Destination reached!")
+                with lock:
+                    route_data["status"] = "completed"
+                emit("status", {"status": "completed"})
                 break
                 
             self.step_index += 1
-            time.sleep(update_interval)
+            if reroute_mode == "interval":
+                time.sleep(update_interval)
         
-        print("\nFinal Route Taken:", route_data["final_route"])
-        print("\nStored Alternative Routes:")
-        for alt in route_data["alternative_routes"]:
-            print(f"From node {alt['node']}:")
-            for i, alt_route in enumerate(alt['alternatives'], 1):
-                print(f"  Alternative Route {i}: {alt_route}")
+        self.search_expansions += planner.expansions
+        logger.info(f"Final Route Taken: {route_data['final_route']}")
         return route_data
 
-    def generate_all_routes(self, source: str, destination: str) -> List[List[str]]:
-        routes_data = self.gmaps.get_directions(source, destination, alternatives=True)
+    def generate_all_routes(self, source: str, destination: str,
+                            geometry: Dict[Tuple[str, str], Tuple[float, List[Tuple[float, float]]]] = None
+                            ) -> List[List[str]]:
+        with timed("directions"):
+            routes_data = self.gmaps.get_directions(source, destination, alternatives=True, departure_time="now")
+        return self.build_routes(source, destination, routes_data, geometry)
+
+    def build_routes(self, source: str, destination: str, routes_data: List[Dict],
+                     geometry: Dict[Tuple[str, str], Tuple[float, List[Tuple[float, float]]]] = None
+                     ) -> List[List[str]]:
+        """
+        Turns Directions routes into node lists. Nodes are sampled along each
+        route's geometry (see route_path and spatial_index.sample_path) at a
+        spacing that keeps every route within SEGMENT_BUDGET segments, then
+        snapped to known nodes. Each segment's distance and duration in traffic
+        are read off the route's steps and cached as its traffic data, so
+        scoring needs no Directions request per segment.
+        Args:
+            source: Source node string the routes start from.
+            destination: Destination node string.
+            routes_data: Routes as returned by GoogleMapsClient.get_directions.
+            geometry: Optional dict that receives, for each segment, its road
+                distance in km and the (lat, lng) points of its stretch of road.
+        Returns:
+            One list of node strings per route, from source to destination.
+        """
+        for endpoint in (source, destination):
+            coords = self.get_coordinates(endpoint)
+            with self.node_lock:
+                if self.node_index.nearest(coords) is None:
+                    self.node_index.add(endpoint, coords)
+        debug = logger.isEnabledFor(logging.DEBUG)
         routes = []
-        for route in routes_data:
-            steps = route["legs"][0]["steps"]
-            route_stations = [source]
-            last_coords = self.get_coordinates(source)
+        destination_coords = self.get_coordinates(destination)
 
-            for step in steps:
-                end_location = step["end_location"]
-                station = f"{end_location['lat']},{end_location['lng']}"
-                current_coords = (end_location['lat'], end_location['lng'])
+        def is_known(point: Tuple[float, float]) -> bool:
+            return self.node_index.nearest((round(point[0], 6), round(point[1], 6))) is not None
 
-                # Calculate distance from the last node
-                distance = self.haversine_distance(last_coords, current_coords)
-                print(f"Distance from {route_stations[-1]} to {station}: {distance:.3f} km")  # Debug log
+        paths = [self.route_path(route, source) for route in routes_data]
+        # All routes to a destination share one spacing, which only grows (doubling
+        # to fit the longest route in the budget), so a reroute samples the same
+        # nodes and segments as the routes before it while the remaining trip shrinks.
+        spacing = max(self.SAMPLE_SPACING_KM, self.MIN_DISTANCE_THRESHOLD,
+                      self.destination_spacing.get(destination, 0.0))
+        longest = max((path_length(path) for path, _ in paths), default=0.0)
+        while spacing * self.SEGMENT_BUDGET < longest:
+            spacing *= 2
+        self.destination_spacing[destination] = spacing
+        for i, (path, profile) in enumerate(paths):
+            length = path_length(path)
+            route_stations = [source]
+            offsets = [0.0]  # Kilometers along the path of each station
 
-                # Only add the node if it's farther than 500 meters from the last node
-                if distance >= self.MIN_DISTANCE_THRESHOLD:
+            # Samples prefer vertices that are already nodes, so a reroute reuses the nodes
+            # (and segment data) of the routes it overlaps.
+            for (lat, lng), offset in sample_path(path, spacing, is_known)[1:]:
+                current_coords = (round(lat, 6), round(lng, 6))
+                station = f"{current_coords[0]},{current_coords[1]}"
+                with self.node_lock:
+                    canonical, current_coords = self.node_index.snap(station, current_coords)
+                if canonical != station:
+                    self.snapped_nodes += 1
+                    station = canonical
+                self.coordinates.setdefault(station, current_coords)
+                if station != route_stations[-1]:
                     route_stations.append(station)
-                    last_coords = current_coords
-                else:
-                    print(f"Skipping node {station} (distance {distance:.3f} km < {self.MIN_DISTANCE_THRESHOLD} km)")
+                    offsets.append(offset)
 
-            # Ensure the destination is always included, even if it's close to the last node
-            if route_stations[-1] != destination:
+            # The destination closes the route, replacing a last sample close to it.
+            last_coords = self.get_coordinates(route_stations[-1])
+            if len(route_stations) > 1 and self.haversine_distance(last_coords, destination_coords) < spacing / 2:
                 route_stations[-1] = destination
+                offsets[-1] = length
+            elif route_stations[-1] != destination:
+                route_stations.append(destination)
+                offsets.append(length)
+            distances = self.cache_segment_traffic(route_stations, offsets, profile)
+            if geometry is not None:
+                steps = [haversine_distance(a, b) for a, b in zip(path, path[1:])]
+                along = np.concatenate(([0.0], np.cumsum(steps)))  # Kilometers along the path of each point
+                for j, segment in enumerate(zip(route_stations, route_stations[1:])):
+                    lo = np.searchsorted(along, offsets[j], side="right")
+                    hi = np.searchsorted(along, offsets[j + 1], side="left")
+                    geometry[segment] = (distances[j], [self.get_coordinates(segment[0]), *path[lo:hi],
+                                                        self.get_coordinates(segment[1])])
+            if debug:
+                logger.debug(f"Route {i+1}: {len(path)} path points, spacing {spacing:.2f} km, "
+                             f"{len(route_stations) - 1} segments")
             routes.append(route_stations)
         return routes
 
+    def route_path(self, route: Dict, source: str) -> Tuple[List[Tuple[float, float]], np.ndarray]:
+        """
+        Geometry of a Directions route from source: its decoded step polylines,
+        else its overview polyline, else its step end points.
+        Returns:
+            (path, profile): the (lat, lng) points of the path, and rows of
+            (km along the path, road km, hours in traffic) accumulated at the
+            path start and at each step end (the leg end for an overview polyline).
+        """
+        leg = route["legs"][0]
+        steps = leg["steps"]
+        # Traffic is reported for the whole leg only; every step gets its slowdown.
+        duration = leg.get("duration", {}).get("value", 0)
+        in_traffic = leg.get("duration_in_traffic", {}).get("value")
+        traffic_ratio = in_traffic / duration if in_traffic is not None and duration > 0 else 1.0
+        path = [self.get_coordinates(source)]
+        profile = [(0.0, 0.0, 0.0)]
+        polylines = bool(steps) and all("polyline" in step for step in steps)
+        if not polylines and "overview_polyline" in route:
+            path.extend(decode_polyline(route["overview_polyline"]["points"]))
+            profile.append((path_length(path), leg["distance"]["value"] / 1000,
+                            duration * traffic_ratio / 3600))
+            return path, np.array(profile)
+        for step in steps:
+            if polylines:
+                points = decode_polyline(step["polyline"]["points"])
+            else:
+                points = [(step["end_location"]["lat"], step["end_location"]["lng"])]
+            along, road, hours = profile[-1]
+            profile.append((along + path_length([path[-1]] + points),
+                            road + step["distance"]["value"] / 1000,
+                            hours + step["duration"]["value"] * traffic_ratio / 3600))
+            path.extend(points)
+        return path, np.array(profile)
+
+    def cache_segment_traffic(self, route: List[str], offsets: List[float], profile: np.ndarray) -> List[float]:
+        """
+        Caches the traffic data of each segment of a route, interpolating road
+        distance and duration in traffic from the route's step profile.
+        Args:
+            route: Node strings of the route.
+            offsets: Kilometers along the route path of each node.
+            profile: Step profile from route_path.
+        Returns:
+            Road distance in km of each segment.
+        """
+        road = np.interp(offsets, profile[:, 0], profile[:, 1])
+        hours = np.interp(offsets, profile[:, 0], profile[:, 2])
+        distances = np.diff(road).tolist()
+        for start, end, distance, duration in zip(route, route[1:], distances, np.diff(hours).tolist()):
+            self.gmaps.cache_traffic_data(start, end, distance, duration)
+        return distances
+
     def calculate_heuristic_values(self, route: List[str], preferences: dict = None) -> Dict[Tuple[str, str], float]:
-        heuristic_values = {}
         segments = [(route[i], route[i + 1]) for i in range(len(route) - 1)]
+        return self.score_segments(segments, preferences)
 
-        def fetch_segment_data(segment):
-            start, end = segment
-            start_coords = self.get_coordinates(start)
-            end_coords = self.get_coordinates(end)
-            traffic_data = self.gmaps.get_traffic_data(start, end)
-            weather_data = self.weather.get_weather(*start_coords)
-            elevation_data = self.elevation.get_elevation(start_coords, end_coords)
-            aqi = self.air_quality.get_aqi(*start_coords)
-            return (start, end), (traffic_data, weather_data, elevation_data, aqi)
-
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            results = list(executor.map(fetch_segment_data, segments))
-
-        for (start, end), (traffic_data, weather_data, elevation_data, aqi) in results:
-            penalties = Penalties()
-            penalties.calculate(traffic_data, weather_data, elevation_data)
-            traffic_weight = preferences.get('traffic', 50) / 100.0 if preferences else 0.5
-            weather_weight = preferences.get('weather', 50) / 100.0 if preferences else 0.5
-            elevation_weight = preferences.get('elevation', 50) / 100.0 if preferences else 0.5
-            aqi_weight = preferences.get('air_quality', 50) / 100.0 if preferences else 0.5
-            score = self.heuristic.calculate_score(
-                traffic_data["distance"], traffic_data["speed"], aqi, penalties
-            ) * (traffic_weight + weather_weight + elevation_weight + aqi_weight) / 4
-            heuristic_values[(start, end)] = score
-        return heuristic_values
+    def score_segments(self, segments: List[Tuple[str, str]], preferences: dict = None) -> Dict[Tuple[str, str], float]:
+        """
+        Fetches live data for each (start, end) segment and scores it. Distance
+        and elevation change come from the segment store when it has them
+        (see segment_features).
+        Args:
+            segments: List of (start, end) node string pairs.
+            preferences: Preference dict with traffic/weather/elevation/air_quality (0-100).
+        Returns:
+            Dict mapping each segment to its heuristic score.
+        """
+        if not segments:
+            return {}
+        features = self.segment_features(segments)
+        with timed("scoring"):
+            scores = score_features(self.heuristic, features, preference_weight_sum(preferences))
+        return dict(zip(segments, scores.tolist()))
+
+    def segment_features(self, segments: List[Tuple[str, str]]) -> np.ndarray:
+        """
+        Fetches the live scoring inputs of each segment. A distance from the
+        segment store replaces the live one together with the duration, which
+        is rescaled to keep the live speed, so time and distance agree.
+        Returns:
+            Array of shape (len(segments), len(FEATURE_COLUMNS)).
+        """
+        coords = {node: self.get_coordinates(node) for segment in segments for node in segment}
+        static = self.segment_store.get_many(segments) if self.segment_store else {}
+        elevation_changes = {segment: row["elevation_change"] for segment, row in static.items()
+                             if row["elevation_change"] is not None}
+        with timed("segment_data"):
+            results = self.collector.collect(segments, coords, elevation_changes)
+
+        features = np.empty((len(segments), len(FEATURE_COLUMNS)), dtype=float)
+        for i, segment in enumerate(segments):
+            traffic, weather, elevation, aqi = results[segment]
+            distance, speed, duration = traffic["distance"], traffic["speed"], traffic["duration"]
+            stored_distance = static.get(segment, {}).get("distance")
+            if stored_distance is not None:
+                distance = stored_distance
+                duration = stored_distance / speed if speed > 0 else duration
+            features[i] = (
+                distance,
+                speed,
+                duration,
+                aqi,
+                elevation["elevation_change"],
+                weather.get("wind", {}).get("speed", 0),
+                Penalties.weather_code(weather),
+            )
+        return features
 
     def get_coordinates(self, location: str) -> Tuple[float, float]:
-        if self.is_lat_lon(location):
-            return tuple(map(float, location.split(",")))
-        return self.gmaps.geocode(location)[0]
+        coords = self.coordinates.get(location)
+        if coords is None:
+            coords = self.parse_lat_lon(location) or self.gmaps.geocode(location)[0]
+            self.coordinates[location] = coords
+        return coords
 
     def get_coordinates_str(self, location: str) -> str:
-        lat, lng = self.get_coordinates(location)
-        return f"{lat},{lng}"
+        coords_str = self.coordinate_strings.get(location)
+        if coords_str is None:
+            lat, lng = self.get_coordinates(location)
+            coords_str = f"{lat},{lng}"
+            self.coordinate_strings[location] = coords_str
+            self.coordinates.setdefault(coords_str, (lat, lng))
+        return coords_str
+
+    def parse_lat_lon(self, location: str) -> Tuple[float, float]:
+        """
+        Returns (lat, lng) for a "lat,lng" string, or None for anything else.
+        """
+        return parse_lat_lon(location)
 
     def is_lat_lon(self, location: str) -> bool:
-        try:
-            parts = location.split(",")
-            if len(parts) != 2:
-                return False
-            float(parts[0])
-            float(parts[1])
-            return True
-        except ValueError:
-            return False
+        return self.parse_lat_lon(location) is not None
 
     def construct_graph(self, route: List[str], heuristic_values: Dict[Tuple[str, str], float]) -> Dict[str, Dict[str, float]]:
         graph = defaultdict(dict)
@@ -257,36 +622,58 @@ class RouteGraph:
                         merged[start][end] = weight
         return dict(merged)
 
-    def apply_a_star(self, graph: Dict[str, Dict[str, float]], start: str, goal: str) -> List[str]:
-        open_set = [(0, start, [start])]
-        heapq.heapify(open_set)
-        closed_set: Set[str] = set()
-        g_score = {start: 0}
-        f_score = {start: self.heuristic.heuristic_estimate(self.get_distance(start, goal))}
-
-        while open_set:
-            _, current, path = heapq.heappop(open_set)
-            if current == goal:
-                return path
-            if current in closed_set:
-                continue
-            closed_set.add(current)
-            for neighbor, weight in graph.get(current, {}).items():
-                tentative_g_score = g_score[current] + weight
-                if neighbor in closed_set and tentative_g_score >= g_score.get(neighbor, float("inf")):
-                    continue
-                if tentative_g_score < g_score.get(neighbor, float("inf")):
-                    g_score[neighbor] = tentative_g_score
-                    distance_to_goal = self.get_distance(neighbor, goal)
-                    f_score[neighbor] = g_score[neighbor] + self.heuristic.heuristic_estimate(distance_to_goal)
-                    heapq.heappush(open_set, (f_score[neighbor], neighbor, path + [neighbor]))
-        return []
+    def apply_a_star(self, graph, start: str, goal: str,
+                     estimate: Callable[[float], float] = None, method: str = "a_star") -> List[str]:
+        """
+        A* from start to goal over a dict graph or a CompactGraph.
+        Args:
+            estimate: Estimate of the cost of a remaining distance in km (default
+                Heuristic.heuristic_estimate, which can overestimate; see
+                CompactGraph.a_star and CompactGraph.bidirectional).
+            method: "a_star", or "bidirectional" to also search back from the
+                goal with the same estimate of the distance from start.
+        Returns:
+            List of node strings from start to goal, or [] if unreachable.
+        """
+        estimate = estimate or self.heuristic.heuristic_estimate
+        distance_cache: Dict[Tuple[str, str], float] = {}
+        with timed("a_star"):
+            compact = graph if isinstance(graph, CompactGraph) else CompactGraph.from_dict(graph)
+            path = compact.search(
+                start, goal,
+                lambda node: estimate(self.get_distance_cached(node, goal, distance_cache)),
+                lambda node: estimate(self.get_distance_cached(start, node, distance_cache)),
+                method=method)
+        self.last_search_expansions = compact.expansions
+        self.search_expansions += compact.expansions
+        return path
+
+    def get_distance_cached(self, node: str, goal: str, cache: Dict[Tuple[str, str], float]) -> float:
+        """
+        Distance from node to goal for the A* heuristic, memoized for one search.
+        Args:
+            node: Node string ("lat,lng" or place name).
+            goal: Goal node string.
+            cache: Per-search dict keyed by (node, goal).
+        Returns:
+            Distance in kilometers.
+        """
+        key = (node, goal)
+        if key not in cache:
+            if self.heuristic_mode == "haversine":
+                # Straight-line distance never exceeds the road distance, so the
+                # estimate stays a lower bound of the "api" mode estimate.
+                cache[key] = self.haversine_distance(self.get_coordinates(node), self.get_coordinates(goal))
+            else:
+                cache[key] = self.get_distance(node, goal)
+        return cache[key]
 
     def get_distance(self, start: str, end: str) -> float:
         traffic_data = self.gmaps.get_traffic_data(start, end)
         return traffic_data["distance"]
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     route_graph = RouteGraph()
     source = "Dharapuram"
     destination = "Udumalpet"
@@ -1,4 +1,18 @@
 from models.penalties import Penalties
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Columns of Heuristic.calculate_components and Heuristic.calculate_objectives.
+COMPONENTS = ("T", "E", "A", "Pt", "Pw", "Pter", "Pwind")
+OBJECTIVES = ("traffic", "weather", "elevation", "air_quality")
+
+
+def preference_vector(preferences: dict = None) -> np.ndarray:
+    """Preference sliders (0-100, default 50) as weights in OBJECTIVES order."""
+    preferences = preferences or {}
+    return np.array([preferences.get(name, 50) / 100.0 for name in OBJECTIVES])
 
 class Heuristic:
     def __init__(self, weights: dict = None, fuel_efficiency: float = 15, vehicle_type: str = "petrol"):
@@ -30,9 +44,90 @@ class Heuristic:
         A = aqi / 500
         penalty_sum = sum(self.weights[f"W{i+1}"] * p for i, p in enumerate(penalties.to_list()))
         score = self.weights["Wt"] * T + self.weights["We"] * E + self.weights["Wa"] * A + penalty_sum
-        print(f"T: {T}, E: {E}, A: {A}, Penalty: {penalty_sum}, Score: {score}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"T: {T}, E: {E}, A: {A}, Penalty: {penalty_sum}, Score: {score}")
         return score
 
+    def calculate_scores(self, distance: np.ndarray, speed: np.ndarray, duration: np.ndarray,
+                         aqi: np.ndarray, elevation_change: np.ndarray, wind_speed: np.ndarray,
+                         weather_code: np.ndarray) -> np.ndarray:
+        """
+        Scores many edges in one vectorized pass; element i equals
+        calculate_score for the same segment's scalar inputs.
+        """
+        distance = np.asarray(distance, dtype=float)
+        speed = np.asarray(speed, dtype=float)
+        penalties = Penalties.calculate_arrays(distance, duration, weather_code, elevation_change, wind_speed)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            T = np.where(speed > 0, distance / speed, np.inf)
+        E = distance * self.emission_factor / self.fuel_efficiency
+        A = np.asarray(aqi, dtype=float) / 500
+        # Accumulate in the same order as the scalar path so results are bit-identical.
+        penalty_sum = 0
+        for i in range(4):
+            penalty_sum = penalty_sum + self.weights[f"W{i+1}"] * penalties[:, i]
+        return self.weights["Wt"] * T + self.weights["We"] * E + self.weights["Wa"] * A + penalty_sum
+
+    def calculate_components(self, distance: np.ndarray, speed: np.ndarray, duration: np.ndarray,
+                             aqi: np.ndarray, elevation_change: np.ndarray, wind_speed: np.ndarray,
+                             weather_code: np.ndarray) -> np.ndarray:
+        """
+        Unweighted score terms of many edges.
+        Returns:
+            Array of shape (n, 7) with columns COMPONENTS: T, E, A, Pt, Pw, Pter, Pwind.
+        """
+        distance = np.asarray(distance, dtype=float)
+        speed = np.asarray(speed, dtype=float)
+        penalties = Penalties.calculate_arrays(distance, duration, weather_code, elevation_change, wind_speed)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            T = np.where(speed > 0, distance / speed, np.inf)
+        E = distance * self.emission_factor / self.fuel_efficiency
+        A = np.asarray(aqi, dtype=float) / 500
+        return np.column_stack([T, E, A, penalties])
+
+    def calculate_objectives(self, components: np.ndarray) -> np.ndarray:
+        """
+        Groups weighted score terms by the preference they belong to.
+        Args:
+            components: Array of COMPONENTS rows from calculate_components.
+        Returns:
+            Array of shape (n, 4) with columns OBJECTIVES; each row sums to the edge's score.
+        """
+        T, E, A, Pt, Pw, Pter, Pwind = (components[:, i] for i in range(7))
+        w = self.weights
+        return np.column_stack([
+            w["Wt"] * T + w["W1"] * Pt,       # traffic: travel time and congestion
+            w["W2"] * Pw + w["W4"] * Pwind,   # weather: conditions and wind
+            w["We"] * E + w["W3"] * Pter,     # elevation: emissions and terrain
+            w["Wa"] * A,                      # air_quality
+        ])
+
+    def edge_weights(self, components: np.ndarray, preferences: dict = None) -> np.ndarray:
+        """
+        Edge weights for a preference setting in one pass: each objective of
+        calculate_objectives scaled by its preference slider (0-100, default 50).
+        """
+        return self.calculate_objectives(components) @ preference_vector(preferences)
+
+    def preference_estimate(self, distance_remaining: float, preferences: dict = None,
+                            max_speed: float = None) -> float:
+        """
+        Lower bound on the edge_weights cost of the remaining distance, the
+        counterpart of heuristic_estimate for preference-weighted edges. Only
+        the terms of calculate_objectives that grow with distance are kept,
+        weighted the same way: travel time at max_speed and this vehicle's
+        emissions. The penalties and AQI terms are non-negative and left out.
+        Args:
+            distance_remaining: Distance in km, at most the road distance left.
+            preferences: Preference sliders, as for edge_weights.
+            max_speed: Speed (km/h) of the fastest edge searched; without it
+                the travel time term is 0.
+        """
+        traffic, _, elevation, _ = preference_vector(preferences).tolist()
+        T_min = distance_remaining / max_speed if max_speed else 0.0
+        E_min = distance_remaining * self.emission_factor / self.fuel_efficiency
+        return traffic * self.weights["Wt"] * T_min + elevation * self.weights["We"] * E_min
+
     def heuristic_estimate(self, distance_remaining: float) -> float:
         T_min = distance_remaining / 100  # Best-case speed
         E_min = (distance_remaining * 0.2) / self.fuel_efficiency  # Best-case emissions
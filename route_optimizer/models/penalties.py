@@ -1,5 +1,15 @@
 # route_optimizer/models/penalties.py
 from dataclasses import dataclass
+import numpy as np
+
+WEATHER_PENALTIES = {
+    "Sunny": 0.0, "Clear": 0.0, "Partly cloudy": 0.1, "Cloudy": 0.1,
+    "Light rain": 0.2, "Rain": 0.3, "Heavy rain": 0.5,
+    "Snow": 0.7, "Light snow": 0.4, "Fog": 0.5, "Mist": 0.3
+}
+# Integer codes for the columnar path; code 0 is any unknown condition (no penalty).
+WEATHER_CODES = {condition: i + 1 for i, condition in enumerate(WEATHER_PENALTIES)}
+WEATHER_PENALTY_TABLE = np.array([0.0] + list(WEATHER_PENALTIES.values()))
 
 @dataclass
 class Penalties:
@@ -16,12 +26,7 @@ class Penalties:
 
         # Weather Penalty (Pw): Based on condition
         condition = weather_data.get("weather", [{}])[0].get("main", "Clear")
-        weather_penalty_map = {
-            "Sunny": 0.0, "Clear": 0.0, "Partly cloudy": 0.1, "Cloudy": 0.1,
-            "Light rain": 0.2, "Rain": 0.3, "Heavy rain": 0.5,
-            "Snow": 0.7, "Light snow": 0.4, "Fog": 0.5, "Mist": 0.3
-        }
-        self.Pw = weather_penalty_map.get(condition, 0.0)
+        self.Pw = WEATHER_PENALTIES.get(condition, 0.0)
 
         # Terrain Penalty (Pter): Elevation change per distance
         self.Pter = (elevation_data["elevation_change"] / traffic_data["distance"] 
@@ -32,4 +37,29 @@ class Penalties:
         self.Pwind = wind_speed / 20  # Max wind speed = 20 m/s
 
     def to_list(self) -> list:
-        return [self.Pt, self.Pw, self.Pter, self.Pwind]
\ No newline at end of file
+        return [self.Pt, self.Pw, self.Pter, self.Pwind]
+
+    @staticmethod
+    def weather_code(weather_data: dict) -> int:
+        """Maps a weather dict from WeatherAPIClient to its WEATHER_CODES code."""
+        condition = weather_data.get("weather", [{}])[0].get("main", "Clear")
+        return WEATHER_CODES.get(condition, 0)
+
+    @staticmethod
+    def calculate_arrays(distance: np.ndarray, duration: np.ndarray, weather_code: np.ndarray,
+                         elevation_change: np.ndarray, wind_speed: np.ndarray) -> np.ndarray:
+        """
+        Columnar version of calculate for many segments at once.
+        Returns:
+            Array of shape (n, 4) with columns Pt, Pw, Pter, Pwind, matching to_list().
+        """
+        distance = np.asarray(distance, dtype=float)
+        duration = np.asarray(duration, dtype=float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            free_flow_duration = distance / 100
+            congested = (free_flow_duration != 0) & (duration > free_flow_duration)
+            Pt = np.where(congested, (duration - free_flow_duration) / free_flow_duration, 0.0)
+            Pter = np.where(distance != 0, np.asarray(elevation_change, dtype=float) / distance, 0.0)
+        Pw = WEATHER_PENALTY_TABLE[np.asarray(weather_code, dtype=int)]
+        Pwind = np.asarray(wind_speed, dtype=float) / 20
+        return np.column_stack([Pt, Pw, Pter, Pwind])
@@ -0,0 +1,105 @@
+"""
+Multi-objective route search.
+
+Every edge carries one cost per preference (heuristic.OBJECTIVES). The
+label-setting search returns all Pareto-optimal routes between two nodes
+once; a preference setting then picks its route from the front by a
+weighted sum, without new API calls or searches.
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+import heapq
+import itertools
+
+import numpy as np
+
+from heuristic import OBJECTIVES, preference_vector
+
+Cost = Tuple[float, ...]
+
+
+def _dominated(cost: Cost, others: Sequence[Cost]) -> bool:
+    """True if some cost in others is at least as good in every objective."""
+    return any(all(o <= c for o, c in zip(other, cost)) for other in others)
+
+
+class ParetoFront:
+    """
+    Pareto-optimal routes with their objective cost vectors.
+    """
+
+    def __init__(self, costs: List[Cost], routes: List[List[str]]):
+        self.costs = np.array(costs, dtype=float).reshape(-1, len(OBJECTIVES))
+        self.routes = routes
+
+    def __len__(self) -> int:
+        return len(self.routes)
+
+    def best(self, preferences: dict = None) -> List[str]:
+        """
+        The route with the lowest preference-weighted cost, or [] if the front is empty.
+        """
+        if not self.routes:
+            return []
+        with np.errstate(invalid="ignore"):
+            totals = self.costs @ preference_vector(preferences)
+        return self.routes[int(np.nanargmin(totals))] if not np.isnan(totals).all() else self.routes[0]
+
+    def to_list(self) -> List[Dict]:
+        return [{"costs": dict(zip(OBJECTIVES, cost.tolist())), "route": route}
+                for cost, route in zip(self.costs, self.routes)]
+
+
+def pareto_search(graph: Dict[str, Dict[str, Cost]], start: str, goal: str,
+                  max_labels_per_node: Optional[int] = None) -> ParetoFront:
+    """
+    Multi-objective label-setting search (Martins' algorithm) over non-negative cost vectors.
+    Args:
+        graph: Nested dict {start: {end: cost vector}}.
+        start: Start node string.
+        goal: Goal node string.
+        max_labels_per_node: Optional cap on settled labels per node; once reached
+            further labels at that node are dropped, bounding the work on large
+            graphs at the price of possibly missing some Pareto routes.
+    Returns:
+        The Pareto front of start-goal routes.
+    """
+    if start == goal:
+        return ParetoFront([tuple(0.0 for _ in OBJECTIVES)], [[start]])
+    # A label is (cost, node, parent label index); labels are popped in order of
+    # total cost, so a settled label is never dominated by one popped later.
+    labels: List[Tuple[Cost, str, int]] = []
+    settled: Dict[str, List[Cost]] = {}
+    counter = itertools.count()
+    zero = tuple(0.0 for _ in OBJECTIVES)
+    labels.append((zero, start, -1))
+    heap = [(0.0, next(counter), 0)]
+    goal_labels: List[int] = []
+
+    while heap:
+        _, _, label_index = heapq.heappop(heap)
+        cost, node, _ = labels[label_index]
+        node_settled = settled.setdefault(node, [])
+        if _dominated(cost, node_settled) or _dominated(cost, settled.get(goal, [])):
+            continue
+        if max_labels_per_node is not None and len(node_settled) >= max_labels_per_node:
+            continue
+        node_settled.append(cost)
+        if node == goal:
+            goal_labels.append(label_index)
+            continue
+        for neighbor, edge_cost in graph.get(node, {}).items():
+            new_cost = tuple(c + e for c, e in zip(cost, edge_cost))
+            if _dominated(new_cost, settled.get(neighbor, [])) or _dominated(new_cost, settled.get(goal, [])):
+                continue
+            labels.append((new_cost, neighbor, label_index))
+            heapq.heappush(heap, (sum(new_cost), next(counter), len(labels) - 1))
+
+    costs, routes = [], []
+    for label_index in goal_labels:
+        costs.append(labels[label_index][0])
+        path = []
+        while label_index != -1:
+            _, node, label_index = labels[label_index]
+            path.append(node)
+        routes.append(path[::-1])
+    return ParetoFront(costs, routes)
@@ -0,0 +1,175 @@
+from typing import List, Dict, Tuple, Set
+import heapq
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+INF = float("inf")
+
+
+class IncrementalPlanner:
+    """
+    Keeps one merged route graph alive across reroute steps and repairs the
+    search with D* Lite instead of rebuilding and re-running A* every step.
+
+    Costs are searched backwards from the fixed goal, so moving the start
+    (the driver advancing) only shifts the key modifier, and adding or
+    re-scoring an edge only touches the vertices whose cost-to-goal changed.
+    """
+
+    def __init__(self, route_graph, goal: str, preferences: dict = None, edge_ttl: float = 120.0):
+        """
+        Args:
+            route_graph: RouteGraph used for scoring segments and coordinates.
+            goal: Destination node string ("lat,lng").
+            preferences: Preference dict passed to the scoring.
+            edge_ttl: Seconds after which an edge is re-scored when a route uses it again.
+        """
+        self.route_graph = route_graph
+        self.goal = goal
+        self.preferences = preferences
+        self.edge_ttl = edge_ttl
+        self.graph: Dict[str, Dict[str, float]] = {}
+        self.predecessors: Dict[str, Set[str]] = {}
+        self.scored_at: Dict[Tuple[str, str], float] = {}
+        self.g: Dict[str, float] = {}
+        self.rhs: Dict[str, float] = {goal: 0.0}
+        self.km = 0.0
+        self.start = None
+        self.last_start = None
+        self.open_set: List[Tuple[Tuple[float, float], str]] = []
+        self.open_keys: Dict[str, Tuple[float, float]] = {}
+        self.distance_cache: Dict[Tuple[str, str], float] = {}
+        self.scored_segments = 0
+        self.expansions = 0
+        self.update_vertex(goal)
+
+    def update_routes(self, routes: List[List[str]]) -> int:
+        """
+        Adds the segments of the given routes to the graph, scoring only edges
+        that are new or whose score is older than edge_ttl.
+        Args:
+            routes: List of routes, each a list of node strings.
+        Returns:
+            Number of segments that were (re)scored.
+        """
+        now = time.monotonic()
+        to_score = []
+        seen = set()
+        for route in routes:
+            for i in range(len(route) - 1):
+                segment = (route[i], route[i + 1])
+                if segment in seen:
+                    continue
+                seen.add(segment)
+                scored_at = self.scored_at.get(segment)
+                if scored_at is None or now - scored_at > self.edge_ttl:
+                    to_score.append(segment)
+        if not to_score:
+            return 0
+
+        scores = self.route_graph.score_segments(to_score, self.preferences)
+        for (start, end), weight in scores.items():
+            self.scored_at[(start, end)] = now
+            self.set_edge(start, end, weight)
+        self.scored_segments += len(scores)
+        logger.debug(f"Planner scored {len(scores)} new or expired segments ({len(self.scored_at)} known)")
+        return len(scores)
+
+    def set_edge(self, start: str, end: str, weight: float) -> None:
+        if self.graph.get(start, {}).get(end) == weight:
+            return
+        self.graph.setdefault(start, {})[end] = weight
+        self.predecessors.setdefault(end, set()).add(start)
+        self.update_vertex(start)
+
+    def move_start(self, node: str) -> None:
+        """Moves the search start to the driver's current node."""
+        if self.last_start is not None and node != self.last_start:
+            self.km += self.h(self.last_start, node)
+        self.start = node
+        self.last_start = node
+
+    def plan(self) -> List[str]:
+        """
+        Repairs the search and returns the current optimal path from the start
+        to the goal, or an empty list if the goal is unreachable.
+        """
+        if self.start is None:
+            return []
+        self.compute_shortest_path()
+        if self.g.get(self.start, INF) == INF:
+            return []
+
+        path = [self.start]
+        visited = {self.start}
+        current = self.start
+        while current != self.goal:
+            best, best_cost = None, INF
+            for neighbor, weight in self.graph.get(current, {}).items():
+                cost = weight + self.g.get(neighbor, INF)
+                if cost < best_cost and neighbor not in visited:
+                    best, best_cost = neighbor, cost
+            if best is None:
+                return []
+            path.append(best)
+            visited.add(best)
+            current = best
+        return path
+
+    def h(self, a: str, b: str) -> float:
+        key = (a, b)
+        if key not in self.distance_cache:
+            self.distance_cache[key] = self.route_graph.haversine_distance(
+                self.route_graph.get_coordinates(a), self.route_graph.get_coordinates(b))
+        return self.route_graph.heuristic.heuristic_estimate(self.distance_cache[key])
+
+    def calculate_key(self, node: str) -> Tuple[float, float]:
+        best = min(self.g.get(node, INF), self.rhs.get(node, INF))
+        return (best + self.h(self.start, node) + self.km, best)
+
+    def update_vertex(self, node: str) -> None:
+        if node != self.goal:
+            self.rhs[node] = min(
+                (weight + self.g.get(neighbor, INF) for neighbor, weight in self.graph.get(node, {}).items()),
+                default=INF,
+            )
+        self.open_keys.pop(node, None)
+        if self.g.get(node, INF) != self.rhs.get(node, INF):
+            if self.start is None:
+                key = (self.rhs.get(node, INF), self.rhs.get(node, INF))
+            else:
+                key = self.calculate_key(node)
+            self.open_keys[node] = key
+            heapq.heappush(self.open_set, (key, node))
+
+    def top_key(self) -> Tuple[float, float]:
+        while self.open_set:
+            key, node = self.open_set[0]
+            if self.open_keys.get(node) == key:
+                return key
+            heapq.heappop(self.open_set)  # Stale entry
+        return (INF, INF)
+
+    def compute_shortest_path(self) -> None:
+        while (self.top_key() < self.calculate_key(self.start)
+               or self.rhs.get(self.start, INF) != self.g.get(self.start, INF)):
+            if not self.open_set:
+                break
+            k_old, node = heapq.heappop(self.open_set)
+            del self.open_keys[node]
+            self.expansions += 1
+            k_new = self.calculate_key(node)
+            if k_old < k_new:
+                self.open_keys[node] = k_new
+                heapq.heappush(self.open_set, (k_new, node))
+            elif self.g.get(node, INF) > self.rhs.get(node, INF):
+                self.g[node] = self.rhs[node]
+                for pred in self.predecessors.get(node, ()):
+                    self.update_vertex(pred)
+            else:
+                self.g[node] = INF
+                self.update_vertex(node)
+                for pred in self.predecessors.get(node, ()):
+                    self.update_vertex(pred)
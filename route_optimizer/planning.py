@@ -0,0 +1,384 @@
+"""
+CPU-side planning that can run in worker processes.
+
+A SearchTask carries everything a search needs (the CompactGraph arrays,
+node coordinates and the Heuristic); a PlanTask carries the raw inputs of a
+whole plan (interned nodes, routes as index arrays, per-segment features) so
+that scoring, graph construction and search all happen in the worker; a
+PlanDelta carries only what a trip fetched since its previous plan, applied
+to the TripGraph the worker keeps. None does I/O, so they pickle compactly
+and run the same in-process or in a worker process. Fetching stays in the
+calling process.
+"""
+from collections import OrderedDict
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+import itertools
+import multiprocessing
+import os
+import time
+import uuid
+import zlib
+
+import numpy as np
+
+from compact_graph import CompactGraph
+from heuristic import Heuristic
+from spatial_index import haversine_distance
+
+
+# Columns of a segment feature row, as passed to Heuristic.calculate_scores.
+FEATURE_COLUMNS = ("distance", "speed", "duration", "aqi", "elevation_change", "wind_speed", "weather_code")
+
+# Trip graphs with fewer segments than this are planned in the calling process: below
+# it a plan takes about as long as a worker round trip (~1 ms). A trip's first plan has
+# at most alternatives x RouteGraph.SEGMENT_BUDGET (~120) segments; its re-plans add
+# the alternatives' new segments and usually pass this within a few re-plans.
+MIN_POOL_SEGMENTS = 200
+
+
+def preference_weight_sum(preferences: dict = None) -> float:
+    """Sum of the four preference weights (0-1 each); scores are scaled by sum / 4."""
+    traffic_weight = preferences.get('traffic', 50) / 100.0 if preferences else 0.5
+    weather_weight = preferences.get('weather', 50) / 100.0 if preferences else 0.5
+    elevation_weight = preferences.get('elevation', 50) / 100.0 if preferences else 0.5
+    aqi_weight = preferences.get('air_quality', 50) / 100.0 if preferences else 0.5
+    return traffic_weight + weather_weight + elevation_weight + aqi_weight
+
+
+def score_features(heuristic: Heuristic, features: np.ndarray, weight_sum: float) -> np.ndarray:
+    """
+    Scores rows of FEATURE_COLUMNS with the vectorized heuristic.
+    """
+    columns = {name: features[:, i] for i, name in enumerate(FEATURE_COLUMNS)}
+    columns["weather_code"] = columns["weather_code"].astype(int)
+    return heuristic.calculate_scores(**columns) * weight_sum / 4
+
+
+class SearchTask(NamedTuple):
+    graph: CompactGraph
+    coords: List[Tuple[float, float]]  # (lat, lng) of graph.nodes[i]
+    start: str
+    goal: str
+    heuristic: Heuristic
+    method: str = "a_star"  # One of compact_graph.SEARCH_METHODS
+
+
+def run_search(task: SearchTask) -> Tuple[List[str], int]:
+    """
+    The search of task.method with the straight-line heuristic used by RouteGraph.apply_a_star.
+    Returns:
+        (path of node strings, nodes expanded)
+    """
+    graph = task.graph
+    if task.goal not in graph.index or task.start not in graph.index:
+        return graph.search(task.start, task.goal, method=task.method), graph.expansions
+
+    def straight_line_estimate(anchor: str) -> Callable[[str], float]:
+        anchor_coords = task.coords[graph.index[anchor]]
+        estimates: Dict[str, float] = {}
+
+        def estimate(node: str) -> float:
+            if node not in estimates:
+                distance = haversine_distance(task.coords[graph.index[node]], anchor_coords)
+                estimates[node] = task.heuristic.heuristic_estimate(distance)
+            return estimates[node]
+        return estimate
+
+    path = graph.search(task.start, task.goal, straight_line_estimate(task.goal),
+                        straight_line_estimate(task.start), method=task.method)
+    return path, graph.expansions
+
+
+class PlanTask(NamedTuple):
+    nodes: List[str]
+    coords: np.ndarray    # (len(nodes), 2) lat, lng
+    routes: List[np.ndarray]  # Node indices of each route
+    segments: np.ndarray  # (m, 2) node indices of each distinct segment
+    features: np.ndarray  # (m, len(FEATURE_COLUMNS)) matching segments
+    weight_sum: float
+    start: str
+    goal: str
+    heuristic: Heuristic
+    method: str = "a_star"
+
+
+def make_plan_task(routes: List[List[str]], features: Dict[Tuple[str, str], np.ndarray],
+                   coordinates: Callable[[str], Tuple[float, float]], start: str, goal: str,
+                   heuristic: Heuristic, weight_sum: float, method: str = "a_star") -> PlanTask:
+    """
+    Interns the node strings of routes and packs them with their segment features.
+    Args:
+        routes: Routes as lists of node strings.
+        features: Feature row of every segment used by the routes.
+        coordinates: Returns (lat, lng) for a node string.
+    """
+    index: Dict[str, int] = {}
+    for route in routes:
+        for node in route:
+            index.setdefault(node, len(index))
+    for node in (start, goal):
+        index.setdefault(node, len(index))
+    nodes = list(index)
+    segments = list(features)
+    return PlanTask(
+        nodes=nodes,
+        coords=np.array([coordinates(node) for node in nodes], dtype=float).reshape(-1, 2),
+        routes=[np.array([index[node] for node in route], dtype=np.int32) for route in routes],
+        segments=np.array([(index[a], index[b]) for a, b in segments], dtype=np.int32).reshape(-1, 2),
+        features=np.array([features[segment] for segment in segments], dtype=float).reshape(-1, len(FEATURE_COLUMNS)),
+        weight_sum=weight_sum,
+        start=start,
+        goal=goal,
+        heuristic=heuristic,
+        method=method,
+    )
+
+
+def run_plan(task: PlanTask) -> Tuple[List[str], int]:
+    """
+    Scores the segments, merges the routes into one graph (lowest score per
+    edge, as RouteGraph.merge_graphs) and searches it.
+    Returns:
+        (path of node strings, nodes expanded)
+    """
+    scores = score_features(task.heuristic, task.features, task.weight_sum).tolist()
+    weights = {(a, b): score for (a, b), score in zip(task.segments.tolist(), scores)}
+    nodes = task.nodes
+    merged: Dict[str, Dict[str, float]] = {}
+    for route in task.routes:
+        route = route.tolist()
+        for a, b in zip(route, route[1:]):
+            edges = merged.setdefault(nodes[a], {})
+            weight = weights[(a, b)]
+            if nodes[b] not in edges or weight < edges[nodes[b]]:
+                edges[nodes[b]] = weight
+    compact = CompactGraph.from_dict(merged)
+    coords = task.coords.tolist()
+    index = {node: i for i, node in enumerate(nodes)}
+    return run_search(SearchTask(compact, [tuple(coords[index[node]]) for node in compact.nodes],
+                                 task.start, task.goal, task.heuristic, task.method))
+
+
+class PlanDelta(NamedTuple):
+    """Segments fetched by a PooledPlanner since its previous remote plan."""
+    trip_id: str
+    base_version: int  # Version of the worker's TripGraph this applies to; 0 starts a new one
+    version: int
+    coords: Dict[str, Tuple[float, float]]  # Nodes the worker has not been sent yet
+    segments: List[Tuple[str, str]]  # New or re-fetched segments
+    features: np.ndarray  # (len(segments), len(FEATURE_COLUMNS))
+    weight_sum: float
+    heuristic: Heuristic
+
+
+class TripGraph:
+    """
+    Scored graph of one trip, kept by the worker process that plans it so
+    each plan only needs the segments fetched since the previous one.
+    """
+
+    def __init__(self, heuristic: Heuristic, weight_sum: float):
+        self.heuristic = heuristic
+        self.weight_sum = weight_sum
+        self.graph: Dict[str, Dict[str, float]] = {}
+        self.coords: Dict[str, Tuple[float, float]] = {}
+        self.version = 0
+
+    def apply(self, delta: PlanDelta) -> None:
+        self.coords.update(delta.coords)
+        if delta.segments:
+            scores = score_features(self.heuristic, delta.features, self.weight_sum).tolist()
+            for (start, end), score in zip(delta.segments, scores):
+                self.graph.setdefault(start, {})[end] = score
+        self.version = delta.version
+
+    def plan(self, start: str, goal: str, method: str = "a_star") -> Tuple[List[str], int]:
+        compact = CompactGraph.from_dict(self.graph)
+        coords = [self.coords[node] for node in compact.nodes]
+        return run_search(SearchTask(compact, coords, start, goal, self.heuristic, method))
+
+
+# Trip graphs held by this (worker) process, least recently planned first.
+_trip_graphs: "OrderedDict[str, TripGraph]" = OrderedDict()
+MAX_TRIP_GRAPHS = 64  # Per process; an evicted trip is sent in full on its next plan
+
+
+def run_plan_delta(delta: PlanDelta, start: str, goal: str, method: str = "a_star") -> Optional[Tuple[List[str], int]]:
+    """
+    Applies delta to the process's TripGraph for delta.trip_id and searches it.
+    Returns:
+        (path of node strings, nodes expanded), or None if this process does
+        not hold delta.base_version of the trip; the caller then sends it in full.
+    """
+    trip = _trip_graphs.get(delta.trip_id)
+    if delta.base_version == 0:
+        trip = TripGraph(delta.heuristic, delta.weight_sum)
+    elif trip is None or trip.version != delta.base_version:
+        return None
+    trip.apply(delta)
+    _trip_graphs[delta.trip_id] = trip
+    _trip_graphs.move_to_end(delta.trip_id)
+    while len(_trip_graphs) > MAX_TRIP_GRAPHS:
+        _trip_graphs.popitem(last=False)
+    return trip.plan(start, goal, method)
+
+
+class PlanWorkers(Executor):
+    """
+    Worker processes, each behind its own single-process executor, so that
+    submit_pinned sends every task with the same key to the same process
+    (and so to the TripGraph kept there). Plain submit and map spread tasks
+    over all workers, so one PlanWorkers also serves run_searches.
+    """
+
+    def __init__(self, max_workers: int = None):
+        self.executors = [process_pool(1) for _ in range(max_workers or os.cpu_count() or 1)]
+        self._next = itertools.count()
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        return self.executors[next(self._next) % len(self.executors)].submit(fn, *args, **kwargs)
+
+    def submit_pinned(self, key: str, fn, /, *args, **kwargs) -> Future:
+        return self.executors[zlib.crc32(key.encode()) % len(self.executors)].submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        for executor in self.executors:
+            executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+
+class PooledPlanner:
+    """
+    Stand-in for IncrementalPlanner whose large plans run on an executor.
+
+    It keeps every segment feature row seen on the trip (re-fetching rows
+    older than edge_ttl, like IncrementalPlanner) in the calling process.
+    Once the trip graph has min_pool_segments segments (default
+    MIN_POOL_SEGMENTS), plans run in a worker that keeps the scored graph
+    between calls (see TripGraph); with PlanWorkers the trip is pinned to
+    one worker and each plan only ships the segments fetched since the
+    previous one. Smaller plans run in this process. It gives up incremental
+    repair in exchange for keeping the search off this process's GIL.
+    """
+
+    def __init__(self, route_graph, goal: str, preferences: dict = None, edge_ttl: float = 120.0,
+                 executor: Executor = None, min_pool_segments: int = None, method: str = "a_star"):
+        self.route_graph = route_graph
+        self.goal = goal
+        self.weight_sum = preference_weight_sum(preferences)
+        self.edge_ttl = edge_ttl
+        self.executor = executor
+        self.min_pool_segments = MIN_POOL_SEGMENTS if min_pool_segments is None else min_pool_segments
+        self.method = method
+        self.routes: Dict[Tuple[str, ...], None] = {}  # Insertion-ordered set
+        self.features: Dict[Tuple[str, str], np.ndarray] = {}
+        self.scored_at: Dict[Tuple[str, str], float] = {}
+        self.start = None
+        self.scored_segments = 0
+        self.expansions = 0
+        self.trip_id = uuid.uuid4().hex
+        self.sent_version = 0  # Version of the worker's TripGraph, 0 if it has none
+        self.unsent: Dict[Tuple[str, str], None] = {}  # Segments fetched since sent_version
+        self.sent_nodes: Set[str] = set()
+        self.shipped_segments = 0  # Segments sent to workers, for comparing with len(features)
+
+    def update_routes(self, routes: List[List[str]]) -> int:
+        """
+        Adds routes, fetching features only for new or expired segments.
+        Returns:
+            Number of segments that were (re)fetched.
+        """
+        now = time.monotonic()
+        to_fetch = {}
+        for route in routes:
+            self.routes.setdefault(tuple(route), None)
+            for segment in zip(route, route[1:]):
+                scored_at = self.scored_at.get(segment)
+                if scored_at is None or now - scored_at > self.edge_ttl:
+                    to_fetch[segment] = None
+        to_fetch = list(to_fetch)
+        if to_fetch:
+            rows = self.route_graph.segment_features(to_fetch)
+            for segment, row in zip(to_fetch, rows):
+                self.features[segment] = row
+                self.scored_at[segment] = now
+                self.unsent[segment] = None
+            self.scored_segments += len(to_fetch)
+        return len(to_fetch)
+
+    def move_start(self, start: str) -> None:
+        self.start = start
+
+    def plan(self) -> List[str]:
+        if self.executor is None or len(self.features) < self.min_pool_segments:
+            task = make_plan_task(list(self.routes), self.features, self.route_graph.get_coordinates,
+                                  self.start, self.goal, self.route_graph.heuristic, self.weight_sum, self.method)
+            path, expansions = run_plan(task)
+        else:
+            path, expansions = self.plan_remote()
+        self.expansions += expansions
+        return path
+
+    def plan_remote(self) -> Tuple[List[str], int]:
+        # Without pinning a task may land on any worker, so every plan is sent in full.
+        submit_pinned = getattr(self.executor, "submit_pinned", None)
+        full = self.sent_version == 0 or submit_pinned is None
+        result = None
+        if not full:
+            result = submit_pinned(self.trip_id, run_plan_delta, self.delta(False),
+                                   self.start, self.goal, self.method).result()
+        if result is None:  # The worker lost or never had the trip
+            delta = self.delta(True)
+            if submit_pinned is None:
+                future = self.executor.submit(run_plan_delta, delta, self.start, self.goal, self.method)
+            else:
+                future = submit_pinned(self.trip_id, run_plan_delta, delta, self.start, self.goal, self.method)
+            result = future.result()
+        self.sent_version += 1
+        self.unsent.clear()
+        return result
+
+    def delta(self, full: bool) -> PlanDelta:
+        if full:
+            self.sent_nodes.clear()
+        segments = list(self.features if full else self.unsent)
+        coords = {}
+        for node in itertools.chain((self.start, self.goal), *segments):
+            if node not in self.sent_nodes:
+                coords[node] = self.route_graph.get_coordinates(node)
+        self.sent_nodes.update(coords)
+        self.shipped_segments += len(segments)
+        return PlanDelta(
+            trip_id=self.trip_id,
+            base_version=0 if full else self.sent_version,
+            version=self.sent_version + 1,
+            coords=coords,
+            segments=segments,
+            features=np.array([self.features[segment] for segment in segments],
+                              dtype=float).reshape(-1, len(FEATURE_COLUMNS)),
+            weight_sum=self.weight_sum,
+            heuristic=self.route_graph.heuristic,
+        )
+
+
+def run_searches(tasks: Sequence[SearchTask], executor: Executor = None) -> List[Tuple[List[str], int]]:
+    """
+    Runs the tasks on executor (in order), or in this process if it is None
+    or there is only one task.
+    """
+    if executor is None or len(tasks) <= 1:
+        return [run_search(task) for task in tasks]
+    return list(executor.map(run_search, tasks, chunksize=max(1, len(tasks) // (4 * (os.cpu_count() or 1)))))
+
+
+def process_pool(max_workers: int = None) -> ProcessPoolExecutor:
+    """
+    Worker pool for run_search. Workers are spawned rather than forked because
+    the parent runs threads (Flask, the collector loop) that fork would copy mid-flight.
+
+    A spawned worker imports only what unpickling its task needs: this module
+    (whose entry points run_search, run_plan and run_plan_delta live here) and
+    its side-effect-free imports, plus the parent's main script, which must
+    not build server state on import (see app.jobs).
+    """
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
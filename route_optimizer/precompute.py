@@ -0,0 +1,94 @@
+"""
+Precomputes static segment attributes for regular corridors into a SegmentStore.
+
+For every source/destination pair the Directions alternatives are expanded
+into segments exactly as RouteGraph does, and each segment's road distance and
+polyline (read off the alternatives' steps, so one Directions request per
+corridor) and elevation change are written to the store. Point the app at the
+store with SEGMENT_STORE_PATH (or pass segment_store= to RouteGraph).
+
+    python precompute.py --db corridors.sqlite --corridor Dharapuram Udumalpet
+    python precompute.py --db corridors.sqlite --corridor "10.5,77.5" "11.1,77.8" --offline
+"""
+import argparse
+import logging
+import sys
+from typing import List
+
+from api_clients.polyline import encode_polyline
+from graph import RouteGraph
+from segment_store import SegmentStore
+
+logger = logging.getLogger(__name__)
+
+
+def precompute_corridor(route_graph: RouteGraph, store: SegmentStore, source: str, destination: str,
+                        refresh: bool = False) -> int:
+    """
+    Stores the static attributes of every segment on the alternatives between source and destination.
+    Args:
+        route_graph: RouteGraph whose clients are used for the lookups.
+        store: Target store.
+        source: Source place name or "lat,lng".
+        destination: Destination place name or "lat,lng".
+        refresh: Recompute segments that are already stored.
+    Returns:
+        Number of segments written.
+    """
+    source_coords = route_graph.get_coordinates_str(source)
+    dest_coords = route_graph.get_coordinates_str(destination)
+    geometry = {}
+    routes = route_graph.generate_all_routes(source_coords, dest_coords, geometry)
+    segments = list(dict.fromkeys((route[i], route[i + 1]) for route in routes for i in range(len(route) - 1)))
+    if not refresh:
+        known = store.get_many(segments)
+        segments = [segment for segment in segments if segment not in known]
+    if not segments:
+        store.add_corridor(source_coords, dest_coords, 0)
+        return 0
+
+    points = [route_graph.get_coordinates(node) for segment in segments for node in segment]
+    elevations = route_graph.elevation.get_elevations(points)
+    rows = []
+    for i, (start, end) in enumerate(segments):
+        distance, path = geometry[(start, end)]
+        polyline = encode_polyline(path)
+        first, last = elevations[2 * i], elevations[2 * i + 1]
+        elevation_change = abs(last - first) if first is not None and last is not None else None
+        rows.append((start, end, distance, elevation_change, polyline))
+    store.put_many(rows)
+    store.add_corridor(source_coords, dest_coords, len(rows))
+    logger.info(f"{source} -> {destination}: stored {len(rows)} of {len(segments)} segments")
+    return len(rows)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", required=True, help="SQLite file to create or update")
+    parser.add_argument("--corridor", nargs=2, action="append", default=[], metavar=("SOURCE", "DESTINATION"),
+                        help="Source and destination (place name or lat,lng); repeat for more corridors")
+    parser.add_argument("--refresh", action="store_true", help="Recompute segments already in the store")
+    parser.add_argument("--offline", action="store_true", help="Use synthetic provider data (no API calls)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    if not args.corridor:
+        parser.error("at least one --corridor is required")
+
+    clients = {}
+    if args.offline:
+        from api_clients.fakes import FakeTransport, fake_clients
+        clients = fake_clients(FakeTransport())
+    route_graph = RouteGraph(**clients)
+    store = SegmentStore(args.db)
+    try:
+        for source, destination in args.corridor:
+            precompute_corridor(route_graph, store, source, destination, args.refresh)
+        logger.info(f"{args.db}: {len(store)} segments, {len(store.corridors())} corridors")
+    finally:
+        store.close()
+        route_graph.collector.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
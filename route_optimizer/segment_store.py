@@ -0,0 +1,90 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    start_node TEXT NOT NULL,
+    end_node TEXT NOT NULL,
+    distance REAL,
+    elevation_change REAL,
+    polyline TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (start_node, end_node)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS corridors (
+    source TEXT NOT NULL,
+    destination TEXT NOT NULL,
+    segments INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (source, destination)
+);
+"""
+
+# SQLite caps the number of bound parameters per statement.
+QUERY_CHUNK = 400
+
+
+class SegmentStore:
+    """
+    On-disk store of the static attributes of a segment (road distance in km,
+    elevation change in meters, encoded polyline), keyed by its (start, end)
+    node strings. Filled offline by precompute.py for regular corridors and
+    read by RouteGraph before it asks the APIs; traffic, weather and AQI are
+    always fetched live.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def get_many(self, segments: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], dict]:
+        """
+        Returns {segment: {"distance", "elevation_change", "polyline"}} for the
+        stored segments among the given ones; unknown segments are left out.
+        """
+        segments = list(segments)
+        found = {}
+        with self._lock:
+            for i in range(0, len(segments), QUERY_CHUNK):
+                chunk = segments[i:i + QUERY_CHUNK]
+                where = " OR ".join(["(start_node = ? AND end_node = ?)"] * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT start_node, end_node, distance, elevation_change, polyline FROM segments WHERE {where}",
+                    [node for segment in chunk for node in segment]).fetchall()
+                for start, end, distance, elevation_change, polyline in rows:
+                    found[(start, end)] = {"distance": distance, "elevation_change": elevation_change,
+                                           "polyline": polyline}
+        return found
+
+    def put_many(self, rows: List[Tuple[str, str, Optional[float], Optional[float], Optional[str]]]) -> None:
+        """
+        Inserts or replaces (start, end, distance, elevation_change, polyline) rows.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO segments VALUES (?, ?, ?, ?, ?, ?)",
+                [(*row, now) for row in rows])
+
+    def add_corridor(self, source: str, destination: str, segments: int) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO corridors VALUES (?, ?, ?, ?)",
+                               (source, destination, segments, time.time()))
+
+    def corridors(self) -> List[Tuple[str, str, int, float]]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT source, destination, segments, updated_at FROM corridors ORDER BY source, destination"
+            ).fetchall()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,180 @@
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import math
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.195  # Along a meridian, for EARTH_RADIUS_KM
+VERTEX_SLACK = 0.25  # Fraction of the spacing a sample may move ahead to land on a vertex or edge mark
+
+
+def haversine_distance(coord1: Tuple[float, float], coord2: Tuple[float, float]) -> float:
+    """
+    Great-circle distance in kilometers between two (latitude, longitude) points.
+    """
+    lat1_rad, lon1_rad = math.radians(coord1[0]), math.radians(coord1[1])
+    lat2_rad, lon2_rad = math.radians(coord2[0]), math.radians(coord2[1])
+    dlat = lat2_rad - lat1_rad
+    dlon = lon2_rad - lon1_rad
+    a = math.sin(dlat / 2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return EARTH_RADIUS_KM * c
+
+
+def parse_lat_lon(location: str) -> Optional[Tuple[float, float]]:
+    """
+    Returns (lat, lng) for a "lat,lng" string, or None for anything else
+    (including coordinates out of range).
+    """
+    parts = location.split(",")
+    if len(parts) != 2:
+        return None
+    try:
+        lat, lng = float(parts[0]), float(parts[1])
+    except ValueError:
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):  # Also rejects nan
+        return None
+    return lat, lng
+
+
+def segment_distance(point: Tuple[float, float], a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    """
+    Distance in kilometers from point to the straight segment a-b, measured on
+    an equirectangular projection around point (accurate for segments of a
+    few tens of kilometers).
+    """
+    scale = math.cos(math.radians(point[0]))
+
+    def project(coords: Tuple[float, float]) -> Tuple[float, float]:
+        return (coords[1] - point[1]) * scale * KM_PER_DEGREE, (coords[0] - point[0]) * KM_PER_DEGREE
+
+    (ax, ay), (bx, by) = project(a), project(b)
+    dx, dy = bx - ax, by - ay
+    length_sq = dx * dx + dy * dy
+    t = 0.0 if length_sq == 0 else min(1.0, max(0.0, -(ax * dx + ay * dy) / length_sq))
+    return math.hypot(ax + t * dx, ay + t * dy)
+
+
+def path_length(points: Sequence[Tuple[float, float]]) -> float:
+    """Length in kilometers of a path of (latitude, longitude) points."""
+    return sum(haversine_distance(a, b) for a, b in zip(points, points[1:]))
+
+
+def sample_path(points: Sequence[Tuple[float, float]], spacing_km: float,
+                is_known: Callable[[Tuple[float, float]], bool] = None) -> List[Tuple[Tuple[float, float], float]]:
+    """
+    Places sample points along a path roughly every spacing_km kilometers,
+    at positions that do not depend on where the path starts, so paths that
+    share a road (e.g. a route and its reroute) share their samples.
+
+    The sample after one at offset o is a path vertex in the window
+    [o + spacing_km, o + (1 + VERTEX_SLACK) * spacing_km] along the path,
+    preferring one for which is_known returns True (e.g. an existing route
+    node), else the first. Where no vertex falls in the window, the sample
+    is the first point at or after o + spacing_km that lies a multiple of
+    VERTEX_SLACK * spacing_km before the end vertex of its edge. Every gap
+    between consecutive samples is thus at least spacing_km along the path,
+    so a path of length L yields at most floor(L / spacing_km) + 1 samples.
+    Returns:
+        (point, kilometers along the path) of each sample, starting with
+        points[0]; the path end is not included.
+    """
+    if not points:
+        return []
+    offsets = [0.0]
+    for a, b in zip(points, points[1:]):
+        offsets.append(offsets[-1] + haversine_distance(a, b))
+    step = spacing_km * VERTEX_SLACK
+    samples = [(points[0], 0.0)]
+    i = 0  # Index of the last vertex before the next sample
+    while True:
+        target = samples[-1][1] + spacing_km
+        while i + 1 < len(points) and offsets[i + 1] < target:
+            i += 1
+        if i + 1 >= len(points) or offsets[-1] <= target:
+            return samples
+        window = []
+        for j in range(i + 1, len(points) - 1):
+            if offsets[j] > target + step:
+                break
+            window.append(j)
+        if window:
+            j = next((j for j in window if is_known and is_known(points[j])), window[0])
+            samples.append((points[j], offsets[j]))
+            continue
+        # Marks are measured back from the edge's end vertex, which a path
+        # starting partway along the edge (e.g. at an earlier mark) shares.
+        a, b = points[i], points[i + 1]
+        length = offsets[i + 1] - offsets[i]
+        before_end = math.floor((offsets[i + 1] - target) / step + 1e-9) * step
+        if before_end <= 0:  # Only on the last edge, at the path end
+            return samples
+        t = 1 - before_end / length
+        samples.append(((a[0] + (b[0] - a[0]) * t, a[1] + (b[1] - a[1]) * t), offsets[i + 1] - before_end))
+
+
+class NodeIndex:
+    """
+    Grid hash of route nodes used to snap near-identical points to one
+    canonical node string.
+
+    Cells are tolerance_km tall; a lookup checks the neighbouring cells wide
+    enough to cover the tolerance at that latitude and compares candidates
+    with the given distance function (the RouteGraph haversine). With
+    max_size, the oldest nodes are dropped beyond that many; a point near a
+    dropped node then becomes a new node.
+    """
+
+    def __init__(self, tolerance_km: float, distance: Callable[[Tuple[float, float], Tuple[float, float]], float],
+                 max_size: int = None):
+        self.tolerance_km = tolerance_km
+        self.distance = distance
+        self.max_size = max_size
+        self.cell_size = max(tolerance_km, 1e-6) / KM_PER_DEGREE
+        self.cells: Dict[Tuple[int, int], List[Tuple[str, Tuple[float, float]]]] = {}
+        self.order: "OrderedDict[Tuple[str, Tuple[float, float]], Tuple[int, int]]" = OrderedDict()
+
+    def _cell(self, coords: Tuple[float, float]) -> Tuple[int, int]:
+        return math.floor(coords[0] / self.cell_size), math.floor(coords[1] / self.cell_size)
+
+    def add(self, node: str, coords: Tuple[float, float]) -> None:
+        cell = self._cell(coords)
+        self.cells.setdefault(cell, []).append((node, coords))
+        if self.max_size is None:
+            return
+        self.order[(node, coords)] = cell
+        while len(self.order) > self.max_size:
+            entry, oldest = self.order.popitem(last=False)
+            self.cells[oldest].remove(entry)
+            if not self.cells[oldest]:
+                del self.cells[oldest]
+
+    def nearest(self, coords: Tuple[float, float]) -> Optional[Tuple[str, Tuple[float, float]]]:
+        """
+        Returns the closest indexed (node, coords) within tolerance_km, or None.
+        """
+        row, col = self._cell(coords)
+        # A degree of longitude shrinks with latitude, so look further sideways.
+        span = math.ceil(1 / max(math.cos(math.radians(coords[0])), 1e-3))
+        best, best_distance = None, self.tolerance_km
+        for r in (row - 1, row, row + 1):
+            for c in range(col - span, col + span + 1):
+                for node, node_coords in self.cells.get((r, c), ()):
+                    d = self.distance(coords, node_coords)
+                    if d <= best_distance:
+                        best, best_distance = (node, node_coords), d
+        return best
+
+    def snap(self, node: str, coords: Tuple[float, float]) -> Tuple[str, Tuple[float, float]]:
+        """
+        Returns the canonical (node, coords) for a point: an indexed node within
+        tolerance_km, or the point itself, which is then indexed.
+        """
+        match = self.nearest(coords)
+        if match is not None:
+            return match
+        self.add(node, coords)
+        return node, coords
+
+    def __len__(self) -> int:
+        return sum(len(nodes) for nodes in self.cells.values())
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The app imports its modules as top-level names (e.g. "from graph import RouteGraph").
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
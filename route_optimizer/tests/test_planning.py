@@ -0,0 +1,39 @@
+"""
+Planning workers: spawned processes that run planning.py's entry points
+without importing the app, its job state or its network clients.
+"""
+import sys
+
+import numpy as np
+
+from heuristic import Heuristic
+from planning import FEATURE_COLUMNS, PlanDelta, PlanWorkers, run_plan_delta
+
+APP_MODULES = ("app", "graph", "collector", "segment_store", "flask", "aiohttp", "requests")
+
+
+def loaded_app_modules():
+    return [name for name in APP_MODULES if name in sys.modules]
+
+
+def delta(trip_id, base_version, version, segments, coords):
+    # distance, speed, duration, aqi, elevation_change, wind_speed, weather_code
+    features = np.array([[1.0, 50.0, 0.02, 50.0, 0.0, 0.0, 0]] * len(segments)).reshape(-1, len(FEATURE_COLUMNS))
+    return PlanDelta(trip_id, base_version, version, coords, segments, features, 1.0, Heuristic())
+
+
+def test_workers_plan_without_importing_the_app():
+    coords = {"A": (10.0, 77.0), "B": (10.01, 77.0), "C": (10.02, 77.0), "D": (10.01, 77.01)}
+    workers = PlanWorkers(1)
+    try:
+        first = delta("trip", 0, 1, [("A", "B"), ("B", "C")], coords)
+        path, _ = workers.submit_pinned("trip", run_plan_delta, first, "A", "C").result()
+        assert path == ["A", "B", "C"]
+        # Only the new segment is sent; the worker still holds the rest of the trip.
+        second = delta("trip", 1, 2, [("A", "D"), ("D", "C")], {})
+        path, _ = workers.submit_pinned("trip", run_plan_delta, second, "A", "C").result()
+        assert path[0] == "A" and path[-1] == "C"
+        assert workers.submit_pinned("trip", run_plan_delta, delta("trip", 5, 6, [], {}), "A", "C").result() is None
+        assert workers.submit_pinned("trip", loaded_app_modules).result() == []
+    finally:
+        workers.shutdown()
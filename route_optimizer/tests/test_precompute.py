@@ -0,0 +1,62 @@
+"""
+precompute.py with offline providers: one Directions request per corridor,
+and stored distances that agree with the live traffic of the same segments.
+"""
+import numpy as np
+import pytest
+
+from api_clients.cache import TTLCache
+from api_clients.fakes import FakeTransport, SyntheticWorld, fake_clients
+from api_clients.polyline import decode_polyline
+from graph import RouteGraph
+from planning import FEATURE_COLUMNS
+from precompute import precompute_corridor
+from segment_store import SegmentStore
+
+SOURCE, DESTINATION = "10.5,77.5", "10.9,77.7"
+
+
+@pytest.fixture
+def world():
+    transport = FakeTransport(SyntheticWorld(alternatives=3, steps=8, seed=1))
+    route_graph = RouteGraph(**fake_clients(transport, TTLCache()))
+    store = SegmentStore(":memory:")
+    yield transport, route_graph, store
+    store.close()
+    route_graph.collector.close()
+
+
+def test_one_directions_request_per_corridor(world):
+    transport, route_graph, store = world
+    written = precompute_corridor(route_graph, store, SOURCE, DESTINATION)
+    assert written == len(store) > 0
+    assert transport.calls["directions"] == 1
+
+
+def test_stored_segments_match_step_traffic(world):
+    transport, route_graph, store = world
+    routes = route_graph.generate_all_routes(SOURCE, DESTINATION)
+    segments = list(dict.fromkeys(segment for route in routes for segment in zip(route, route[1:])))
+    precompute_corridor(route_graph, store, SOURCE, DESTINATION)
+    stored = store.get_many(segments)
+    assert set(stored) == set(segments)
+    for (start, end), row in stored.items():
+        traffic = route_graph.gmaps.get_traffic_data(start, end)  # Cached from the same steps
+        assert row["distance"] == pytest.approx(traffic["distance"])
+        path = decode_polyline(row["polyline"])
+        assert path[0] == pytest.approx(route_graph.get_coordinates(start), abs=1e-5)
+        assert path[-1] == pytest.approx(route_graph.get_coordinates(end), abs=1e-5)
+    assert transport.calls["directions"] == 2
+
+
+def test_stored_distance_keeps_live_speed(world):
+    _, route_graph, store = world
+    routes = route_graph.generate_all_routes(SOURCE, DESTINATION)
+    segment = (routes[0][0], routes[0][1])
+    store.put_many([(*segment, 5.0, None, None)])
+    route_graph.segment_store = store
+    distance, speed, duration = (route_graph.segment_features([segment])[0][FEATURE_COLUMNS.index(name)]
+                                 for name in ("distance", "speed", "duration"))
+    assert distance == 5.0
+    assert speed == route_graph.gmaps.get_traffic_data(*segment)["speed"] > 0
+    assert np.isclose(distance / duration, speed)
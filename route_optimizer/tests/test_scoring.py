@@ -0,0 +1,121 @@
+"""
+Equivalence of the vectorized scoring path (Heuristic.calculate_scores,
+Penalties.calculate_arrays) with the scalar one (Heuristic.calculate_score,
+Penalties.calculate) it replaced.
+"""
+import numpy as np
+import pytest
+
+from heuristic import Heuristic
+from models.penalties import WEATHER_PENALTIES, Penalties
+
+CONDITIONS = list(WEATHER_PENALTIES) + ["Thunderstorm", "Blowing sand"]  # Last two are unknown
+
+
+def scalar_scores(heuristic, distance, speed, duration, aqi, elevation_change, weather):
+    scores = []
+    for i in range(len(distance)):
+        traffic = {"distance": distance[i], "speed": speed[i], "duration": duration[i]}
+        penalties = Penalties()
+        penalties.calculate(traffic, weather[i], {"elevation_change": elevation_change[i]})
+        scores.append(heuristic.calculate_score(distance[i], speed[i], aqi[i], penalties))
+    return np.array(scores)
+
+
+def vector_scores(heuristic, distance, speed, duration, aqi, elevation_change, weather):
+    return heuristic.calculate_scores(
+        distance=np.array(distance, dtype=float),
+        speed=np.array(speed, dtype=float),
+        duration=np.array(duration, dtype=float),
+        aqi=np.array(aqi, dtype=float),
+        elevation_change=np.array(elevation_change, dtype=float),
+        wind_speed=np.array([w.get("wind", {}).get("speed", 0) for w in weather], dtype=float),
+        weather_code=np.array([Penalties.weather_code(w) for w in weather], dtype=int),
+    )
+
+
+def random_weather(rng, n):
+    weather = []
+    for _ in range(n):
+        kind = rng.integers(3)
+        if kind == 0:
+            weather.append({})  # Failed lookup
+        elif kind == 1:
+            weather.append({"wind": {"speed": float(rng.uniform(0, 30))}})  # No condition
+        else:
+            weather.append({"weather": [{"main": CONDITIONS[rng.integers(len(CONDITIONS))]}],
+                            "wind": {"speed": float(rng.uniform(0, 30))}})
+    return weather
+
+
+def assert_identical(heuristic, *columns):
+    expected = scalar_scores(heuristic, *columns)
+    actual = vector_scores(heuristic, *columns)
+    np.testing.assert_array_equal(actual, expected)
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("weights, vehicle_type", [
+    (None, "petrol"),
+    ({"traffic": 90, "weather": 10, "elevation": 40, "air_quality": 5}, "truck"),
+    ({"traffic": 1, "weather": 100, "elevation": 100, "air_quality": 100}, "electric"),
+])
+def test_random_segments(seed, weights, vehicle_type):
+    rng = np.random.default_rng(seed)
+    n = 500
+    distance = rng.uniform(0, 50, n)
+    assert_identical(
+        Heuristic(weights, vehicle_type=vehicle_type),
+        distance,
+        rng.uniform(1, 120, n),
+        distance / rng.uniform(5, 150, n),
+        rng.uniform(0, 500, n),
+        rng.normal(0, 200, n),
+        random_weather(rng, n),
+    )
+
+
+def test_zero_distance_and_speed():
+    distance = [0.0, 0.0, 3.0, 3.0, 0.0]
+    speed = [0.0, 40.0, 0.0, 40.0, 0.0]
+    duration = [0.0, 0.0, 0.1, 0.0, 0.5]
+    weather = [{"weather": [{"main": "Rain"}], "wind": {"speed": 4.0}}] * 5
+    assert_identical(Heuristic(), distance, speed, duration, [50.0] * 5, [0.0, 12.0, -8.0, 0.0, 3.0], weather)
+    scores = vector_scores(Heuristic(), distance, speed, duration, [50.0] * 5, [0.0] * 5, weather)
+    assert np.isinf(scores[[0, 2, 4]]).all()
+
+
+def test_unknown_and_missing_weather():
+    weather = [{}, {"wind": {}}, {"weather": [{}]}, {"weather": [{"main": "Thunderstorm"}]},
+               {"weather": [{"main": "Heavy rain"}], "wind": {"speed": 12.5}}]
+    n = len(weather)
+    assert_identical(Heuristic(), [2.0] * n, [30.0] * n, [0.1] * n, [80.0] * n, [5.0] * n, weather)
+    codes = [Penalties.weather_code(w) for w in weather]
+    penalties = Penalties.calculate_arrays(np.full(n, 2.0), np.full(n, 0.1), np.array(codes),
+                                           np.zeros(n), np.zeros(n))
+    np.testing.assert_array_equal(penalties[:, 1], [0.0, 0.0, 0.0, 0.0, WEATHER_PENALTIES["Heavy rain"]])
+
+
+def test_extreme_aqi_and_elevation():
+    aqi = [0.0, 500.0, 1e6, 0.0, 999.0]
+    elevation_change = [-1e5, 1e5, 0.0, 8848.0, -0.001]
+    distance = [0.01, 0.01, 1e4, 1.0, 1e-9]
+    n = len(aqi)
+    assert_identical(Heuristic(), distance, [60.0] * n, [1.0] * n, aqi, elevation_change, [{}] * n)
+
+
+def test_penalty_columns_match_to_list():
+    rng = np.random.default_rng(7)
+    n = 200
+    distance = np.where(rng.random(n) < 0.1, 0.0, rng.uniform(0, 20, n))
+    duration = rng.uniform(0, 1, n)
+    elevation_change = rng.normal(0, 100, n)
+    weather = random_weather(rng, n)
+    wind = np.array([w.get("wind", {}).get("speed", 0) for w in weather], dtype=float)
+    codes = np.array([Penalties.weather_code(w) for w in weather])
+    arrays = Penalties.calculate_arrays(distance, duration, codes, elevation_change, wind)
+    for i in range(n):
+        penalties = Penalties()
+        penalties.calculate({"distance": distance[i], "duration": duration[i]}, weather[i],
+                            {"elevation_change": elevation_change[i]})
+        assert arrays[i].tolist() == penalties.to_list()
@@ -0,0 +1,132 @@
+"""
+Searches over CompactGraph: a_star expands nodes like the dict-based search
+it replaced, even under an inconsistent heuristic, and the preference-weighted
+estimate stays a lower bound, so A* over re-weighted edges finds the cheapest route.
+"""
+import heapq
+
+import numpy as np
+import pytest
+
+from compact_graph import CompactGraph
+from heuristic import Heuristic
+from models.penalties import WEATHER_CODES
+
+PREFERENCES = [
+    None,
+    {"traffic": 100, "weather": 0, "elevation": 0, "air_quality": 0},
+    {"traffic": 0, "weather": 0, "elevation": 100, "air_quality": 0},
+    {"traffic": 80, "weather": 20, "elevation": 60, "air_quality": 10},
+]
+
+
+def feature_graph(heuristic, segments, distance, speed):
+    """CompactGraph over segments with clear weather, zero AQI and flat terrain."""
+    distance, speed = np.array(distance, dtype=float), np.array(speed, dtype=float)
+    n = len(segments)
+    components = heuristic.calculate_components(
+        distance=distance, speed=speed, duration=distance / speed, aqi=np.zeros(n),
+        elevation_change=np.zeros(n), wind_speed=np.zeros(n),
+        weather_code=np.full(n, WEATHER_CODES["Clear"]))
+    compact = CompactGraph.from_segments(segments, components)
+    compact.max_speed = float(speed.max())
+    return compact
+
+
+def path_cost(graph, path):
+    weights = graph.to_dict()
+    return sum(weights[start][end] for start, end in zip(path, path[1:]))
+
+
+@pytest.mark.parametrize("vehicle_type", ["petrol", "truck", "electric"])
+@pytest.mark.parametrize("preferences", PREFERENCES)
+def test_preference_estimate_is_a_lower_bound(vehicle_type, preferences):
+    heuristic = Heuristic(vehicle_type=vehicle_type)
+    rng = np.random.default_rng(0)
+    distance = rng.uniform(0.1, 50, 1000)
+    speed = rng.uniform(5, 160, 1000)
+    compact = feature_graph(heuristic, [(f"a{i}", f"b{i}") for i in range(1000)], distance, speed)
+    weights = heuristic.edge_weights(compact.components, preferences)
+    # from_segments keeps segment order when every segment starts at a new node.
+    estimates = [heuristic.preference_estimate(d, preferences, compact.max_speed) for d in distance]
+    assert np.all(weights >= np.array(estimates))
+
+
+def test_preference_estimate_scales_objectives_like_edge_weights():
+    heuristic = Heuristic(vehicle_type="diesel")
+    compact = feature_graph(heuristic, [("a", "b")], [10.0], [120.0])
+    for preferences in PREFERENCES:
+        weight = heuristic.edge_weights(compact.components, preferences)[0]
+        # A straight edge at max_speed with no penalties costs exactly the estimate.
+        assert heuristic.preference_estimate(10.0, preferences, 120.0) == pytest.approx(weight)
+
+
+@pytest.mark.parametrize("preferences", PREFERENCES)
+def test_reweighted_a_star_finds_cheapest_route_with_fast_edges(preferences):
+    # S -> A -> G runs over a 150 km/h highway that a 100 km/h best case would overestimate.
+    heuristic = Heuristic()
+    segments = [("S", "A"), ("A", "G"), ("S", "B"), ("B", "G")]
+    compact = feature_graph(heuristic, segments, [10, 90, 50, 45], [50, 150, 100, 100])
+    straight_line = {"S": 90.0, "A": 90.0, "B": 45.0, "G": 0.0}  # km to G, never above the road distance
+    weighted = compact.with_weights(heuristic.edge_weights(compact.components, preferences))
+    path = weighted.a_star(
+        "S", "G", lambda node: heuristic.preference_estimate(straight_line[node], preferences, compact.max_speed))
+    cheapest = min((["S", "A", "G"], ["S", "B", "G"]), key=lambda route: path_cost(weighted, route))
+    assert path_cost(weighted, path) == pytest.approx(path_cost(weighted, cheapest))
+
+
+def dict_a_star(graph, start, goal, estimate):
+    """RouteGraph.apply_a_star as it was before CompactGraph, with estimate taking a node."""
+    open_set = [(0, start, [start])]
+    closed_set = set()
+    g_score = {start: 0}
+    while open_set:
+        _, current, path = heapq.heappop(open_set)
+        if current == goal:
+            return path
+        if current in closed_set:
+            continue
+        closed_set.add(current)
+        for neighbor, weight in graph.get(current, {}).items():
+            tentative_g_score = g_score[current] + weight
+            if neighbor in closed_set and tentative_g_score >= g_score.get(neighbor, float("inf")):
+                continue
+            if tentative_g_score < g_score.get(neighbor, float("inf")):
+                g_score[neighbor] = tentative_g_score
+                heapq.heappush(open_set, (tentative_g_score + estimate(neighbor), neighbor, path + [neighbor]))
+    return []
+
+
+def random_graph(rng, n=40, degree=4):
+    graph = {}
+    for u in range(n):
+        for v in rng.choice(n, degree, replace=False).tolist():
+            if v != u:
+                graph.setdefault(f"n{u}", {})[f"n{v}"] = float(rng.uniform(0.1, 10))
+    return graph
+
+
+def test_a_star_matches_dict_search_with_inconsistent_heuristic():
+    rng = np.random.default_rng(1)
+    suboptimal = 0
+    for _ in range(200):
+        graph = random_graph(rng)
+        compact = CompactGraph.from_dict(graph)
+        # Random estimates up to several edge weights overestimate on many edges.
+        estimates = {node: float(rng.uniform(0, 30)) for node in compact.nodes}
+        estimates["n1"] = 0.0
+        expected = dict_a_star(graph, "n0", "n1", estimates.get)
+        assert compact.a_star("n0", "n1", estimates.get) == expected
+        if expected and path_cost(compact, expected) > path_cost(compact, compact.a_star("n0", "n1")) + 1e-9:
+            suboptimal += 1
+    assert suboptimal > 0  # The heuristic really was inconsistent for some graphs
+
+
+def test_bidirectional_finds_cheapest_route_with_consistent_estimates():
+    rng = np.random.default_rng(2)
+    for _ in range(200):
+        compact = CompactGraph.from_dict(random_graph(rng))
+        forward, both = compact.a_star("n0", "n1"), compact.bidirectional("n0", "n1")
+        assert bool(forward) == bool(both)
+        if forward:
+            assert path_cost(compact, both) == pytest.approx(path_cost(compact, forward))
@@ -0,0 +1,134 @@
+from typing import Dict, List, Optional, Tuple
+import logging
+import time
+
+from metrics import registry
+from spatial_index import parse_lat_lon, segment_distance
+
+logger = logging.getLogger(__name__)
+
+REROUTE_TRIGGERS = registry.counter("reroute_triggers_total", "Re-plans started per trigger", ["reason"])
+SKIPPED_REPLANS = registry.counter("reroute_skipped_total", "Nodes passed without a re-plan")
+
+
+class RerouteTriggers:
+    """
+    Decides, node by node, whether a trip needs to be re-planned instead of
+    re-fetching alternatives and re-scoring at every node.
+
+    A re-plan is triggered when
+      - "deviation": the reported position is off the remaining route, i.e.
+        farther than deviation_km plus road_slack of a segment's length from
+        every remaining segment,
+      - "traffic": the live travel time of the remaining trip differs from
+        what the pace at the last re-plan predicts by more than traffic_threshold,
+      - "expired": a remaining segment was scored longer ago than data_ttl,
+        i.e. the weather or AQI it was scored with has expired from the cache.
+    Traffic and expiry re-plans are rate limited to one per min_replan_interval;
+    deviations always re-plan because the current route no longer applies.
+    """
+
+    def __init__(self, route_graph, destination: str, traffic_threshold: float = 0.2,
+                 data_ttl: float = None, deviation_km: float = 0.3, road_slack: float = 0.25,
+                 min_replan_interval: float = 30.0, traffic_check_interval: float = 60.0):
+        """
+        Args:
+            route_graph: RouteGraph whose gmaps client and coordinates are used.
+            destination: Destination node string ("lat,lng").
+            traffic_threshold: Relative change of the remaining travel time that triggers a re-plan.
+            data_ttl: Seconds a segment score stays valid; defaults to the shorter of the
+                weather and AQI cache TTLs.
+            deviation_km: Distance from a remaining segment that counts as a deviation,
+                covering GPS error and the road's width.
+            road_slack: Extra tolerance as a fraction of each segment's length. Segments
+                are straight chords between nodes sampled along the road (RouteGraph
+                SAMPLE_SPACING_KM or more apart) and the road bends away from them.
+            min_replan_interval: Minimum seconds between traffic/expiry re-plans.
+            traffic_check_interval: Minimum seconds between live traffic lookups.
+        """
+        self.route_graph = route_graph
+        self.destination = destination
+        self.traffic_threshold = traffic_threshold
+        if data_ttl is None:
+            ttls = route_graph.weather.cache.ttls
+            data_ttl = min(ttl for ttl in (ttls.get("weather"), ttls.get("aqi"), float("inf")) if ttl is not None)
+        self.data_ttl = data_ttl
+        self.deviation_km = deviation_km
+        self.road_slack = road_slack
+        self.min_replan_interval = min_replan_interval
+        self.traffic_check_interval = traffic_check_interval
+        self.last_replan = float("-inf")
+        self.last_traffic_check = float("-inf")
+        self.baseline_speed = None  # km/h of the remaining trip at the last re-plan
+
+    def planned(self, node: str) -> None:
+        """Records a re-plan from node and resets the traffic baseline."""
+        self.last_replan = time.monotonic()
+        self.last_traffic_check = self.last_replan
+        traffic = self.route_graph.gmaps.get_traffic_data(node, self.destination)
+        self.baseline_speed = traffic["speed"] or None
+
+    def check(self, node: str, remaining: List[str], scored_at: Dict[Tuple[str, str], float],
+              position: str = None, previous: str = None) -> Optional[str]:
+        """
+        Args:
+            node: Node the driver is at.
+            remaining: Planned nodes from node to the destination.
+            scored_at: Monotonic time each segment was last scored.
+            position: Last reported "lat,lng" position, if any; anything else is ignored.
+            previous: Node before node on the route; the segment between them
+                also counts as on the route for the deviation check.
+        Returns:
+            The trigger reason, or None if the current route still holds.
+        """
+        reason = None
+        route = [previous] + remaining if previous else remaining
+        if position and self.is_deviation(position, route):
+            reason = "deviation"
+        elif time.monotonic() - self.last_replan >= self.min_replan_interval:
+            if self.is_expired(remaining, scored_at):
+                reason = "expired"
+            elif self.is_traffic_changed(node):
+                reason = "traffic"
+        if reason:
+            REROUTE_TRIGGERS.inc(reason=reason)
+            logger.info(f"Re-planning at {node}: {reason}")
+        else:
+            SKIPPED_REPLANS.inc()
+        return reason
+
+    def is_deviation(self, position: str, route: List[str]) -> bool:
+        """
+        Whether position is off every segment of route. Positions that are not
+        "lat,lng" strings are never a deviation (and never geocoded).
+        """
+        coords = parse_lat_lon(position)
+        if coords is None:
+            logger.warning(f"Ignoring reported position {position!r}: not \"lat,lng\"")
+            return False
+        points = [self.route_graph.get_coordinates(node) for node in route]
+        if len(points) == 1:
+            points.append(points[0])
+        for a, b in zip(points, points[1:]):
+            tolerance = self.deviation_km + self.road_slack * self.route_graph.haversine_distance(a, b)
+            if segment_distance(coords, a, b) <= tolerance:
+                return False
+        return bool(points)
+
+    def is_expired(self, remaining: List[str], scored_at: Dict[Tuple[str, str], float]) -> bool:
+        now = time.monotonic()
+        return any(now - scored_at.get(segment, now) > self.data_ttl for segment in zip(remaining, remaining[1:]))
+
+    def is_traffic_changed(self, node: str) -> bool:
+        now = time.monotonic()
+        if self.baseline_speed is None or node == self.destination or \
+                now - self.last_traffic_check < self.traffic_check_interval:
+            return False
+        self.last_traffic_check = now
+        traffic = self.route_graph.gmaps.get_traffic_data(node, self.destination)
+        if not traffic["duration"]:
+            return False
+        expected = traffic["distance"] / self.baseline_speed
+        delta = abs(traffic["duration"] - expected) / expected if expected else 0.0
+        logger.debug(f"Remaining trip from {node}: {traffic['duration']:.3f} h live, {expected:.3f} h expected")
+        return delta > self.traffic_threshold